@@ -11,6 +11,7 @@ from rest_framework.exceptions import NotFound
 from project.serializers import AgentSerializer
 from .src.document_processor import DocumentProcessor
 from .src.api_services import extract_text_from_file, scrape_website_content
+from .src.answer_cache import answer_cache
 
 
 class AgentAPI(APIView):
@@ -61,7 +62,7 @@ class AgentAPI(APIView):
                     
                     # Use process_pdf for PDFs, extract_text_from_file + process_text for others
                     if ext == '.pdf':
-                        result = processor.process_pdf(full_path)
+                        result = processor.process_pdf(full_path, source=file.name)
                     else:
                         extracted_text = extract_text_from_file(full_path)
                         if not extracted_text.strip():
@@ -291,6 +292,9 @@ class AgentDetailAPI(APIView):
             except Exception as e:
                 print(f"Error deleting vectors for agent {agent.id}: {e}")
             
+            # Drop cached answers for this agent in this process
+            answer_cache.invalidate(str(agent.id))
+
             # Delete the agent (cascade will delete related IngestedContent)
             agent.delete()
             
@@ -6,12 +6,17 @@ import os
 # Since api.py is in the root (chatbot/), this adds 'chatbot/' to the python path.
 sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
 
+import json
+
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from typing import List, Dict, Optional
 # Now Python can find 'src' because the root folder is in sys.path
 from src.llm_engine_api import LLMEngineAPI
+from src.db_pool import pool_stats
+from src.failover import breaker_states, failover_stats
 
 app = FastAPI(title="Hybrid Restaurant Bot (Multi-Client)")
 
@@ -39,6 +44,7 @@ class ChatRequest(BaseModel):
     text: str
     client_id: str
     history: List[Dict[str, str]] = [] # Optional history
+    stream: bool = False # Stream tokens as server-sent events
 
 class ChatResponse(BaseModel):
     response: str
@@ -52,9 +58,16 @@ async def chat(req: ChatRequest):
     if not req.client_id:
         raise HTTPException(status_code=400, detail="client_id is required")
 
+    if req.stream:
+        return StreamingResponse(
+            _stream_chat(req),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+
     try:
         # Route to the engine with client_id and history
-        answer = engine.generate_response(
+        answer = await engine.agenerate_response(
             user_query=req.text,
             client_id=req.client_id,
             chat_history=req.history
@@ -68,6 +81,31 @@ async def chat(req: ChatRequest):
         print(f"Error processing request: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+async def _stream_chat(req: ChatRequest):
+    """Server-sent events: one `token` event per delta, then a final `done` event with the full answer."""
+    parts = []
+    try:
+        async for token in engine.agenerate_response_stream(
+            user_query=req.text,
+            client_id=req.client_id,
+            chat_history=req.history
+        ):
+            parts.append(token)
+            yield f"event: token\ndata: {json.dumps({'token': token})}\n\n"
+    except Exception as e:
+        print(f"Error streaming request: {e}")
+        yield f"event: error\ndata: {json.dumps({'detail': str(e)})}\n\n"
+        return
+
+    yield f"event: done\ndata: {json.dumps({'response': ''.join(parts), 'similarity_score': 0.0})}\n\n"
+
 @app.get("/")
 def health():
-    return {"status": "ok", "mode": "multi-client", "root_dir": os.path.abspath(os.path.dirname(__file__))}
\ No newline at end of file
+    return {
+        "status": "ok",
+        "mode": "multi-client",
+        "root_dir": os.path.abspath(os.path.dirname(__file__)),
+        "vector_db_pool": pool_stats(),
+        "llm_breakers": breaker_states(),
+        "llm_failover": dict(failover_stats),
+    }
\ No newline at end of file
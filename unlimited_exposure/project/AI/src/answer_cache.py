@@ -0,0 +1,132 @@
+import hashlib
+import itertools
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from typing import List, Optional
+
+import numpy as np
+from django.conf import settings
+
+
+def hash_prompt(system_prompt: Optional[str], history: str = "") -> str:
+    """
+    Key part for everything besides the question that shapes an answer: the system
+    prompt and the rendered conversation history, so a follow-up question is only
+    answered from the cache within the same conversation state.
+    """
+    return hashlib.sha256(f"{system_prompt or ''}\x00{history}".encode("utf-8")).hexdigest()
+
+
+class _Entry:
+    __slots__ = ("scope", "prompt_hash", "kb_version", "vector", "answer", "created_at")
+
+    def __init__(self, scope, prompt_hash, kb_version, vector, answer, created_at):
+        self.scope = scope
+        self.prompt_hash = prompt_hash
+        self.kb_version = kb_version
+        self.vector = vector
+        self.answer = answer
+        self.created_at = created_at
+
+
+class SemanticAnswerCache:
+    """
+    In-process cache of RAG answers matched by query similarity.
+
+    An entry is reused only for the same scope (agent), the same system-prompt
+    hash and the same knowledge-base version, and only when the new query's
+    embedding has cosine similarity >= `threshold` with the cached query.
+    Entries expire after `ttl` seconds; above `max_entries` the least recently
+    used entry is evicted. Hits and misses are counted per scope.
+    """
+
+    def __init__(self, threshold: float = 0.95, ttl: float = 900, max_entries: int = 5000):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._ids = itertools.count()
+        self._lru = OrderedDict()             # entry_id -> _Entry, oldest first
+        self._by_scope = defaultdict(dict)    # scope -> {entry_id: _Entry}
+        self._stats = defaultdict(lambda: {"hits": 0, "misses": 0})
+
+    @staticmethod
+    def _unit(vector: List[float]) -> np.ndarray:
+        v = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(v)
+        return v / norm if norm else v
+
+    def _remove(self, entry_id):
+        entry = self._lru.pop(entry_id, None)
+        if entry is not None:
+            scoped = self._by_scope.get(entry.scope)
+            if scoped is not None:
+                scoped.pop(entry_id, None)
+                if not scoped:
+                    del self._by_scope[entry.scope]
+
+    def lookup(self, scope: str, prompt_hash: str, kb_version, query_vector: List[float]) -> Optional[str]:
+        """Returns a cached answer for a near-identical query, or None."""
+        query = self._unit(query_vector)
+        now = time.time()
+        with self._lock:
+            best_id, best_score = None, self.threshold
+            for entry_id, entry in list(self._by_scope.get(scope, {}).items()):
+                if now - entry.created_at > self.ttl:
+                    self._remove(entry_id)
+                    continue
+                if entry.prompt_hash != prompt_hash or entry.kb_version != kb_version:
+                    continue
+                score = float(np.dot(query, entry.vector))
+                if score >= best_score:
+                    best_id, best_score = entry_id, score
+
+            stats = self._stats[scope]
+            if best_id is None:
+                stats["misses"] += 1
+                return None
+            stats["hits"] += 1
+            self._lru.move_to_end(best_id)
+            return self._lru[best_id].answer
+
+    def store(self, scope: str, prompt_hash: str, kb_version, query_vector: List[float], answer: str):
+        entry = _Entry(scope, prompt_hash, kb_version, self._unit(query_vector), answer, time.time())
+        with self._lock:
+            entry_id = next(self._ids)
+            self._lru[entry_id] = entry
+            self._by_scope[scope][entry_id] = entry
+            while len(self._lru) > self.max_entries:
+                self._remove(next(iter(self._lru)))
+
+    def invalidate(self, scope: str):
+        """Drops every entry of a scope (called when its knowledge base changes)."""
+        with self._lock:
+            for entry_id in list(self._by_scope.get(scope, {})):
+                self._remove(entry_id)
+
+    def hit_rate(self, scope: str) -> float:
+        stats = self._stats.get(scope)
+        if not stats:
+            return 0.0
+        total = stats["hits"] + stats["misses"]
+        return stats["hits"] / total if total else 0.0
+
+    def stats(self) -> dict:
+        """Per-scope hit/miss counters, hit rate and live entry count."""
+        with self._lock:
+            return {
+                scope: {
+                    **counts,
+                    "hit_rate": round(self.hit_rate(scope), 4),
+                    "entries": len(self._by_scope.get(scope, {})),
+                }
+                for scope, counts in self._stats.items()
+            }
+
+
+answer_cache = SemanticAnswerCache(
+    threshold=getattr(settings, 'ANSWER_CACHE_THRESHOLD', 0.95),
+    ttl=getattr(settings, 'ANSWER_CACHE_TTL', 900),
+    max_entries=getattr(settings, 'ANSWER_CACHE_MAX_ENTRIES', 5000),
+)
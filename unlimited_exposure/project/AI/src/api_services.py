@@ -1,7 +1,7 @@
 import os
 import sys
 import csv
-from typing import List, Dict, Optional
+from typing import Iterator, List, Dict, Optional
 import hashlib  # <--- 1. NEW IMPORT
 
 # --- DJANGO SETUP BLOCK ---
@@ -19,9 +19,17 @@ except Exception:
 
 from pypdf import PdfReader
 from docx import Document
-from .llm_gateway import UnifiedLLMClient
+from .llm_gateway import get_llm_client
 from .vector_store import VectorStore
 from .document_processor import DocumentProcessor
+from .answer_cache import answer_cache, hash_prompt
+from .prompt_builder import build_prompt, format_history
+from .tokens import context_token_budget, pack_context
+from .usage_ledger import usage_context
+from .model_router import ModelCascade, route_for_agent
+from .failover import chat_client_for
+from django.db.models import F
+from project.models import Agent
 
 try:
     from .webscraper import WebScraper
@@ -32,10 +40,14 @@ except ImportError:
         pass
 
 vector_db = VectorStore()
-llm_client = UnifiedLLMClient()
+llm_client = get_llm_client()
+cascade = ModelCascade(llm_client)
 
 SYSTEM_PROMPT_CACHE = {} # <--- 2. NEW GLOBAL VARIABLE
 
+NO_INFORMATION_ANSWER = "I apologize, but I don't have enough information."
+
+
 def extract_text_from_file(file_path: str) -> str:
     if not os.path.exists(file_path):
         print(f"File not found: {file_path}")
@@ -100,10 +112,12 @@ def ingest_data_to_vector_db(client_id: str, content_source: str, is_url: bool =
     chunks = chunk_text_content(text_content)
     
     if chunks:
-        # Create list of (text, doc_id) tuples
-        docs_with_metadata = [(chunk, document_id) for chunk in chunks]
-        vector_db.add_documents(client_id, docs_with_metadata)
-        return {"status": "success", "chunks": len(chunks)}
+        # Re-ingesting a document_id only embeds its new or changed chunks
+        with usage_context(operation="ingest"):
+            synced = vector_db.sync_document(client_id, document_id, chunks)
+        if synced["added"] or synced["removed"]:
+            mark_client_knowledge_changed(client_id)
+        return {"status": "success", "chunks": len(chunks), **synced}
     
     return {"status": "empty", "chunks": 0}
 
@@ -150,11 +164,12 @@ def generate_dynamic_system_prompt(
             3. Output ONLY the System Prompt text. Do not include markdown quotes.
             """
             
-            generated_prompt = llm_client.generate_text(
-                system_prompt="You are an expert Prompt Engineer.",
-                user_prompt=instruction,
-                temperature=0.7
-            )
+            with usage_context(operation="system_prompt"):
+                generated_prompt = llm_client.generate_text(
+                    system_prompt="You are an expert Prompt Engineer.",
+                    user_prompt=instruction,
+                    temperature=0.7
+                )
             
             if generated_prompt:
                 SYSTEM_PROMPT_CACHE[cache_key] = generated_prompt
@@ -180,11 +195,12 @@ def generate_dynamic_system_prompt(
         Output ONLY the System Prompt text. Do not include markdown quotes.
         """
         
-        generated_prompt = llm_client.generate_text(
-            system_prompt="You are an expert AI Architect.",
-            user_prompt=f"{instruction}\n\nCONTENT PREVIEW:\n{db_content}",
-            temperature=0.5
-        )
+        with usage_context(operation="system_prompt"):
+            generated_prompt = llm_client.generate_text(
+                system_prompt="You are an expert AI Architect.",
+                user_prompt=f"{instruction}\n\nCONTENT PREVIEW:\n{db_content}",
+                temperature=0.5
+            )
 
         generated_prompt = generated_prompt+"\n Please answer the query to the point."
         
@@ -197,42 +213,113 @@ def generate_dynamic_system_prompt(
     return "You are a helpful, professional AI assistant. Answer user queries politely and accurately using the provided context."
 
 
+# ==========================================
+# 4. ANSWER CACHE
+# ==========================================
+
+def _cache_lookup(scope: str, system_prompt: Optional[str], kb_version, user_query: str,
+                  chat_history: List[Dict[str, str]] = None):
+    """
+    Checks the semantic answer cache (keyed by the system prompt and the recent history the prompt includes).
+    Returns (cached_answer or None, query_vector); the vector is reused when storing the answer.
+    """
+    if not getattr(settings, 'ANSWER_CACHE_ENABLED', True):
+        return None, None
+
+    query_vector = llm_client.get_embedding(user_query)
+    answer = answer_cache.lookup(scope, hash_prompt(system_prompt, format_history(chat_history)), kb_version, query_vector)
+    if answer:
+        print(f"⚡ Answer cache hit for {scope} (hit rate {answer_cache.hit_rate(scope):.0%})")
+    return answer, query_vector
+
+
+def _cache_store(scope: str, system_prompt: Optional[str], kb_version, query_vector, answer: Optional[str],
+                 chat_history: List[Dict[str, str]] = None):
+    if query_vector is not None and answer and answer != NO_INFORMATION_ANSWER:
+        answer_cache.store(scope, hash_prompt(system_prompt, format_history(chat_history)), kb_version,
+                           query_vector, answer)
+
+
+def _agent_state(agent_id: str):
+    """(kb_version, organization_id, llm_routing) of an agent, or Nones if it does not exist."""
+    return (
+        Agent.objects.filter(id=agent_id).values_list("kb_version", "organization_id", "llm_routing").first()
+        or (None, None, None)
+    )
+
+
+def mark_agent_knowledge_changed(agent_id: str):
+    """
+    Call after ingesting or deleting content for an agent.
+    Bumps Agent.kb_version (seen by every worker) and drops this process's cached answers.
+    """
+    Agent.objects.filter(id=agent_id).update(kb_version=F("kb_version") + 1)
+    answer_cache.invalidate(str(agent_id))
+
+
+def mark_client_knowledge_changed(client_id: str):
+    """Client-based (legacy) store has no version column; cached answers are dropped in this process."""
+    answer_cache.invalidate(f"client:{client_id}")
+
+
 def generate_rag_response(
     client_id: str, 
     user_query: str, 
     system_prompt: Optional[str] = None, 
     chat_history: List[Dict[str, str]] = None
 ) -> str:
-    
-    # 1. Retrieve
-    retrieved_docs = vector_db.search(client_id, user_query, limit=10)
-    if not retrieved_docs:
-        return "I apologize, but I don't have enough information."
 
-    context_text = "\n\n".join(retrieved_docs)[:30000]
+    scope = f"client:{client_id}"
+    with usage_context(operation="rag_response"):
+        cached, query_vector = _cache_lookup(scope, system_prompt, 0, user_query, chat_history)
+        if cached:
+            return cached
+
+        # 1. Retrieve
+        retrieved_chunks = vector_db.search_chunks(client_id, user_query, limit=10)
+        if not retrieved_chunks:
+            return NO_INFORMATION_ANSWER
+
+        context_text = pack_context(retrieved_chunks, context_token_budget(llm_client.chat_model))
+
+        # 2. Prompt: stable system prefix first, per-turn history/context/question last
+        prompt = build_prompt(
+            system_prompt or "You are a helpful assistant. Answer using Context and History only.",
+            user_query,
+            context=context_text,
+            history=format_history(chat_history),
+        )
 
-    # 2. History
-    history_context = ""
-    if chat_history:
-        recent_msgs = chat_history[-4:]
-        history_lines = [f"{m.get('role','').capitalize()}: {m.get('content','')}" for m in recent_msgs]
-        history_context = "\n".join(history_lines)
+        answer = chat_client_for().generate_text(prompt.system_sections, prompt.user, temperature=0.3)
+    _cache_store(scope, system_prompt, 0, query_vector, answer, chat_history)
+    return answer
 
-    # 3. Prompt
-    if not system_prompt:
-        system_prompt = "You are a helpful assistant. Answer using Context and History only."
 
-    full_user_prompt = f"""
-Conversation History:
-{history_context}
+def _build_agent_prompt(
+    agent_id: str,
+    user_query: str,
+    system_prompt: Optional[str] = None,
+    chat_history: List[Dict[str, str]] = None
+) -> Optional[tuple]:
+    """
+    Retrieves agent context and builds (system_sections, user_prompt, retrieval_scores).
+    Returns None when nothing relevant was retrieved.
+    """
+    vec_db = DocumentProcessor(agent_id=agent_id)
 
-Context Information:
-{context_text}
+    retrieved_chunks = vec_db.search_chunks(user_query, k=10)
+    if not retrieved_chunks:
+        return None
 
-User Question: {user_query}
-"""
+    context_text = pack_context(retrieved_chunks, context_token_budget(llm_client.chat_model))
 
-    return llm_client.generate_text(system_prompt, full_user_prompt, temperature=0.3)
+    prompt = build_prompt(
+        system_prompt or "You are a helpful assistant. Answer using Context and History only.",
+        user_query,
+        context=context_text,
+        history=format_history(chat_history),
+    )
+    return prompt.system_sections, prompt.user, [chunk.score for chunk in retrieved_chunks]
 
 
 def new_generate_response(
@@ -241,34 +328,67 @@ def new_generate_response(
     system_prompt: Optional[str] = None, 
     chat_history: List[Dict[str, str]] = None
 ) -> str:
-    
-    vec_db = DocumentProcessor(agent_id=agent_id)
 
-    retrieved_docs = vec_db.search(user_query, k=10)
-    if not retrieved_docs:
-        return "I apologize, but I don't have enough information."
-
-    context_text = "\n\n".join(retrieved_docs)[:30000]
-
-    # 2. History
-    history_context = ""
-    if chat_history:
-        recent_msgs = chat_history[-4:]
-        history_lines = [f"{m.get('role','').capitalize()}: {m.get('content','')}" for m in recent_msgs]
-        history_context = "\n".join(history_lines)
-
-    # 3. Prompt
-    if not system_prompt:
-        system_prompt = "You are a helpful assistant. Answer using Context and History only."
-
-    full_user_prompt = f"""
-                Conversation History:
-                {history_context}
-
-                Context Information:
-                {context_text}
-
-                User Question: {user_query}
-        """
-
-    return llm_client.generate_text(system_prompt, full_user_prompt, temperature=0.3)
+    kb_version, organization_id, llm_routing = _agent_state(agent_id)
+    with usage_context(agent_id=agent_id, organization_id=organization_id, operation="rag_response"):
+        cached, query_vector = _cache_lookup(str(agent_id), system_prompt, kb_version, user_query, chat_history)
+        if cached:
+            return cached
+
+        prompts = _build_agent_prompt(agent_id, user_query, system_prompt, chat_history)
+        if not prompts:
+            return NO_INFORMATION_ANSWER
+
+        effective_prompt, full_user_prompt, scores = prompts
+        route = route_for_agent(llm_routing)
+        client = chat_client_for(llm_routing)
+        if route:
+            answer = cascade.generate(route, str(agent_id), effective_prompt, full_user_prompt, scores,
+                                      temperature=0.3, client=client)
+        else:
+            answer = client.generate_text(effective_prompt, full_user_prompt, temperature=0.3)
+    _cache_store(str(agent_id), system_prompt, kb_version, query_vector, answer, chat_history)
+    return answer
+
+
+def stream_generate_response(
+    agent_id: str,
+    user_query: str,
+    system_prompt: Optional[str] = None,
+    chat_history: List[Dict[str, str]] = None
+) -> Iterator[str]:
+    """Streaming variant of new_generate_response: yields answer tokens as they arrive."""
+
+    kb_version, organization_id, llm_routing = _agent_state(agent_id)
+    # The attribution block must not span a yield: the stream captures it when opened
+    with usage_context(agent_id=agent_id, organization_id=organization_id, operation="rag_response"):
+        cached, query_vector = _cache_lookup(str(agent_id), system_prompt, kb_version, user_query, chat_history)
+        prompts = None if cached else _build_agent_prompt(agent_id, user_query, system_prompt, chat_history)
+        tokens = None
+        if prompts:
+            effective_prompt, full_user_prompt, scores = prompts
+            route = route_for_agent(llm_routing)
+            client = chat_client_for(llm_routing)
+            if route:
+                tokens = cascade.stream(route, str(agent_id), effective_prompt, full_user_prompt, scores,
+                                        temperature=0.3, client=client, raise_errors=True)
+            else:
+                tokens = client.stream_text(effective_prompt, full_user_prompt, temperature=0.3, raise_errors=True)
+
+    if cached:
+        yield cached
+        return
+    if tokens is None:
+        yield NO_INFORMATION_ANSWER
+        return
+
+    parts = []
+    try:
+        for token in tokens:
+            parts.append(token)
+            yield token
+    except Exception as e:
+        # The stream just ends for the caller; a cut-off answer must not be cached
+        print(f"❌ Streaming answer for agent {agent_id} failed: {e}")
+        return
+    _cache_store(str(agent_id), system_prompt, kb_version, query_vector, "".join(parts), chat_history)
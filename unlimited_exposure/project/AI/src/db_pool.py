@@ -0,0 +1,221 @@
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Optional
+
+import psycopg2
+from psycopg2 import extensions
+from django.conf import settings
+
+
+class PoolTimeout(Exception):
+    """No connection became available within the checkout timeout."""
+
+
+class ConnectionPool:
+    """
+    Thread-safe psycopg2 connection pool for the vector database.
+
+    - At most `max_size` connections are open; callers wait up to
+      `checkout_timeout` seconds for one and get PoolTimeout after that.
+    - Connections idle for longer than `validate_after` seconds are checked
+      with `SELECT 1` on checkout; dead ones (e.g. after a Postgres restart)
+      are replaced with a fresh connection transparently.
+    - A connection that raised a connection-level error is discarded on return;
+      otherwise any open transaction is rolled back before it goes back.
+    - The pool is rebuilt automatically in a forked child process.
+    """
+
+    def __init__(self, max_size: int = 10, checkout_timeout: float = 5.0, validate_after: float = 30.0,
+                 **connect_kwargs):
+        self.max_size = max_size
+        self.checkout_timeout = checkout_timeout
+        self.validate_after = validate_after
+        self.connect_kwargs = connect_kwargs
+        self._idle = deque()  # (connection, returned_at)
+        self._size = 0
+        self._waiting = 0
+        self._cond = threading.Condition()
+        self._pid = os.getpid()
+        self._stats = {"checkouts": 0, "timeouts": 0, "reconnects": 0, "discarded": 0,
+                       "wait_total_ms": 0.0, "wait_max_ms": 0.0}
+
+    def _connect(self):
+        return psycopg2.connect(**self.connect_kwargs)
+
+    def _reset_after_fork(self):
+        # Connections inherited from the parent must not be used (or closed) by the child
+        with self._cond:
+            if self._pid != os.getpid():
+                self._idle.clear()
+                self._size = 0
+                self._waiting = 0
+                self._pid = os.getpid()
+
+    @staticmethod
+    def _is_alive(conn) -> bool:
+        if conn.closed:
+            return False
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1;")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def _checkout(self):
+        if self._pid != os.getpid():
+            self._reset_after_fork()
+
+        started = time.monotonic()
+        deadline = started + self.checkout_timeout
+        with self._cond:
+            self._waiting += 1
+            try:
+                while not self._idle and self._size >= self.max_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._stats["timeouts"] += 1
+                        raise PoolTimeout(
+                            f"No vector DB connection available within {self.checkout_timeout}s "
+                            f"({self._size}/{self.max_size} in use)"
+                        )
+                    self._cond.wait(remaining)
+                if self._idle:
+                    conn, returned_at = self._idle.pop()
+                else:
+                    conn, returned_at = None, None
+                    self._size += 1  # reserve the slot before connecting outside the lock
+            finally:
+                self._waiting -= 1
+
+            waited_ms = (time.monotonic() - started) * 1000
+            self._stats["checkouts"] += 1
+            self._stats["wait_total_ms"] += waited_ms
+            self._stats["wait_max_ms"] = max(self._stats["wait_max_ms"], waited_ms)
+
+        try:
+            if conn is not None and (conn.closed or (
+                    time.monotonic() - returned_at > self.validate_after and not self._is_alive(conn))):
+                self._close_quietly(conn)
+                conn = None
+                with self._cond:
+                    self._stats["reconnects"] += 1
+            if conn is None:
+                conn = self._connect()
+        except Exception:
+            self._release_slot()
+            raise
+        return conn
+
+    def _checkin(self, conn, broken: bool):
+        if not broken and not conn.closed:
+            try:
+                if conn.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+            except psycopg2.Error:
+                broken = True
+        if broken or conn.closed or self._pid != os.getpid():
+            self._close_quietly(conn)
+            with self._cond:
+                self._stats["discarded"] += 1
+            self._release_slot()
+            return
+        with self._cond:
+            self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    def _release_slot(self):
+        with self._cond:
+            self._size = max(0, self._size - 1)
+            self._cond.notify()
+
+    @staticmethod
+    def _close_quietly(conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    @contextmanager
+    def connection(self):
+        """
+        Borrows a connection for the duration of the block. Commit inside the
+        block; an uncommitted transaction is rolled back when it is returned.
+        """
+        conn = self._checkout()
+        broken = False
+        try:
+            yield conn
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            broken = True
+            raise
+        except Exception:
+            if not conn.closed:
+                try:
+                    conn.rollback()
+                except psycopg2.Error:
+                    broken = True
+            raise
+        finally:
+            self._checkin(conn, broken)
+
+    def stats(self) -> dict:
+        """Pool size and saturation counters (waiting > 0 or timeouts > 0 means the pool is too small)."""
+        with self._cond:
+            checkouts = self._stats["checkouts"]
+            return {
+                "max_size": self.max_size,
+                "open": self._size,
+                "in_use": self._size - len(self._idle),
+                "idle": len(self._idle),
+                "waiting": self._waiting,
+                "checkouts": checkouts,
+                "timeouts": self._stats["timeouts"],
+                "reconnects": self._stats["reconnects"],
+                "discarded": self._stats["discarded"],
+                "wait_avg_ms": round(self._stats["wait_total_ms"] / checkouts, 2) if checkouts else 0.0,
+                "wait_max_ms": round(self._stats["wait_max_ms"], 2),
+            }
+
+    def close(self):
+        with self._cond:
+            while self._idle:
+                self._close_quietly(self._idle.pop()[0])
+                self._size -= 1
+
+
+_pool: Optional[ConnectionPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_vector_db_pool() -> ConnectionPool:
+    """The process-wide pool for the vector database (settings POSTGRES_* / VECTOR_DB_POOL_*)."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(
+                    max_size=getattr(settings, 'VECTOR_DB_POOL_SIZE', 10),
+                    checkout_timeout=getattr(settings, 'VECTOR_DB_POOL_TIMEOUT', 5.0),
+                    validate_after=getattr(settings, 'VECTOR_DB_POOL_VALIDATE_AFTER', 30.0),
+                    dbname=settings.POSTGRES_DB_NAME,
+                    user=settings.POSTGRES_USER,
+                    password=settings.POSTGRES_PASSWORD,
+                    host=settings.POSTGRES_HOST,
+                    port=int(settings.POSTGRES_PORT or 5432),
+                    connect_timeout=getattr(settings, 'VECTOR_DB_CONNECT_TIMEOUT', 5),
+                    # TCP keepalives notice a dead server on long-lived idle connections
+                    keepalives=1,
+                    keepalives_idle=30,
+                    keepalives_interval=10,
+                    keepalives_count=3,
+                )
+    return _pool
+
+
+def pool_stats() -> dict:
+    return _pool.stats() if _pool is not None else {}
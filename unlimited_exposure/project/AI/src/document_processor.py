@@ -1,22 +1,54 @@
 import os
+import uuid
+from typing import List
+
 from django.conf import settings
+from psycopg2.extras import Json, execute_values
 
 from langchain_community.document_loaders import PyPDFLoader
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_community.vectorstores import PGVector
-from langchain_openai import OpenAIEmbeddings
+from langchain_core.embeddings import Embeddings
 from langchain_core.documents import Document
 
+from .db_pool import get_vector_db_pool
+from .llm_gateway import UnifiedLLMClient, get_llm_client
+from .retrieval import CANDIDATE_FACTOR, RRF_K, TEXT_SEARCH_CONFIG, RetrievedChunk, lexical_query, use_hybrid
+from .tokens import count_tokens
+from .vector_schema import content_hash
+from .usage_ledger import usage_context
+
+
+class GatewayEmbeddings(Embeddings):
+    """LangChain embeddings adapter that routes through UnifiedLLMClient (batching + embedding cache)."""
+
+    def __init__(self, client: UnifiedLLMClient = None):
+        self.client = client or get_llm_client()
+
+    def embed_documents(self, texts):
+        return self.client.get_embeddings(list(texts))
+
+    def embed_query(self, text):
+        return self.client.get_embedding(text)
+
+
+_shared_embeddings = None
+
+
+def get_shared_embeddings() -> GatewayEmbeddings:
+    """One embeddings adapter per process, backed by the shared gateway client."""
+    global _shared_embeddings
+    if _shared_embeddings is None:
+        _shared_embeddings = GatewayEmbeddings(get_llm_client())
+    return _shared_embeddings
+
 
 class DocumentProcessor:
     """Production-ready document processor for PDF ingestion into vector database."""
     
     def __init__(self, agent_id: str):
         self.agent_id = agent_id
-        self.embedding = OpenAIEmbeddings(
-            model=settings.EMBEDDING_MODEL,
-            api_key=settings.API_KEY
-        )
+        self.embedding = get_shared_embeddings()
         self.connection_string = (
             f"postgresql://{settings.POSTGRES_USER}:{settings.POSTGRES_PASSWORD}"
             f"@{settings.POSTGRES_HOST}:{settings.POSTGRES_PORT}/{settings.POSTGRES_DB_NAME}"
@@ -28,18 +60,20 @@ class DocumentProcessor:
             separators=["\n\n", "\n", " ", ""]
         )
     
-    def process_pdf(self, file_path: str) -> dict:
+    def process_pdf(self, file_path: str, source: str = None) -> dict:
         """
         Extract text from PDF, chunk it, and store in vector database.
+        Re-processing the same source only embeds its changed chunks.
         
         Args:
             file_path: Absolute path to PDF file
+            source: Source identifier stored with the chunks (defaults to the file name)
             
         Returns:
             dict: {"status": "success", "chunks": count, "source": filename}
         """
         try:
-            pdf_name = os.path.basename(file_path)
+            pdf_name = source or os.path.basename(file_path)
             print(f"📄 Starting PDF processing: {pdf_name}")
             
             # Load PDF
@@ -57,23 +91,17 @@ class DocumentProcessor:
             for idx, chunk in enumerate(chunks, 1):
                 chunk.metadata["agent_id"] = self.agent_id
                 chunk.metadata["source"] = pdf_name
+                chunk.metadata["token_count"] = count_tokens(chunk.page_content, settings.CHAT_MODEL)
                 if idx % 10 == 0:
                     print(f"⚙️  Processing chunk {idx}/{len(chunks)}...")
             
             # Store in vector database
-            print(f"🔄 Generating embeddings and storing in vector database...")
-            PGVector.from_documents(
-                documents=chunks,
-                embedding=self.embedding,
-                collection_name=str(self.agent_id),
-                connection_string=self.connection_string,
-                pre_delete_collection=False
-            )
-            print(f"✅ Successfully stored {len(chunks)} chunks in vector database")
+            synced = self._sync_source(chunks, pdf_name)
             
             return {
                 "status": "success",
                 "chunks": len(chunks),
+                **synced,
                 "source": pdf_name
             }
             
@@ -87,6 +115,7 @@ class DocumentProcessor:
     def process_text(self, text: str, source: str, metadata: dict = None) -> dict:
         """
         Process raw text and store in vector database.
+        Re-processing the same source only embeds its changed chunks.
         
         Args:
             text: Raw text content
@@ -116,21 +145,15 @@ class DocumentProcessor:
                 chunk.metadata["agent_id"] = self.agent_id
                 if "source" not in chunk.metadata:
                     chunk.metadata["source"] = source
+                chunk.metadata["token_count"] = count_tokens(chunk.page_content, settings.CHAT_MODEL)
             
             # Store in vector database
-            print(f"🔄 Generating embeddings and storing in vector database...")
-            PGVector.from_documents(
-                documents=chunks,
-                embedding=self.embedding,
-                collection_name=str(self.agent_id),
-                connection_string=self.connection_string,
-                pre_delete_collection=False
-            )
-            print(f"✅ Successfully stored {len(chunks)} chunks in vector database")
+            synced = self._sync_source(chunks, source)
             
             return {
                 "status": "success",
                 "chunks": len(chunks),
+                **synced,
                 "source": source
             }
             
@@ -141,6 +164,168 @@ class DocumentProcessor:
                 "error": str(e)
             }
     
+    def _store_chunks(self, chunks: list, source: str) -> int:
+        """
+        Embeds and stores the chunks `source` does not already have (by content_hash),
+        so re-uploads and repeated pages cost no embedding calls.
+        Returns the number of duplicate chunks skipped.
+        """
+        unique = {}
+        for chunk in chunks:
+            chunk.metadata["content_hash"] = content_hash(chunk.page_content)
+            unique.setdefault(chunk.metadata["content_hash"], chunk)
+        stored = self._stored_hashes(source, list(unique))
+        new_chunks = [chunk for chunk_hash, chunk in unique.items() if chunk_hash not in stored]
+        skipped = len(chunks) - len(new_chunks)
+        if skipped:
+            print(f"♻️ Skipping {skipped} duplicate chunks for agent: {self.agent_id}")
+        if not new_chunks:
+            return skipped
+
+        print(f"🔄 Generating embeddings and storing in vector database...")
+        with usage_context(agent_id=self.agent_id, operation="ingest"):
+            PGVector.from_documents(
+                documents=new_chunks,
+                embedding=self.embedding,
+                collection_name=str(self.agent_id),
+                connection_string=self.connection_string,
+                pre_delete_collection=False
+            )
+        print(f"✅ Successfully stored {len(new_chunks)} chunks in vector database")
+        return skipped
+
+    def _sync_source(self, chunks: list, source: str) -> dict:
+        """
+        Incremental re-ingestion of one source: chunks are diffed against the content
+        hashes stored for it, new chunks reuse the embedding of a copy in another source
+        when the agent has one (the rest are embedded), and chunks dropped from the
+        source are deleted. Embedding happens before the write transaction; the write
+        takes a per-source advisory lock, re-reads the stored hashes and applies the
+        diff as it stands then. The first ingest of an agent goes through PGVector,
+        which creates the collection.
+
+        Returns:
+            {"added": n, "removed": n, "unchanged": n, "skipped": repeats within the source}
+        """
+        wanted = {}
+        for chunk in chunks:
+            chunk.metadata["content_hash"] = content_hash(chunk.page_content)
+            wanted.setdefault(chunk.metadata["content_hash"], chunk)
+
+        with get_vector_db_pool().connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("SELECT to_regclass('langchain_pg_collection') IS NOT NULL;")
+                collection_id = None
+                if cur.fetchone()[0]:
+                    cur.execute("SELECT uuid FROM langchain_pg_collection WHERE name = %s;", (str(self.agent_id),))
+                    row = cur.fetchone()
+                    collection_id = row[0] if row else None
+                if collection_id is not None:
+                    stored_hashes = self._source_hashes(cur, collection_id, source)
+                    new_hashes = [chunk_hash for chunk_hash in wanted if chunk_hash not in stored_hashes]
+                    stored_vectors = self._stored_vectors(cur, collection_id, new_hashes)
+            conn.commit()
+        if collection_id is None:
+            skipped = self._store_chunks(chunks, source)
+            return {"added": len(chunks) - skipped, "removed": 0, "unchanged": 0, "skipped": skipped}
+
+        # No connection or lock is held while the embeddings API runs
+        vectors = {}
+        if new_hashes:
+            print(f"🔄 Embedding {len(new_hashes)} new or changed chunks of {source}...")
+            vectors = self._embed(new_hashes, [wanted[chunk_hash] for chunk_hash in new_hashes], stored_vectors)
+
+        with get_vector_db_pool().connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("SELECT pg_advisory_xact_lock(hashtext(%s), hashtext(%s));", (str(collection_id), source))
+                # Rows ingested before hashing have no content_hash and are replaced
+                cur.execute("""
+                    SELECT uuid, cmetadata->>'content_hash' FROM langchain_pg_embedding
+                    WHERE collection_id = %s AND cmetadata->>'source' = %s;
+                """, (collection_id, source))
+                stored = cur.fetchall()
+                stored_hashes = {chunk_hash for _, chunk_hash in stored}
+                removed = [str(row_uuid) for row_uuid, chunk_hash in stored if chunk_hash not in wanted]
+                new_hashes = [chunk_hash for chunk_hash in wanted if chunk_hash not in stored_hashes]
+                # Only when a concurrent sync removed chunks since the first read
+                late = [chunk_hash for chunk_hash in new_hashes if chunk_hash not in vectors]
+                if late:
+                    vectors.update(self._embed(
+                        late, [wanted[chunk_hash] for chunk_hash in late],
+                        self._stored_vectors(cur, collection_id, late)
+                    ))
+
+                if removed:
+                    cur.execute("DELETE FROM langchain_pg_embedding WHERE uuid = ANY(%s::uuid[]);", (removed,))
+                added = 0
+                if new_hashes:
+                    added = len(execute_values(cur, """
+                        INSERT INTO langchain_pg_embedding (uuid, collection_id, embedding, document, cmetadata)
+                        VALUES %s ON CONFLICT DO NOTHING RETURNING 1
+                    """, [
+                        (str(uuid.uuid4()), collection_id, vectors[chunk_hash], wanted[chunk_hash].page_content,
+                         Json(wanted[chunk_hash].metadata))
+                        for chunk_hash in new_hashes
+                    ], template="(%s, %s, %s::vector, %s, %s)", fetch=True))
+            conn.commit()
+
+        result = {"added": added, "removed": len(removed), "unchanged": len(wanted) - len(new_hashes),
+                  "skipped": len(chunks) - len(wanted)}
+        print(f"✅ Synced {source} for agent {self.agent_id}: {result}")
+        return result
+
+    @staticmethod
+    def _source_hashes(cur, collection_id, source: str) -> set:
+        """Content hashes stored for one source of the collection."""
+        cur.execute("""
+            SELECT cmetadata->>'content_hash' FROM langchain_pg_embedding
+            WHERE collection_id = %s AND cmetadata->>'source' = %s;
+        """, (collection_id, source))
+        return {row[0] for row in cur.fetchall()}
+
+    @staticmethod
+    def _stored_vectors(cur, collection_id, hashes: list) -> dict:
+        """content_hash -> embedding for the chunks among `hashes` stored under any source of the collection."""
+        cur.execute("""
+            SELECT DISTINCT ON (cmetadata->>'content_hash') cmetadata->>'content_hash', embedding::real[]
+            FROM langchain_pg_embedding
+            WHERE collection_id = %s AND cmetadata->>'content_hash' = ANY(%s);
+        """, (collection_id, hashes))
+        return dict(cur.fetchall())
+
+    def _embed(self, hashes: list, chunks: list, stored: dict) -> dict:
+        """
+        content_hash -> vector for `chunks` (content hashes `hashes`): embeddings in
+        `stored` (copies under another source) are reused, the rest are embedded.
+        """
+        vectors = {chunk_hash: stored[chunk_hash] for chunk_hash in hashes if chunk_hash in stored}
+        missing = [(chunk_hash, chunk) for chunk_hash, chunk in zip(hashes, chunks) if chunk_hash not in stored]
+        if vectors:
+            print(f"♻️ Reusing {len(vectors)} stored embeddings for agent: {self.agent_id}")
+        if missing:
+            with usage_context(agent_id=self.agent_id, operation="ingest"):
+                embedded = self.embedding.embed_documents([chunk.page_content for _, chunk in missing])
+            vectors.update(zip([chunk_hash for chunk_hash, _ in missing], embedded))
+        return vectors
+
+    def _stored_hashes(self, source: str, hashes: list) -> set:
+        """Which of `hashes` this agent's collection already holds for `source`."""
+        with get_vector_db_pool().connection() as conn:
+            with conn.cursor() as cur:
+                # LangChain creates its tables on the first ingest
+                cur.execute("SELECT to_regclass('langchain_pg_embedding') IS NOT NULL;")
+                if not cur.fetchone()[0]:
+                    return set()
+                cur.execute("""
+                    SELECT e.cmetadata->>'content_hash'
+                    FROM langchain_pg_embedding e
+                    JOIN langchain_pg_collection c ON c.uuid = e.collection_id
+                    WHERE c.name = %s AND e.cmetadata->>'source' = %s AND e.cmetadata->>'content_hash' = ANY(%s);
+                """, (str(self.agent_id), source, hashes))
+                stored = {row[0] for row in cur.fetchall()}
+            conn.commit()
+        return stored
+
     def search(self, query: str, k: int = 3) -> list:
         """
         Semantic search in vector database.
@@ -152,20 +337,92 @@ class DocumentProcessor:
         Returns:
             list: List of relevant document chunks
         """
-        vector_store = PGVector(
-            collection_name=str(self.agent_id),
-            connection_string=self.connection_string,
-            embedding_function=self.embedding
-        )
-        
-        results = vector_store.similarity_search(
-            query,
-            k=k,
-            filter={"agent_id": self.agent_id}
-        )
-        
-        return "\n\n".join([doc.page_content for doc in results])
-    
+        return [chunk.text for chunk in self.search_chunks(query, k)]
+
+    def search_chunks(self, query: str, k: int = 3) -> List[RetrievedChunk]:
+        """
+        Search returning RetrievedChunk hits (cosine score, source, chunk uuid, token count), best first.
+        Chunks ingested before token counts were stored have token_count None.
+
+        Queries the LangChain tables directly: constructing PGVector per query would
+        re-run its table and collection setup on every search.
+        """
+        query_vector = self.embedding.embed_query(query)
+        params = {"collection": str(self.agent_id), "agent_id": str(self.agent_id), "query": query_vector, "k": k}
+        if use_hybrid(query):
+            ranking = self._HYBRID_RANKING.format(config=TEXT_SEARCH_CONFIG)
+            params.update(tsquery=lexical_query(query), candidates=k * CANDIDATE_FACTOR, rrf_k=RRF_K)
+        else:
+            ranking = self._VECTOR_RANKING
+
+        with get_vector_db_pool().connection() as conn:
+            with conn.cursor() as cur:
+                # LangChain creates its tables on the first ingest
+                cur.execute("SELECT to_regclass('langchain_pg_embedding') IS NOT NULL;")
+                if not cur.fetchone()[0]:
+                    return []
+                # Collection id is looked up once, so each ranked subquery filters the table directly
+                cur.execute("SELECT uuid FROM langchain_pg_collection WHERE name = %s;", (str(self.agent_id),))
+                row = cur.fetchone()
+                if not row:
+                    return []
+                params["collection_id"] = row[0]
+                cur.execute(f"""
+                    WITH {ranking}
+                    SELECT e.document, 1 - (e.embedding <=> %(query)s::vector) AS similarity,
+                           e.cmetadata->>'source', e.uuid::text, (e.cmetadata->>'token_count')::int
+                    FROM ranked JOIN langchain_pg_embedding e ON e.uuid = ranked.uuid
+                    ORDER BY ranked.score DESC;
+                """, params)
+                rows = cur.fetchall()
+            conn.commit()
+        return [RetrievedChunk(*row) for row in rows]
+
+    # Rows of this agent; repeated in each subquery instead of a shared CTE, which
+    # Postgres would materialize (copying every embedding) when referenced twice
+    _AGENT_FILTER = "e.collection_id = %(collection_id)s AND e.cmetadata->>'agent_id' = %(agent_id)s"
+
+    # Cosine order only (score is the negated distance, so higher is better)
+    _VECTOR_RANKING = f"""
+        ranked AS (
+            SELECT e.uuid, -(e.embedding <=> %(query)s::vector) AS score
+            FROM langchain_pg_embedding e
+            WHERE {_AGENT_FILTER}
+            ORDER BY e.embedding <=> %(query)s::vector
+            LIMIT %(k)s
+        )"""
+
+    # Vector and full-text candidates fused with reciprocal-rank fusion (see
+    # VectorStore._hybrid_search_by_vector). The lexical predicate is written on
+    # langchain_pg_embedding with the exact idx_langchain_embedding_tsv expression
+    # so the GIN index serves it.
+    _HYBRID_RANKING = f"""
+        vector_hits AS (
+            SELECT e.uuid, row_number() OVER (ORDER BY e.embedding <=> %(query)s::vector) AS rank
+            FROM langchain_pg_embedding e
+            WHERE {_AGENT_FILTER}
+            ORDER BY rank
+            LIMIT %(candidates)s
+        ),
+        text_hits AS (
+            SELECT e.uuid, row_number() OVER (
+                ORDER BY ts_rank_cd(to_tsvector('{{config}}', coalesce(e.document, '')),
+                                    to_tsquery('{{config}}', %(tsquery)s)) DESC
+            ) AS rank
+            FROM langchain_pg_embedding e
+            WHERE {_AGENT_FILTER}
+              AND to_tsvector('{{config}}', coalesce(e.document, '')) @@ to_tsquery('{{config}}', %(tsquery)s)
+            ORDER BY rank
+            LIMIT %(candidates)s
+        ),
+        ranked AS (
+            SELECT uuid, sum(1.0 / (%(rrf_k)s + rank)) AS score
+            FROM (SELECT * FROM vector_hits UNION ALL SELECT * FROM text_hits) hits
+            GROUP BY uuid
+            ORDER BY score DESC
+            LIMIT %(k)s
+        )"""
+
     def delete_document(self, source: str) -> dict:
         """
         Delete all chunks for a specific document.
@@ -0,0 +1,157 @@
+import hashlib
+import re
+import threading
+from typing import List, Optional
+
+import numpy as np
+from django.conf import settings
+
+
+class EmbeddingBackend:
+    """
+    Interface for local embedding backends used by UnifiedLLMClient.
+
+    `embed` receives one batch of normalized texts and returns one vector per
+    text, in order. Implementations must be thread-safe: the client runs
+    several batches at once across worker threads.
+    """
+
+    name = "base"
+
+    def __init__(self, dimensions: int):
+        self.dimensions = dimensions
+
+    @property
+    def model_id(self) -> str:
+        """Identifier used in embedding cache keys so backends never share vectors."""
+        return f"{self.name}:{self.dimensions}"
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        raise NotImplementedError
+
+
+class HashingEmbeddingBackend(EmbeddingBackend):
+    """
+    Deterministic feature-hashing encoder (no model files, no network).
+
+    Word unigrams, word bigrams and character trigrams are hashed into signed
+    buckets and the result is L2-normalized. Lexical rather than semantic, but
+    stable across processes, which makes it suitable for tests and offline runs.
+    """
+
+    name = "hashing"
+    _WORD = re.compile(r"\w+")
+
+    def _features(self, text: str) -> List[str]:
+        words = self._WORD.findall(text.lower())
+        features = list(words)
+        features.extend(f"{a} {b}" for a, b in zip(words, words[1:]))
+        for word in words:
+            padded = f"#{word}#"
+            features.extend(f"c:{padded[i:i + 3]}" for i in range(len(padded) - 2))
+        return features
+
+    def _encode(self, text: str) -> np.ndarray:
+        vector = np.zeros(self.dimensions, dtype=np.float32)
+        features = self._features(text)
+        if not features:
+            return vector
+        hashes = np.array(
+            [int.from_bytes(hashlib.blake2b(f.encode("utf-8"), digest_size=8).digest(), "little") for f in features],
+            dtype=np.uint64
+        )
+        indices = (hashes % np.uint64(self.dimensions)).astype(np.int64)
+        signs = np.where((hashes >> np.uint64(63)) & np.uint64(1), -1.0, 1.0).astype(np.float32)
+        np.add.at(vector, indices, signs)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        return [self._encode(text).tolist() for text in texts]
+
+
+class OnnxEmbeddingBackend(EmbeddingBackend):
+    """
+    CPU sentence encoder run with onnxruntime (e.g. all-MiniLM-L6-v2 exported to ONNX).
+
+    Token embeddings are mean-pooled over the attention mask and L2-normalized.
+    Vectors shorter than `dimensions` are zero-padded so they fit the existing
+    vector column; padding does not change cosine similarity.
+    Requires the optional `onnxruntime` and `tokenizers` packages.
+    """
+
+    name = "onnx"
+
+    def __init__(self, dimensions: int, model_path: str, tokenizer_path: str, max_length: int = 256):
+        super().__init__(dimensions)
+        try:
+            import onnxruntime
+            from tokenizers import Tokenizer
+        except ImportError as e:
+            raise ImportError("EMBEDDING_BACKEND='onnx' requires the 'onnxruntime' and 'tokenizers' packages.") from e
+
+        self.model_path = model_path
+        options = onnxruntime.SessionOptions()
+        # Parallelism comes from running batches on several threads, one core each
+        options.intra_op_num_threads = 1
+        self.session = onnxruntime.InferenceSession(model_path, sess_options=options, providers=["CPUExecutionProvider"])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+
+        self.tokenizer = Tokenizer.from_file(tokenizer_path)
+        self.tokenizer.enable_truncation(max_length=max_length)
+        self.tokenizer.enable_padding()
+        # Tokenizer objects are not documented as thread-safe
+        self._tokenizer_lock = threading.Lock()
+
+    @property
+    def model_id(self) -> str:
+        return f"{self.name}:{self.model_path}:{self.dimensions}"
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        with self._tokenizer_lock:
+            encodings = self.tokenizer.encode_batch(texts)
+        input_ids = np.array([e.ids for e in encodings], dtype=np.int64)
+        attention_mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+
+        feeds = {"input_ids": input_ids, "attention_mask": attention_mask}
+        if "token_type_ids" in self.input_names:
+            feeds["token_type_ids"] = np.zeros_like(input_ids)
+        token_embeddings = self.session.run(None, {k: v for k, v in feeds.items() if k in self.input_names})[0]
+
+        mask = attention_mask[..., None].astype(np.float32)
+        pooled = (token_embeddings * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        pooled /= np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+
+        if pooled.shape[1] < self.dimensions:
+            pooled = np.pad(pooled, ((0, 0), (0, self.dimensions - pooled.shape[1])))
+        return pooled[:, :self.dimensions].tolist()
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_embedding_backend() -> Optional[EmbeddingBackend]:
+    """
+    Returns the process-wide local embedding backend selected by EMBEDDING_BACKEND,
+    or None when embeddings come from the configured API provider ("provider").
+    """
+    global _backend
+    name = getattr(settings, 'EMBEDDING_BACKEND', 'provider')
+    if name == "provider":
+        return None
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                dimensions = getattr(settings, 'EMBEDDING_DIMENSIONS', 1536)
+                if name == "hashing":
+                    _backend = HashingEmbeddingBackend(dimensions)
+                elif name == "onnx":
+                    _backend = OnnxEmbeddingBackend(
+                        dimensions,
+                        model_path=settings.EMBEDDING_ONNX_MODEL_PATH,
+                        tokenizer_path=settings.EMBEDDING_ONNX_TOKENIZER_PATH,
+                    )
+                else:
+                    raise ValueError(f"Unknown EMBEDDING_BACKEND: {name}")
+    return _backend
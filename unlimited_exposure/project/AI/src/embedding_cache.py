@@ -0,0 +1,143 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from array import array
+from typing import Dict, Iterable, List, Optional
+
+from django.conf import settings
+
+
+def normalize_text(text: str) -> str:
+    """Collapses whitespace so formatting-only differences share one cache entry."""
+    return " ".join(text.split())
+
+
+def make_cache_key(model: str, text: str) -> str:
+    """Content address for an embedding: sha256 of (model, normalized text)."""
+    return hashlib.sha256(f"{model}\x00{text}".encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Persistent, size-bounded embedding cache stored in a local SQLite file.
+
+    Vectors are stored as float32 blobs keyed by `make_cache_key`. When the
+    number of entries goes above `max_entries`, the least recently used rows
+    are evicted. The file can be shared by several worker processes.
+    """
+
+    # SQLite limits the number of bound parameters per statement
+    _QUERY_CHUNK = 500
+
+    def __init__(self, path: str, max_entries: int = 200000):
+        self.path = str(path)
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL;")
+        self._conn.execute("PRAGMA synchronous=NORMAL;")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS embeddings (
+                key TEXT PRIMARY KEY,
+                vector BLOB NOT NULL,
+                last_used REAL NOT NULL
+            );
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_last_used ON embeddings(last_used);")
+        self._size = self._conn.execute("SELECT COUNT(*) FROM embeddings;").fetchone()[0]
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, List[float]]:
+        """Returns the cached vectors for the given keys (missing keys are omitted)."""
+        keys = list(dict.fromkeys(keys))
+        found = {}
+        now = time.time()
+        with self._lock:
+            for i in range(0, len(keys), self._QUERY_CHUNK):
+                part = keys[i:i + self._QUERY_CHUNK]
+                placeholders = ",".join("?" * len(part))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders});", part
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = array("f", blob).tolist()
+                if rows:
+                    self._conn.executemany(
+                        "UPDATE embeddings SET last_used = ? WHERE key = ?;",
+                        [(now, key) for key, _ in rows]
+                    )
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        return found
+
+    def get(self, key: str) -> Optional[List[float]]:
+        return self.get_many([key]).get(key)
+
+    def put_many(self, items: Dict[str, List[float]]):
+        """Stores vectors and evicts the least recently used entries above the size bound."""
+        if not items:
+            return
+        now = time.time()
+        rows = [(key, array("f", vector).tobytes(), now) for key, vector in items.items()]
+        with self._lock:
+            self._conn.execute("BEGIN;")
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?);", rows
+            )
+            self._conn.execute("COMMIT;")
+            self._size += len(rows)
+            if self._size > self.max_entries:
+                self._evict()
+
+    def put(self, key: str, vector: List[float]):
+        self.put_many({key: vector})
+
+    def _evict(self):
+        # Recount first: other processes and INSERT OR REPLACE make the running size approximate
+        self._size = self._conn.execute("SELECT COUNT(*) FROM embeddings;").fetchone()[0]
+        overflow = self._size - self.max_entries
+        if overflow <= 0:
+            return
+        self._conn.execute("""
+            DELETE FROM embeddings WHERE key IN (
+                SELECT key FROM embeddings ORDER BY last_used ASC LIMIT ?
+            );
+        """, (overflow,))
+        self._size -= overflow
+        self.evictions += overflow
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": self._size,
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_embedding_cache() -> Optional[EmbeddingCache]:
+    """Returns the process-wide embedding cache, or None when EMBEDDING_CACHE_ENABLED is off."""
+    global _cache
+    if not getattr(settings, 'EMBEDDING_CACHE_ENABLED', True):
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = EmbeddingCache(
+                    path=getattr(settings, 'EMBEDDING_CACHE_PATH', os.path.join(settings.BASE_DIR, "data", "embedding_cache.sqlite3")),
+                    max_entries=getattr(settings, 'EMBEDDING_CACHE_MAX_ENTRIES', 200000),
+                )
+    return _cache
@@ -0,0 +1,544 @@
+import asyncio
+import contextvars
+import queue
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import AsyncIterator, Dict, Iterator, List, Optional, Sequence, Union
+
+from django.conf import settings
+
+try:
+    from .llm_gateway import PRIORITY_INTERACTIVE, get_async_llm_client, get_llm_client, is_transient_error
+    from .model_router import agent_overrides
+    from .usage_ledger import current_attribution, usage_context
+except ImportError:
+    from llm_gateway import PRIORITY_INTERACTIVE, get_async_llm_client, get_llm_client, is_transient_error
+    from model_router import agent_overrides
+    from usage_ledger import current_attribution, usage_context
+
+
+# ==========================================
+# CIRCUIT BREAKER
+# ==========================================
+
+class CircuitBreaker:
+    """
+    Consecutive-failure circuit breaker for one (provider, model) target.
+
+    closed    -> calls flow; `failure_threshold` failures in a row open the circuit.
+    open      -> calls are refused for `reset_timeout` seconds.
+    half_open -> one probe call is let through; success closes, failure re-opens.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """True if a call may be sent now. In half-open state only one caller gets True."""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                self._probing = False
+            if self.state == self.HALF_OPEN and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+            self._probing = False
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def breaker_for(target_key: str) -> CircuitBreaker:
+    breaker = _breakers.get(target_key)
+    if breaker is None:
+        with _breakers_lock:
+            breaker = _breakers.get(target_key)
+            if breaker is None:
+                breaker = _breakers[target_key] = CircuitBreaker(
+                    failure_threshold=getattr(settings, 'LLM_BREAKER_FAILURE_THRESHOLD', 5),
+                    reset_timeout=getattr(settings, 'LLM_BREAKER_RESET_SECONDS', 30.0),
+                )
+    return breaker
+
+
+def breaker_states() -> Dict[str, dict]:
+    """Current state of every circuit breaker, for health endpoints / logs."""
+    return {
+        key: {"state": b.state, "failures": b.failures}
+        for key, b in list(_breakers.items())
+    }
+
+
+# Hedge / failover counters for this process
+failover_stats = defaultdict(int)
+
+
+# ==========================================
+# POLICY
+# ==========================================
+
+class ChatTarget:
+    __slots__ = ("provider", "model")
+
+    def __init__(self, provider: str, model: str):
+        self.provider = provider
+        self.model = model
+
+    @property
+    def key(self) -> str:
+        return f"{self.provider}:{self.model}"
+
+
+class FailoverPolicy:
+    """
+    Ordered chat targets (primary first) plus hedging deadlines in seconds.
+    A deadline of None disables hedging; failover on errors still applies.
+    """
+
+    __slots__ = ("targets", "hedge_after", "first_token_timeout")
+
+    def __init__(self, targets: List[ChatTarget], hedge_after: Optional[float] = None,
+                 first_token_timeout: Optional[float] = None):
+        self.targets = targets
+        self.hedge_after = hedge_after
+        self.first_token_timeout = first_token_timeout
+
+
+def policy_for_agent(llm_routing: Optional[dict] = None) -> FailoverPolicy:
+    """
+    Builds the failover policy from Agent.llm_routing["hedge"] over the LLM_HEDGE_* /
+    LLM_FALLBACK_PROVIDERS settings. Fallbacks are {"provider": ..., "model": ...} dicts;
+    API keys always come from settings, never from the agent.
+    """
+    config = {
+        "enabled": getattr(settings, 'LLM_HEDGE_ENABLED', False),
+        "after_ms": getattr(settings, 'LLM_HEDGE_AFTER_MS', 4000),
+        "first_token_ms": getattr(settings, 'LLM_HEDGE_FIRST_TOKEN_MS', 2500),
+        "fallbacks": getattr(settings, 'LLM_FALLBACK_PROVIDERS', []),
+        **agent_overrides(llm_routing, "hedge"),
+    }
+    targets = [ChatTarget(settings.API_PROVIDER, settings.CHAT_MODEL)]
+    targets.extend(ChatTarget(f["provider"], f["model"]) for f in config["fallbacks"])
+    if not config["enabled"]:
+        return FailoverPolicy(targets)
+    return FailoverPolicy(
+        targets,
+        hedge_after=config["after_ms"] / 1000 if config["after_ms"] else None,
+        first_token_timeout=config["first_token_ms"] / 1000 if config["first_token_ms"] else None,
+    )
+
+
+# ==========================================
+# RESILIENT CHAT
+# ==========================================
+
+_hedge_pool = ThreadPoolExecutor(
+    max_workers=getattr(settings, 'LLM_HEDGE_WORKERS', 32), thread_name_prefix="llm-hedge"
+)
+
+_FINISHED = object()
+_FAILED = object()    # transient error: try the next target
+_REJECTED = object()  # request error: another target would reject it too
+_ENDINGS = (_FINISHED, _FAILED, _REJECTED)
+
+
+class ResilientChat:
+    """
+    Drop-in for the chat side of UnifiedLLMClient (generate_text / stream_text)
+    that spreads one request over the policy's targets:
+
+    - targets whose circuit breaker is open are skipped;
+    - on a transient error (timeout, connection, 429, 5xx) the next target is
+      tried (failover); other errors mean the request itself was rejected, so
+      they neither trip the breaker nor move on to another provider;
+    - with hedging on, if the current attempt has not answered within
+      `hedge_after` (or produced a first token within `first_token_timeout`
+      when streaming), the next target is started as well and whichever
+      finishes first wins. The loser's result is discarded.
+
+    A `model` argument (e.g. from the cascade) replaces the primary target's model.
+    """
+
+    def __init__(self, policy: FailoverPolicy):
+        self.policy = policy
+
+    def _targets(self, model: Optional[str]) -> List[ChatTarget]:
+        primary, *fallbacks = self.policy.targets
+        if model:
+            primary = ChatTarget(primary.provider, model)
+        return [primary] + fallbacks
+
+    @staticmethod
+    def _next_allowed(targets: List[ChatTarget], start: int, force: bool):
+        """Index of the next target whose breaker lets a call through (or `start` when forced)."""
+        for i in range(start, len(targets)):
+            if breaker_for(targets[i].key).allow():
+                return i
+        # Every breaker is open: still try the primary rather than fail without a call
+        return start if force and start < len(targets) else None
+
+    @staticmethod
+    def _record_error(target: ChatTarget, error: Exception):
+        """Books an attempt's error on its breaker; returns _FAILED (fail over) or _REJECTED (don't)."""
+        breaker = breaker_for(target.key)
+        if is_transient_error(error):
+            breaker.record_failure()
+            print(f"⚠️ Chat target {target.key} failed: {error}")
+            return _FAILED
+        # The provider answered; it is healthy even though it refused this request
+        breaker.record_success()
+        print(f"⚠️ Chat target {target.key} rejected the request: {error}")
+        return _REJECTED
+
+    def _attempt(self, target: ChatTarget, system_prompt, user_prompt: str, temperature: float, json_mode: bool,
+                 priority: str) -> str:
+        try:
+            answer = get_llm_client(target.provider).complete(
+                system_prompt, user_prompt, temperature=temperature, json_mode=json_mode,
+                priority=priority, model=target.model
+            )
+        except Exception as e:
+            self._record_error(target, e)
+            raise
+        breaker_for(target.key).record_success()
+        return answer
+
+    def generate_text(self, system_prompt: Union[str, Sequence[str]], user_prompt: str, temperature: float = 0.5,
+                      json_mode: bool = False, priority: str = PRIORITY_INTERACTIVE,
+                      model: Optional[str] = None) -> Optional[str]:
+        targets = self._targets(model)
+        pending = {}
+        next_index = 0
+        may_fail_over = True
+
+        def launch(force: bool = False) -> bool:
+            nonlocal next_index
+            index = self._next_allowed(targets, next_index, force)
+            if index is None:
+                return False
+            next_index = index + 1
+            # Each attempt runs in a copy of the caller's context (usage attribution)
+            future = _hedge_pool.submit(
+                contextvars.copy_context().run, self._attempt,
+                targets[index], system_prompt, user_prompt, temperature, json_mode, priority
+            )
+            pending[future] = targets[index]
+            return True
+
+        launch(force=True)
+        while pending:
+            can_hedge = may_fail_over and self.policy.hedge_after is not None and next_index < len(targets)
+            done, _ = wait(pending, timeout=self.policy.hedge_after if can_hedge else None,
+                           return_when=FIRST_COMPLETED)
+            if not done:
+                if launch():
+                    failover_stats["hedges"] += 1
+                    print(f"⏱️ Hedging chat request to {targets[next_index - 1].key}")
+                continue
+            for future in done:
+                target = pending.pop(future)
+                try:
+                    answer = future.result()
+                except Exception as e:
+                    may_fail_over = may_fail_over and is_transient_error(e)
+                    continue
+                if target is not targets[0]:
+                    failover_stats["fallback_wins"] += 1
+                return answer
+            if not pending and may_fail_over and launch():
+                failover_stats["failovers"] += 1
+        return None
+
+    def stream_text(self, system_prompt: Union[str, Sequence[str]], user_prompt: str, temperature: float = 0.5,
+                    priority: str = PRIORITY_INTERACTIVE, model: Optional[str] = None,
+                    raise_errors: bool = False) -> Iterator[str]:
+        """
+        Streaming failover: the first attempt to produce a token wins and is
+        streamed; other attempts are stopped. Once a stream has started it is
+        not switched to another target. When every attempt fails, or the winner
+        fails mid-answer, the stream ends (like UnifiedLLMClient.stream_text)
+        unless `raise_errors` is set, in which case the last error is raised.
+        """
+        return self._stream(system_prompt, user_prompt, temperature, priority, model, current_attribution(),
+                            raise_errors)
+
+    def _stream(self, system_prompt, user_prompt: str, temperature: float, priority: str, model: Optional[str],
+                attribution: Dict[str, str], raise_errors: bool = False) -> Iterator[str]:
+        targets = self._targets(model)
+        events = queue.Queue()
+        stops = {}
+        active = set()
+        errors = {}
+        next_index = 0
+        may_fail_over = True
+
+        def run(attempt: int, target: ChatTarget, stop: threading.Event):
+            try:
+                with usage_context(**attribution):
+                    tokens = get_llm_client(target.provider).stream_text(
+                        system_prompt, user_prompt, temperature=temperature, priority=priority,
+                        model=target.model, raise_errors=True
+                    )
+                for token in tokens:
+                    if stop.is_set():
+                        tokens.close()
+                        return
+                    events.put((attempt, token))
+            except Exception as e:
+                errors[attempt] = e
+                events.put((attempt, self._record_error(target, e)))
+                return
+            breaker_for(target.key).record_success()
+            events.put((attempt, _FINISHED))
+
+        def launch(force: bool = False) -> bool:
+            nonlocal next_index
+            index = self._next_allowed(targets, next_index, force)
+            if index is None:
+                return False
+            next_index = index + 1
+            stops[index] = threading.Event()
+            active.add(index)
+            threading.Thread(
+                target=run, args=(index, targets[index], stops[index]), name="llm-stream-hedge", daemon=True
+            ).start()
+            return True
+
+        winner = None
+        launch(force=True)
+        try:
+            while active or winner is not None:
+                can_hedge = (winner is None and may_fail_over and self.policy.first_token_timeout is not None
+                             and next_index < len(targets))
+                try:
+                    attempt, item = events.get(timeout=self.policy.first_token_timeout if can_hedge else None)
+                except queue.Empty:
+                    if launch():
+                        failover_stats["hedges"] += 1
+                        print(f"⏱️ Hedging chat stream to {targets[next_index - 1].key}")
+                    continue
+
+                if winner is None:
+                    if item in _ENDINGS:
+                        active.discard(attempt)
+                        if item is _FINISHED:
+                            return  # empty but successful answer
+                        may_fail_over = may_fail_over and item is _FAILED
+                        if not active and may_fail_over and launch():
+                            failover_stats["failovers"] += 1
+                        continue
+                    winner = attempt
+                    if attempt != 0:
+                        failover_stats["fallback_wins"] += 1
+                    for other, stop in stops.items():
+                        if other != winner:
+                            stop.set()
+
+                if attempt != winner:
+                    continue
+                if item in _ENDINGS:
+                    if item is not _FINISHED and raise_errors:
+                        raise errors[attempt]
+                    return
+                yield item
+            # Every attempt failed before its first token
+            if raise_errors and errors:
+                raise errors[max(errors)]
+        finally:
+            for stop in stops.values():
+                stop.set()
+
+
+class AsyncResilientChat(ResilientChat):
+    """Event-loop version of ResilientChat (losing attempts are cancelled)."""
+
+    async def _aattempt(self, target: ChatTarget, system_prompt, user_prompt: str, temperature: float,
+                        json_mode: bool, priority: str) -> str:
+        try:
+            answer = await get_async_llm_client(target.provider).complete(
+                system_prompt, user_prompt, temperature=temperature, json_mode=json_mode,
+                priority=priority, model=target.model
+            )
+        except Exception as e:
+            self._record_error(target, e)
+            raise
+        breaker_for(target.key).record_success()
+        return answer
+
+    async def generate_text(self, system_prompt: Union[str, Sequence[str]], user_prompt: str, temperature: float = 0.5,
+                            json_mode: bool = False, priority: str = PRIORITY_INTERACTIVE,
+                            model: Optional[str] = None) -> Optional[str]:
+        targets = self._targets(model)
+        pending = {}
+        next_index = 0
+        may_fail_over = True
+
+        def launch(force: bool = False) -> bool:
+            nonlocal next_index
+            index = self._next_allowed(targets, next_index, force)
+            if index is None:
+                return False
+            next_index = index + 1
+            task = asyncio.ensure_future(
+                self._aattempt(targets[index], system_prompt, user_prompt, temperature, json_mode, priority)
+            )
+            pending[task] = targets[index]
+            return True
+
+        launch(force=True)
+        try:
+            while pending:
+                can_hedge = may_fail_over and self.policy.hedge_after is not None and next_index < len(targets)
+                done, _ = await asyncio.wait(pending, timeout=self.policy.hedge_after if can_hedge else None,
+                                             return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    if launch():
+                        failover_stats["hedges"] += 1
+                    continue
+                for task in done:
+                    target = pending.pop(task)
+                    if task.exception() is not None:
+                        may_fail_over = may_fail_over and is_transient_error(task.exception())
+                        continue
+                    if target is not targets[0]:
+                        failover_stats["fallback_wins"] += 1
+                    return task.result()
+                if not pending and may_fail_over and launch():
+                    failover_stats["failovers"] += 1
+            return None
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def stream_text(self, system_prompt: Union[str, Sequence[str]], user_prompt: str, temperature: float = 0.5,
+                    priority: str = PRIORITY_INTERACTIVE, model: Optional[str] = None,
+                    raise_errors: bool = False) -> AsyncIterator[str]:
+        """Async streaming failover with the same rules as ResilientChat.stream_text."""
+        return self._astream(system_prompt, user_prompt, temperature, priority, model, raise_errors)
+
+    async def _astream(self, system_prompt, user_prompt: str, temperature: float, priority: str,
+                       model: Optional[str], raise_errors: bool = False) -> AsyncIterator[str]:
+        targets = self._targets(model)
+        events = asyncio.Queue()
+        tasks = {}
+        active = set()
+        errors = {}
+        next_index = 0
+        may_fail_over = True
+
+        async def run(attempt: int, target: ChatTarget):
+            try:
+                tokens = get_async_llm_client(target.provider).stream_text(
+                    system_prompt, user_prompt, temperature=temperature, priority=priority,
+                    model=target.model, raise_errors=True
+                )
+                async for token in tokens:
+                    await events.put((attempt, token))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                errors[attempt] = e
+                await events.put((attempt, self._record_error(target, e)))
+                return
+            breaker_for(target.key).record_success()
+            await events.put((attempt, _FINISHED))
+
+        def launch(force: bool = False) -> bool:
+            nonlocal next_index
+            index = self._next_allowed(targets, next_index, force)
+            if index is None:
+                return False
+            next_index = index + 1
+            active.add(index)
+            # Tasks copy the caller's context, so usage attribution follows them
+            tasks[index] = asyncio.ensure_future(run(index, targets[index]))
+            return True
+
+        winner = None
+        launch(force=True)
+        try:
+            while active or winner is not None:
+                can_hedge = (winner is None and may_fail_over and self.policy.first_token_timeout is not None
+                             and next_index < len(targets))
+                try:
+                    attempt, item = await asyncio.wait_for(
+                        events.get(), timeout=self.policy.first_token_timeout if can_hedge else None
+                    )
+                except asyncio.TimeoutError:
+                    if launch():
+                        failover_stats["hedges"] += 1
+                    continue
+
+                if winner is None:
+                    if item in _ENDINGS:
+                        active.discard(attempt)
+                        if item is _FINISHED:
+                            return
+                        may_fail_over = may_fail_over and item is _FAILED
+                        if not active and may_fail_over and launch():
+                            failover_stats["failovers"] += 1
+                        continue
+                    winner = attempt
+                    if attempt != 0:
+                        failover_stats["fallback_wins"] += 1
+                    for other, task in tasks.items():
+                        if other != winner:
+                            task.cancel()
+
+                if attempt != winner:
+                    continue
+                if item in _ENDINGS:
+                    if item is not _FINISHED and raise_errors:
+                        raise errors[attempt]
+                    return
+                yield item
+            if raise_errors and errors:
+                raise errors[max(errors)]
+        finally:
+            for task in tasks.values():
+                task.cancel()
+
+
+def chat_client_for(llm_routing: Optional[dict] = None):
+    """The shared client, or a ResilientChat when hedging or fallback providers are configured."""
+    policy = policy_for_agent(llm_routing)
+    if len(policy.targets) > 1 or policy.hedge_after or policy.first_token_timeout:
+        return ResilientChat(policy)
+    return get_llm_client()
+
+
+def async_chat_client_for(llm_routing: Optional[dict] = None):
+    """Async counterpart of chat_client_for."""
+    policy = policy_for_agent(llm_routing)
+    if len(policy.targets) > 1 or policy.hedge_after or policy.first_token_timeout:
+        return AsyncResilientChat(policy)
+    return get_async_llm_client()
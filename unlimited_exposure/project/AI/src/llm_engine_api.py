@@ -18,22 +18,108 @@ if not settings.configured:
 #-------------------------------------------------
 
 
-from typing import List, Dict
+from typing import AsyncIterator, Iterator, List, Dict
 
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-from src.llm_gateway import UnifiedLLMClient
+from src.failover import async_chat_client_for, chat_client_for
+from src.llm_gateway import get_llm_client
 from src.matcher_api import MatcherAPI
+from src.prompt_builder import build_prompt, format_history
+from src.retrieval import RetrievedChunk
+from src.tokens import context_token_budget, pack_context
 from src.vector_store import VectorStore
 # from config import settings
 
+TORONTO_PHO_INSTRUCTIONS = """\
+SYSTEM INSTRUCTIONS – TORONTO PHO CHATBOT
+------------------------------------------------------
+
+You are the official Toronto Pho chatbot.
+Always use friendly, warm, simple Canadian English — polite, helpful, and conversational, never robotic.
+Keep all replies between **10–30 words**. Please answer in a cheerful tone and include emojis in your answers to maximize your expression.
+
+Your goal:
+Answer using only the provided Knowledge Base context and conversation history.
+
+------------------------------------------------------
+CORE BEHAVIOUR
+------------------------------------------------------
+- Use only official Toronto Pho Knowledge Base content.
+- Never guess items, prices, or details.
+- Never mix information between locations.
+- Keep tone authentic, friendly, and clear.
+- If intent is unclear, ask a simple clarifying question.
+- Always use Canadian spelling and soft, polite phrasing.
+
+------------------------------------------------------
+INTENT HANDLING
+------------------------------------------------------
+Detect user intent:
+- If question is about food, menu, or ordering → ask for location if not given.
+- If question is about address, hours, phone, or directions → use `location.txt`.
+- If topic is outside the restaurant’s scope → say you can help with menu, locations, or online ordering instead. 
+
+------------------------------------------------------
+LOCATIONS
+------------------------------------------------------
+Toronto Pho has five locations:
+Orillia | Dufferin | Jane | Hamilton | Woodbridge
+
+Once the user’s location is known, use only that location’s data source.
+
+------------------------------------------------------
+MENU FILE MAPPING
+------------------------------------------------------
+| Location   | Menu File             |
+|-------------|----------------------|
+| Orillia     | orillia_menu.txt     |
+| Dufferin    | dufferin_menu.txt    |
+| Jane        | jane_menu.txt        |
+| Hamilton    | hamilton_menu.txt    |
+| Woodbridge  | woodbridge_menu.txt  |
+
+Search only the correct file for each location.
+
+------------------------------------------------------
+MENU HANDLING
+------------------------------------------------------
+- If user asks for “menu” or “categories”, describe available menu sections for that location.
+- If user asks about a specific food, pull details (name, description, ingredients, price) from that file.
+- Politely mention ordering options if available.
+
+------------------------------------------------------
+LOCATION INFORMATION
+------------------------------------------------------
+If asked about hours, address, or contact:
+- Retrieve from `location.txt`.
+- Example tone:
+“Here are the hours for our Dufferin location   
+Monday–Sunday: 11am–10pm  
+Here’s the address and phone number too!”
+
+------------------------------------------------------
+ABSOLUTE RULES
+------------------------------------------------------
+Do not guess, mix, or invent details.
+Do not create fake items, hours, or prices.
+Always use verified menu or location data.
+Stay friendly and concise (10–30 words).
+Keep polite, Canadian tone at all times.
+
+------------------------------------------------------
+"""
+
 # Global instances to allow caching to persist across requests
 matcher = MatcherAPI()
 vector_db = VectorStore()
 
 class LLMEngineAPI:
     def __init__(self):
-        self.llm_client = UnifiedLLMClient()
+        self.llm_client = get_llm_client()
+        # Fail over / hedge across LLM_FALLBACK_PROVIDERS when configured, else the plain clients
+        self.chat_client = chat_client_for()
+        self.async_chat_client = async_chat_client_for()
         self.matcher = matcher
         self.vector_db = vector_db
         self.MAX_HISTORY_TURNS = getattr(settings, 'MAX_HISTORY_TURNS', 4)
@@ -42,6 +128,30 @@ class LLMEngineAPI:
         """
         Generates response for a SPECIFIC client_id with History support.
         """
+        answer, prompts = self._prepare(user_query, client_id, chat_history)
+        if answer is not None:
+            return answer
+
+        system_prompt, full_user_prompt = prompts
+        return self.chat_client.generate_text(system_prompt, full_user_prompt, temperature=0.3)
+
+    def generate_response_stream(self, user_query: str, client_id: str, chat_history: List[Dict[str, str]] = None) -> Iterator[str]:
+        """
+        Streaming variant of generate_response. FAQ hits and fallbacks are yielded in one piece.
+        """
+        answer, prompts = self._prepare(user_query, client_id, chat_history)
+        if answer is not None:
+            yield answer
+            return
+
+        system_prompt, full_user_prompt = prompts
+        yield from self.chat_client.stream_text(system_prompt, full_user_prompt, temperature=0.3)
+
+    def _prepare(self, user_query: str, client_id: str, chat_history: List[Dict[str, str]] = None):
+        """
+        Runs the FAQ match and retrieval steps.
+        Returns (answer, None) when no LLM call is needed, else (None, (system_prompt, user_prompt)).
+        """
         print(f"\n📨 Query (Client: {client_id}): {user_query}")
         
         # --- PATH 1: FAQ MATCH (Client Specific) ---
@@ -49,136 +159,76 @@ class LLMEngineAPI:
         
         if match_data:
             print(f"⚡ FAQ Match Found! (Score: {score:.2f})")
-            return match_data['answer']
+            return match_data['answer'], None
         
         # --- PATH 2: RAG (Client Specific) ---
         print(f"📉 Low Match Score ({score:.2f}). RAG...")
 
         # Pass client_id to DB search
-        retrieved_docs = self.vector_db.search(client_id, user_query, limit=5)
+        retrieved_chunks = self.vector_db.search_chunks(client_id, user_query, limit=5)
         
-        if not retrieved_docs:
-            return "I apologize, but I don't have enough information to answer that."
-
-        context_text = "\n\n".join(retrieved_docs) 
-        context_text = context_text[:8000]
-
-        # History Processing
-        history_context = ""
-        if chat_history:
-            # Slice last N messages
-            recent_msgs = chat_history[-self.MAX_HISTORY_TURNS:]
-            history_lines = []
-            for msg in recent_msgs:
-                role = msg.get('role', 'unknown').capitalize()
-                content = msg.get('content', '')
-                history_lines.append(f"{role}: {content}")
-            history_context = "\n".join(history_lines)
-
-#         full_user_prompt = f"""
-# Conversation History:
-# {history_context}
-
-# Context Information:
-# {context_text}
-
-# User Question: {user_query}
-# """
-        
-#         return self.llm_client.generate_text(
-#             "You are an expert customer support chatbot. Answer the questions using Context and History only.", 
-#             full_user_prompt, 
-#             temperature=0.3
-#         )
-
-        full_user_prompt = f"""
-            Conversation History:
-            {history_context}
-
-            Context Information:
-            {context_text}
-
-            SYSTEM INSTRUCTIONS – TORONTO PHO CHATBOT
-            ------------------------------------------------------
-
-            You are the official Toronto Pho chatbot.
-            Always use friendly, warm, simple Canadian English — polite, helpful, and conversational, never robotic.
-            Keep all replies between **10–30 words**. Please answer in a cheerful tone and include emojis in your answers to maximize your expression.
-
-            Your goal:
-            Answer using only the provided Knowledge Base context and conversation history.
-
-            ------------------------------------------------------
-            CORE BEHAVIOUR
-            ------------------------------------------------------
-            - Use only official Toronto Pho Knowledge Base content.
-            - Never guess items, prices, or details.
-            - Never mix information between locations.
-            - Keep tone authentic, friendly, and clear.
-            - If intent is unclear, ask a simple clarifying question.
-            - Always use Canadian spelling and soft, polite phrasing.
-
-            ------------------------------------------------------
-            INTENT HANDLING
-            ------------------------------------------------------
-            Detect user intent:
-            - If question is about food, menu, or ordering → ask for location if not given.
-            - If question is about address, hours, phone, or directions → use `location.txt`.
-            - If topic is outside the restaurant’s scope → say you can help with menu, locations, or online ordering instead. 
-
-            ------------------------------------------------------
-            LOCATIONS
-            ------------------------------------------------------
-            Toronto Pho has five locations:
-            Orillia | Dufferin | Jane | Hamilton | Woodbridge
-
-            Once the user’s location is known, use only that location’s data source.
-
-            ------------------------------------------------------
-            MENU FILE MAPPING
-            ------------------------------------------------------
-            | Location   | Menu File             |
-            |-------------|----------------------|
-            | Orillia     | orillia_menu.txt     |
-            | Dufferin    | dufferin_menu.txt    |
-            | Jane        | jane_menu.txt        |
-            | Hamilton    | hamilton_menu.txt    |
-            | Woodbridge  | woodbridge_menu.txt  |
-
-            Search only the correct file for each location.
-
-            ------------------------------------------------------
-            MENU HANDLING
-            ------------------------------------------------------
-            - If user asks for “menu” or “categories”, describe available menu sections for that location.
-            - If user asks about a specific food, pull details (name, description, ingredients, price) from that file.
-            - Politely mention ordering options if available.
-
-            ------------------------------------------------------
-            LOCATION INFORMATION
-            ------------------------------------------------------
-            If asked about hours, address, or contact:
-            - Retrieve from `location.txt`.
-            - Example tone:
-            “Here are the hours for our Dufferin location   
-            Monday–Sunday: 11am–10pm  
-            Here’s the address and phone number too!”
-
-            ------------------------------------------------------
-            ABSOLUTE RULES
-            ------------------------------------------------------
-            Do not guess, mix, or invent details.
-            Do not create fake items, hours, or prices.
-            Always use verified menu or location data.
-            Stay friendly and concise (10–30 words).
-            Keep polite, Canadian tone at all times.
-
-            ------------------------------------------------------
-
-            User Question: {user_query}
+        return self._build_prompt(user_query, retrieved_chunks, chat_history)
+
+    async def agenerate_response(self, user_query: str, client_id: str, chat_history: List[Dict[str, str]] = None):
+        """
+        Async version of generate_response: embeddings and the completion are awaited
+        and DB access runs in worker threads, so the event loop is never blocked.
         """
+        answer, prompts = await self._aprepare(user_query, client_id, chat_history)
+        if answer is not None:
+            return answer
+
+        system_prompt, full_user_prompt = prompts
+        return await self.async_chat_client.generate_text(system_prompt, full_user_prompt, temperature=0.3)
+
+    async def agenerate_response_stream(self, user_query: str, client_id: str, chat_history: List[Dict[str, str]] = None) -> AsyncIterator[str]:
+        """Async streaming variant of generate_response."""
+        answer, prompts = await self._aprepare(user_query, client_id, chat_history)
+        if answer is not None:
+            yield answer
+            return
+
+        system_prompt, full_user_prompt = prompts
+        async for token in self.async_chat_client.stream_text(system_prompt, full_user_prompt, temperature=0.3):
+            yield token
+
+    async def _aprepare(self, user_query: str, client_id: str, chat_history: List[Dict[str, str]] = None):
+        """Async version of _prepare."""
+        print(f"\n📨 Query (Client: {client_id}): {user_query}")
+
+        match_data, score = await self.matcher.afind_best_match(user_query, client_id)
+
+        if match_data:
+            print(f"⚡ FAQ Match Found! (Score: {score:.2f})")
+            return match_data['answer'], None
+
+        print(f"📉 Low Match Score ({score:.2f}). RAG...")
+
+        retrieved_chunks = await self.vector_db.asearch_chunks(client_id, user_query, limit=5)
+
+        return self._build_prompt(user_query, retrieved_chunks, chat_history)
+
+    def _build_prompt(self, user_query: str, retrieved_chunks: List[RetrievedChunk],
+                      chat_history: List[Dict[str, str]] = None):
+        """Builds the RAG prompt from retrieved chunks and history (same return shape as _prepare)."""
+        if not retrieved_chunks:
+            return "I apologize, but I don't have enough information to answer that.", None
+
+        # Whole chunks in retrieval order, labelled by source, within the chat model's context token budget
+        context_text = pack_context(retrieved_chunks, context_token_budget(self.llm_client.chat_model))
+
+        history_context = format_history(chat_history, self.MAX_HISTORY_TURNS)
 
-        return self.llm_client.generate_text("You are our official chatbot. Follow the system instructions inside the prompt.", full_user_prompt, temperature=0.3)
+        # Fixed instructions go in the system prefix (cacheable across turns);
+        # history, retrieved context and the question follow in the user message.
+        prompt = build_prompt(
+            "You are our official chatbot. Follow the system instructions below.",
+            user_query,
+            context=context_text,
+            history=history_context,
+            static_sections=[TORONTO_PHO_INSTRUCTIONS],
+        )
+        return None, (prompt.system_sections, prompt.user)
 
 
 
@@ -18,61 +18,888 @@ if not settings.configured:
 #-----------------------------------
 
 
-from openai import OpenAI
-from anthropic import Anthropic
+
+import asyncio
+import contextvars
+import random
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import AsyncIterator, Callable, Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
+import anthropic
+import httpx
+import openai
+from openai import AsyncOpenAI, OpenAI
+from anthropic import Anthropic, AsyncAnthropic
 # from config import settings
 from django.conf import settings
 
-class UnifiedLLMClient:
+try:
+    from .embedding_backends import get_embedding_backend
+    from .embedding_cache import get_embedding_cache, make_cache_key, normalize_text
+    from .singleflight import AsyncSingleFlight, SingleFlight, make_flight_key
+    from .usage_ledger import current_attribution, estimate_cost, usage_ledger
+except ImportError:
+    from embedding_backends import get_embedding_backend
+    from embedding_cache import get_embedding_cache, make_cache_key, normalize_text
+    from singleflight import AsyncSingleFlight, SingleFlight, make_flight_key
+    from usage_ledger import current_attribution, estimate_cost, usage_ledger
+
+
+# Request priorities for the shared provider quota: chat traffic goes first
+PRIORITY_INTERACTIVE = "interactive"
+PRIORITY_BULK = "bulk"
+
+# Completion budget assumed when reserving tokens for a chat request
+MAX_COMPLETION_TOKENS = 1024
+
+
+def _estimate_tokens(text: str) -> int:
+    """Cheap token estimate (~4 characters per token) used to size embedding batches."""
+    return max(1, len(text) // 4)
+
+
+def _system_sections(system_prompt: Union[str, Sequence[str]]) -> List[str]:
+    """System prompts may be one string or an ordered list of stable sections (see prompt_builder)."""
+    if isinstance(system_prompt, str):
+        return [system_prompt]
+    return [s for s in system_prompt if s]
+
+
+def _http_options() -> dict:
+    """Keep-alive pool and timeout settings applied to every provider HTTP client."""
+    return {
+        "limits": httpx.Limits(
+            max_connections=getattr(settings, 'LLM_HTTP_MAX_CONNECTIONS', 100),
+            max_keepalive_connections=getattr(settings, 'LLM_HTTP_MAX_KEEPALIVE', 20),
+            keepalive_expiry=getattr(settings, 'LLM_HTTP_KEEPALIVE_EXPIRY', 60.0),
+        ),
+        "timeout": httpx.Timeout(getattr(settings, 'LLM_HTTP_TIMEOUT', 60.0), connect=5.0),
+    }
+
+
+# ==========================================
+# RATE LIMITING & RETRIES
+# ==========================================
+
+_DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|s|m|h)")
+
+
+def _parse_reset(value: Optional[str]) -> Optional[float]:
+    """
+    Parses a rate-limit reset header into seconds from now.
+    Handles OpenAI durations ("1m30s", "20ms"), plain seconds and Anthropic RFC 3339 timestamps.
+    """
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    parts = _DURATION_PART.findall(value)
+    if parts:
+        scale = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+        return sum(float(n) * scale[unit] for n, unit in parts)
+    try:
+        reset_at = datetime.fromisoformat(value.replace("Z", "+00:00"))
+        return max(0.0, (reset_at - datetime.now(timezone.utc)).total_seconds())
+    except ValueError:
+        return None
+
+
+def _header_int(headers, *names) -> Optional[int]:
+    for name in names:
+        value = headers.get(name)
+        if value is not None:
+            try:
+                return int(float(value))
+            except ValueError:
+                pass
+    return None
+
+
+class _Budget:
+    """Requests-per-minute and tokens-per-minute token buckets for one (provider, model)."""
+
+    def __init__(self, rpm: int, tpm: int):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.requests = float(rpm)
+        self.tokens = float(tpm)
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.waiting_interactive = 0
+
+    def _refill(self, now: float):
+        elapsed = now - self.updated
+        self.requests = min(self.rpm, self.requests + elapsed * self.rpm / 60.0)
+        self.tokens = min(self.tpm, self.tokens + elapsed * self.tpm / 60.0)
+        self.updated = now
+
+    def reserve(self, tokens: int, priority: str, reserve_fraction: float, now: float) -> float:
+        """Takes capacity for one request. Returns 0 when granted, else the seconds to wait."""
+        self._refill(now)
+        if now < self.blocked_until:
+            return self.blocked_until - now
+
+        # A single request larger than the whole bucket must still be able to go
+        tokens = min(tokens, self.tpm)
+        floor_requests = floor_tokens = 0.0
+        if priority == PRIORITY_BULK:
+            # Bulk work yields to queued chat requests and leaves a slice of quota for them
+            if self.waiting_interactive:
+                return 0.05
+            floor_requests = min(self.rpm * reserve_fraction, self.rpm - 1)
+            floor_tokens = self.tpm * reserve_fraction
+            # ...so a full bucket above that slice is the most a bulk request can wait for
+            tokens = min(tokens, max(0.0, self.tpm - floor_tokens))
+
+        missing_requests = 1 + floor_requests - self.requests
+        missing_tokens = tokens + floor_tokens - self.tokens
+        if missing_requests <= 0 and missing_tokens <= 0:
+            self.requests -= 1
+            self.tokens -= tokens
+            return 0.0
+        return max(missing_requests * 60.0 / self.rpm, missing_tokens * 60.0 / self.tpm, 0.01)
+
+    def observe(self, headers, now: float):
+        """Aligns the local buckets with the provider's view (shared by every worker process)."""
+        remaining_requests = _header_int(headers, "x-ratelimit-remaining-requests", "anthropic-ratelimit-requests-remaining")
+        remaining_tokens = _header_int(headers, "x-ratelimit-remaining-tokens", "anthropic-ratelimit-tokens-remaining")
+        self._refill(now)
+        if remaining_requests is not None:
+            self.requests = min(self.requests, remaining_requests)
+            if remaining_requests <= 0:
+                reset = _parse_reset(headers.get("x-ratelimit-reset-requests") or headers.get("anthropic-ratelimit-requests-reset"))
+                if reset:
+                    self.blocked_until = max(self.blocked_until, now + reset)
+        if remaining_tokens is not None:
+            self.tokens = min(self.tokens, remaining_tokens)
+            if remaining_tokens <= 0:
+                reset = _parse_reset(headers.get("x-ratelimit-reset-tokens") or headers.get("anthropic-ratelimit-tokens-reset"))
+                if reset:
+                    self.blocked_until = max(self.blocked_until, now + reset)
+
+    def block_for(self, seconds: float, now: float):
+        self.blocked_until = max(self.blocked_until, now + seconds)
+
+
+def is_transient_error(error: Exception) -> bool:
+    """
+    Timeouts, connection failures, 429s and 5xx: worth retrying, failing over, and
+    counting against a provider's health. Other errors (400/401/404...) are the
+    request's fault and would fail the same way anywhere.
+    """
+    if isinstance(error, (
+        openai.APIConnectionError, anthropic.APIConnectionError,  # includes timeouts
+        httpx.TransportError, TimeoutError, ConnectionError,
+    )):
+        return True
+    status_code = getattr(error, "status_code", None)
+    return status_code == 429 or (status_code is not None and status_code >= 500)
+
+
+class RateLimitScheduler:
+    """
+    Process-wide scheduler for provider calls.
+
+    Every call first reserves capacity from the RPM/TPM budget of its
+    (provider, model); callers that do not fit are queued (they sleep) rather
+    than failed, and interactive callers are served before bulk ones. Budgets
+    are corrected from the provider's rate-limit headers. Rate limits, timeouts,
+    connection errors and 5xx responses are retried with jittered exponential
+    backoff, honouring `retry-after` when the provider sends it.
+    """
+
     def __init__(self):
-        self.provider = settings.API_PROVIDER
+        self.limits = getattr(settings, 'LLM_RATE_LIMITS', {})
+        self.default_rpm = getattr(settings, 'LLM_DEFAULT_RPM', 3000)
+        self.default_tpm = getattr(settings, 'LLM_DEFAULT_TPM', 1000000)
+        self.reserve_fraction = getattr(settings, 'LLM_INTERACTIVE_RESERVE', 0.1)
+        self.max_retries = getattr(settings, 'LLM_MAX_RETRIES', 5)
+        self.backoff_base = getattr(settings, 'LLM_BACKOFF_BASE', 0.5)
+        self.backoff_max = getattr(settings, 'LLM_BACKOFF_MAX', 30.0)
+        self._budgets = {}
+        self._lock = threading.Lock()
+
+    def _budget(self, provider: str, model: str) -> _Budget:
+        key = f"{provider}:{model}"
+        budget = self._budgets.get(key)
+        if budget is None:
+            limits = self.limits.get(key) or self.limits.get(provider) or {}
+            budget = self._budgets.setdefault(key, _Budget(
+                rpm=limits.get("rpm", self.default_rpm),
+                tpm=limits.get("tpm", self.default_tpm),
+            ))
+        return budget
+
+    def _reserve(self, budget: _Budget, tokens: int, priority: str) -> float:
+        with self._lock:
+            return budget.reserve(tokens, priority, self.reserve_fraction, time.monotonic())
+
+    def _set_waiting(self, budget: _Budget, priority: str, delta: int):
+        if priority == PRIORITY_INTERACTIVE:
+            with self._lock:
+                budget.waiting_interactive += delta
+
+    def acquire(self, provider: str, model: str, tokens: int, priority: str = PRIORITY_INTERACTIVE):
+        """Blocks until the budget admits the request."""
+        budget = self._budget(provider, model)
+        wait = self._reserve(budget, tokens, priority)
+        if not wait:
+            return
+        self._set_waiting(budget, priority, 1)
+        try:
+            while wait:
+                time.sleep(min(wait, 1.0))
+                wait = self._reserve(budget, tokens, priority)
+        finally:
+            self._set_waiting(budget, priority, -1)
+
+    async def aacquire(self, provider: str, model: str, tokens: int, priority: str = PRIORITY_INTERACTIVE):
+        budget = self._budget(provider, model)
+        wait = self._reserve(budget, tokens, priority)
+        if not wait:
+            return
+        self._set_waiting(budget, priority, 1)
+        try:
+            while wait:
+                await asyncio.sleep(min(wait, 1.0))
+                wait = self._reserve(budget, tokens, priority)
+        finally:
+            self._set_waiting(budget, priority, -1)
+
+    def observe(self, provider: str, model: str, headers):
+        if headers:
+            budget = self._budget(provider, model)
+            with self._lock:
+                budget.observe(headers, time.monotonic())
+
+    def _retry_delay(self, provider: str, model: str, error: Exception, attempt: int) -> Optional[float]:
+        """Returns the backoff before the next attempt, or None when the error is final."""
+        if attempt >= self.max_retries:
+            return None
+
+        if not is_transient_error(error):
+            return None
+        status_code = getattr(error, "status_code", None)
+
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+        response = getattr(error, "response", None)
+        if response is not None:
+            retry_after = _parse_reset(response.headers.get("retry-after"))
+            if retry_after is not None:
+                delay = max(delay, retry_after)
+            self.observe(provider, model, response.headers)
+        if status_code == 429:
+            # Hold every caller of this budget back, not just the one that was rejected
+            budget = self._budget(provider, model)
+            with self._lock:
+                budget.block_for(delay, time.monotonic())
+        return delay
+
+    def run(self, call: Callable, provider: str, model: str, tokens: int, priority: str = PRIORITY_INTERACTIVE):
+        """Runs `call` (returning a raw SDK response) under the budget with retries."""
+        attempt = 0
+        while True:
+            self.acquire(provider, model, tokens, priority)
+            try:
+                raw = call()
+            except Exception as e:
+                delay = self._retry_delay(provider, model, e, attempt)
+                if delay is None:
+                    raise
+                attempt += 1
+                print(f"⏳ {provider}/{model} retry {attempt}/{self.max_retries} in {delay:.1f}s: {e}")
+                time.sleep(delay)
+                continue
+            self.observe(provider, model, getattr(raw, "headers", None))
+            return raw
+
+    async def arun(self, call: Callable, provider: str, model: str, tokens: int, priority: str = PRIORITY_INTERACTIVE):
+        """Async version of run; `call` returns an awaitable raw SDK response."""
+        attempt = 0
+        while True:
+            await self.aacquire(provider, model, tokens, priority)
+            try:
+                raw = await call()
+            except Exception as e:
+                delay = self._retry_delay(provider, model, e, attempt)
+                if delay is None:
+                    raise
+                attempt += 1
+                print(f"⏳ {provider}/{model} retry {attempt}/{self.max_retries} in {delay:.1f}s: {e}")
+                await asyncio.sleep(delay)
+                continue
+            self.observe(provider, model, getattr(raw, "headers", None))
+            return raw
+
+
+scheduler = RateLimitScheduler()
+
+
+# ==========================================
+# CLIENTS
+# ==========================================
+
+class _BaseLLMClient:
+    """Provider configuration and request shaping shared by the sync and async clients."""
+
+    def __init__(self, provider: Optional[str] = None):
+        # Default: the configured API_PROVIDER. Other providers (failover targets) take their
+        # key / base URL from LLM_PROVIDER_API_KEYS / LLM_PROVIDER_BASE_URLS.
+        self.provider = provider or settings.API_PROVIDER
         self.chat_model = settings.CHAT_MODEL
         self.embedding_model = settings.EMBEDDING_MODEL
-        self.api_key = settings.API_KEY
-        self.base_url = settings.BASE_URL
+        if self.provider == settings.API_PROVIDER:
+            self.api_key = settings.API_KEY
+            self.base_url = settings.BASE_URL
+        else:
+            self.api_key = getattr(settings, 'LLM_PROVIDER_API_KEYS', {}).get(self.provider, "")
+            self.base_url = getattr(settings, 'LLM_PROVIDER_BASE_URLS', {}).get(self.provider)
 
+        # Embedding batching limits (per request) and number of batches sent in parallel
+        self.embedding_batch_size = getattr(settings, 'EMBEDDING_BATCH_SIZE', 256)
+        self.embedding_batch_tokens = getattr(settings, 'EMBEDDING_BATCH_TOKENS', 100000)
+        self.embedding_concurrency = getattr(settings, 'EMBEDDING_CONCURRENCY', 4)
+
+        # Local CPU embedding backend (None = embed through the API provider)
+        self.embedding_backend = get_embedding_backend()
+        if self.embedding_backend:
+            self.embedding_batch_size = getattr(settings, 'LOCAL_EMBEDDING_BATCH_SIZE', 32)
+            self.embedding_concurrency = getattr(settings, 'LOCAL_EMBEDDING_THREADS', 4)
+        self.embedding_model_id = self.embedding_backend.model_id if self.embedding_backend else self.embedding_model
+
+        # Shared on-disk embedding cache (None when disabled)
+        self.embedding_cache = get_embedding_cache()
+
+        # Retries are owned by the scheduler, so SDK-level retries are disabled
+        self.scheduler = scheduler
+        self.client = self._create_client()
+
+    def _create_client(self):
+        raise NotImplementedError
+
+    def _check_embedding_support(self):
+        if self.provider == "claude" and not self.embedding_backend:
+             # Claude does not currently have a public embedding API in the SDK.
+             # You might need to use a separate provider for embeddings if using Claude for Chat.
+             raise NotImplementedError("Claude SDK does not support embeddings directly. Use OpenAI or Mistral, or set EMBEDDING_BACKEND to a local backend.")
+
+    def _make_embedding_batches(self, texts: List[str]) -> List[Tuple[int, List[str]]]:
+        """Splits texts into contiguous (start_index, batch) groups bounded by input count and tokens."""
+        batches = []
+        start, current, current_tokens = 0, [], 0
+        for i, text in enumerate(texts):
+            tokens = _estimate_tokens(text)
+            if current and (len(current) >= self.embedding_batch_size or current_tokens + tokens > self.embedding_batch_tokens):
+                batches.append((start, current))
+                start, current, current_tokens = i, [], 0
+            current.append(text)
+            current_tokens += tokens
+        if current:
+            batches.append((start, current))
+        return batches
+
+    def _lookup_embeddings(self, texts: List[str]) -> Tuple[List[str], Dict[str, List[float]], Dict[str, str]]:
+        """
+        Normalizes texts and checks the embedding cache.
+        Returns (keys in input order, cached vectors by key, distinct missing texts by key).
+        """
+        # Empty strings are rejected by the embeddings endpoint
+        cleaned = [normalize_text(text) or " " for text in texts]
+        keys = [make_cache_key(self.embedding_model_id, text) for text in cleaned]
+
+        cached = self.embedding_cache.get_many(keys) if self.embedding_cache else {}
+
+        # Embed each distinct missing text once (repeated boilerplate rows share a key)
+        missing = {}
+        for key, text in zip(keys, cleaned):
+            if key not in cached and key not in missing:
+                missing[key] = text
+        return keys, cached, missing
+
+    def _store_embeddings(self, fresh: Dict[str, List[float]]):
+        if self.embedding_cache and fresh:
+            self.embedding_cache.put_many(fresh)
+
+    @staticmethod
+    def _batch_vectors(response) -> List[List[float]]:
+        # The API returns one item per input with its index; sort to be safe
+        return [item.embedding for item in sorted(response.data, key=lambda d: d.index)]
+
+    def _chat_params(self, system_prompt: Union[str, Sequence[str]], user_prompt: str, temperature: float,
+                     json_mode: bool = False, model: Optional[str] = None) -> dict:
+        """
+        Builds provider request params with the stable system prefix first.
+
+        For Claude each system section becomes a text block and the last one carries
+        a cache_control breakpoint, so the whole stable prefix is cached across turns.
+        OpenAI caches identical prefixes automatically; sections are joined unchanged.
+        """
+        sections = _system_sections(system_prompt)
         if self.provider == "claude":
-            self.client = Anthropic(api_key=self.api_key)
-        else:
-            # Mistral, DeepSeek, and OpenAI use the OpenAI SDK
-            self.client = OpenAI(api_key=self.api_key, base_url=self.base_url)
+            blocks = [{"type": "text", "text": text} for text in sections]
+            if blocks and getattr(settings, 'PROMPT_CACHE_ENABLED', True):
+                blocks[-1]["cache_control"] = {"type": "ephemeral"}
+            return {
+                "model": model or self.chat_model,
+                "max_tokens": MAX_COMPLETION_TOKENS,
+                "temperature": temperature,
+                "system": blocks,
+                "messages": [{"role": "user", "content": user_prompt}],
+            }
+
+        params = {
+            "model": model or self.chat_model,
+            "messages": [
+                {"role": "system", "content": "\n\n".join(sections)},
+                {"role": "user", "content": user_prompt}
+            ],
+            "temperature": temperature,
+        }
+        if json_mode and self.provider == "openai":
+            params["response_format"] = {"type": "json_object"}
+        return params
 
-    def get_embedding(self, text: str):
+    def _stream_params(self, params: dict) -> dict:
+        if self.provider == "openai":
+            # Ask for a final usage chunk so cached prompt tokens can be reported
+            return {**params, "stream": True, "stream_options": {"include_usage": True}}
+        return {**params, "stream": True}
+
+    @staticmethod
+    def _chat_tokens(system_prompt: Union[str, Sequence[str]], user_prompt: str) -> int:
+        """Tokens reserved against the TPM budget for one completion (prompt + max output)."""
+        system_tokens = sum(_estimate_tokens(s) for s in _system_sections(system_prompt))
+        return system_tokens + _estimate_tokens(user_prompt) + MAX_COMPLETION_TOKENS
+
+    def _chat_api(self):
+        return self.client.messages if self.provider == "claude" else self.client.chat.completions
+
+    def _response_text(self, response) -> str:
+        if self.provider == "claude":
+            return response.content[0].text
+        return response.choices[0].message.content
+
+    def _stream_delta(self, chunk) -> Optional[str]:
+        """Extracts the text delta from one streamed event/chunk of either provider."""
+        if self.provider == "claude":
+            if chunk.type == "content_block_delta" and getattr(chunk.delta, "type", None) == "text_delta":
+                return chunk.delta.text
+            return None
+        if chunk.choices and chunk.choices[0].delta.content:
+            return chunk.choices[0].delta.content
+        return None
+
+    def _usage(self, usage) -> Dict[str, int]:
+        """
+        Normalizes a provider usage object to prompt / cached / cache-write / completion tokens.
+        `prompt_tokens` always includes the cached part, for both providers.
+        """
+        if usage is None:
+            return {}
+        if self.provider == "claude":
+            cached = getattr(usage, "cache_read_input_tokens", None) or 0
+            written = getattr(usage, "cache_creation_input_tokens", None) or 0
+            return {
+                "prompt_tokens": (getattr(usage, "input_tokens", None) or 0) + cached + written,
+                "cached_tokens": cached,
+                "cache_write_tokens": written,
+                "completion_tokens": getattr(usage, "output_tokens", None) or 0,
+            }
+        details = getattr(usage, "prompt_tokens_details", None)
+        return {
+            "prompt_tokens": getattr(usage, "prompt_tokens", None) or 0,
+            "cached_tokens": (getattr(details, "cached_tokens", None) or 0) if details else 0,
+            "cache_write_tokens": 0,
+            "completion_tokens": getattr(usage, "completion_tokens", None) or 0,
+        }
+
+    def _stream_usage(self, chunk, usage: Dict[str, int]):
+        """Accumulates usage reported by streamed events (Claude: message_start/delta, OpenAI: final chunk)."""
+        if self.provider == "claude":
+            if chunk.type == "message_start":
+                usage.update(self._usage(chunk.message.usage))
+            elif chunk.type == "message_delta" and getattr(chunk, "usage", None):
+                usage["completion_tokens"] = chunk.usage.output_tokens or 0
+        elif getattr(chunk, "usage", None):
+            usage.update(self._usage(chunk.usage))
+
+    def _log_usage(self, model: str, usage: Dict[str, int]):
+        if not usage:
+            return
+        prompt = usage["prompt_tokens"]
+        hit = usage["cached_tokens"] / prompt if prompt else 0.0
+        print(
+            f"🧾 {self.provider}:{model} prompt={prompt} cached={usage['cached_tokens']} ({hit:.0%}) "
+            f"cache_write={usage['cache_write_tokens']} completion={usage['completion_tokens']}"
+        )
+
+    @staticmethod
+    def _embedding_usage(response) -> Dict[str, int]:
+        usage = getattr(response, "usage", None)
+        return {"prompt_tokens": getattr(usage, "prompt_tokens", None) or 0} if usage else {}
+
+    def _record_usage(self, call_type: str, model: str, started: float, usage: Optional[Dict[str, int]] = None,
+                      outcome: str = "ok", first_token_at: Optional[float] = None, provider: Optional[str] = None,
+                      attribution: Optional[Dict[str, str]] = None):
+        """Queues one usage-ledger row for a finished provider call (latency measured from `started`)."""
+        if usage_ledger is None:
+            return
+        usage = usage or {}
+        tokens = {
+            "prompt_tokens": usage.get("prompt_tokens", 0),
+            "cached_tokens": usage.get("cached_tokens", 0),
+            "cache_write_tokens": usage.get("cache_write_tokens", 0),
+            "completion_tokens": usage.get("completion_tokens", 0),
+        }
+        if attribution is None:
+            attribution = current_attribution()
+        usage_ledger.record(
+            provider=provider or self.provider,
+            model=model,
+            call_type=call_type,
+            operation=attribution.get("operation", ""),
+            agent_id=attribution.get("agent_id"),
+            organization_id=attribution.get("organization_id"),
+            cost_usd=estimate_cost(model, **tokens) if provider is None else None,
+            latency_ms=int((time.monotonic() - started) * 1000),
+            first_token_ms=int((first_token_at - started) * 1000) if first_token_at else None,
+            outcome=outcome,
+            **tokens,
+        )
+
+
+class UnifiedLLMClient(_BaseLLMClient):
+    def __init__(self, provider: Optional[str] = None):
+        super().__init__(provider)
+        # Concurrent identical embedding / completion requests share one upstream call
+        self.flights = SingleFlight()
+
+    def _create_client(self):
+        if self.provider == "claude":
+            return Anthropic(api_key=self.api_key, base_url=self.base_url, max_retries=0, http_client=anthropic.DefaultHttpxClient(**_http_options()))
+        # Mistral, DeepSeek, and OpenAI use the OpenAI SDK
+        return OpenAI(api_key=self.api_key, base_url=self.base_url, max_retries=0, http_client=openai.DefaultHttpxClient(**_http_options()))
+
+    def get_embedding(self, text: str, priority: str = PRIORITY_INTERACTIVE):
         """Generates vector embeddings for semantic search."""
+        return self.get_embeddings([text], priority=priority)[0]
+
+    def get_embeddings(self, texts: List[str], priority: str = PRIORITY_BULK) -> List[List[float]]:
+        """
+        Generates embeddings for many texts with batched, concurrent requests.
+
+        Texts are normalized and looked up in the embedding cache first; only
+        distinct cache misses are sent to the provider. Misses are grouped into
+        batches limited by EMBEDDING_BATCH_SIZE inputs and EMBEDDING_BATCH_TOKENS
+        (estimated) tokens, up to EMBEDDING_CONCURRENCY batches are in flight at
+        once, and the returned list follows the order of `texts`.
+        """
+        if not texts:
+            return []
+        self._check_embedding_support()
+
+        keys, cached, missing = self._lookup_embeddings(texts)
+        if missing:
+            flight_key = make_flight_key("embed", self.embedding_model_id, list(missing.keys()))
+            fresh = self.flights.do(flight_key, lambda: self._embed_and_store(missing, priority))
+            cached.update(fresh)
+
+        return [cached[key] for key in keys]
+
+    def _embed_and_store(self, missing: Dict[str, str], priority: str) -> Dict[str, List[float]]:
+        fresh = dict(zip(missing.keys(), self._embed_texts(list(missing.values()), priority)))
+        self._store_embeddings(fresh)
+        return fresh
+
+    def _embed_batch(self, batch: Tuple[int, List[str]], priority: str) -> Tuple[int, List[List[float]]]:
+        start, items = batch
+        started = time.monotonic()
+        if self.embedding_backend:
+            vectors = self.embedding_backend.embed(items)
+            self._record_usage("embedding", self.embedding_model_id, started, provider="local")
+            return start, vectors
+        try:
+            raw = self.scheduler.run(
+                lambda: self.client.embeddings.with_raw_response.create(input=items, model=self.embedding_model),
+                self.provider, self.embedding_model, sum(_estimate_tokens(t) for t in items), priority
+            )
+        except Exception:
+            self._record_usage("embedding", self.embedding_model, started, outcome="error")
+            raise
+        response = raw.parse()
+        self._record_usage("embedding", self.embedding_model, started, self._embedding_usage(response))
+        return start, self._batch_vectors(response)
+
+    def _embed_texts(self, texts: List[str], priority: str) -> List[List[float]]:
+        """Sends texts to the provider in batches and returns vectors in input order."""
+        batches = self._make_embedding_batches(texts)
+        if len(batches) == 1:
+            _, vectors = self._embed_batch(batches[0], priority)
+            return vectors
+
+        print(f"⚙️ Embedding {len(texts)} texts in {len(batches)} batches...")
+        results = [None] * len(texts)
+        workers = max(1, min(self.embedding_concurrency, len(batches)))
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            # Each batch runs in a copy of the caller's context so usage stays attributed
+            futures = [
+                pool.submit(contextvars.copy_context().run, self._embed_batch, batch, priority)
+                for batch in batches
+            ]
+            for future in futures:
+                start, vectors = future.result()
+                results[start:start + len(vectors)] = vectors
+        return results
+
+    def generate_text(self, system_prompt: Union[str, Sequence[str]], user_prompt: str, temperature: float = 0.5,
+                      json_mode: bool = False, priority: str = PRIORITY_INTERACTIVE, model: Optional[str] = None):
+        params = self._chat_params(system_prompt, user_prompt, temperature, json_mode, model)
+        flight_key = make_flight_key("chat", self.provider, params)
+        return self.flights.do(flight_key, lambda: self._generate(params, system_prompt, user_prompt, priority))
+
+    def complete(self, system_prompt: Union[str, Sequence[str]], user_prompt: str, temperature: float = 0.5,
+                 json_mode: bool = False, priority: str = PRIORITY_INTERACTIVE, model: Optional[str] = None) -> str:
+        """
+        Like generate_text, but provider errors are raised instead of returning None and
+        identical calls are not coalesced. Used by the failover layer, which needs both.
+        """
+        params = self._chat_params(system_prompt, user_prompt, temperature, json_mode, model)
+        return self._generate(params, system_prompt, user_prompt, priority, raise_errors=True)
+
+    def _generate(self, params: dict, system_prompt, user_prompt: str, priority: str, raise_errors: bool = False):
+        started = time.monotonic()
+        try:
+            raw = self.scheduler.run(
+                lambda: self._chat_api().with_raw_response.create(**params),
+                self.provider, params["model"], self._chat_tokens(system_prompt, user_prompt), priority
+            )
+            response = raw.parse()
+            usage = self._usage(getattr(response, "usage", None))
+            self._log_usage(params["model"], usage)
+            self._record_usage("chat", params["model"], started, usage)
+            return self._response_text(response)
+
+        except Exception as e:
+            print(f"❌ API Error: {e}")
+            self._record_usage("chat", params["model"], started, outcome="error")
+            if raise_errors:
+                raise
+            return None
+
+    def stream_text(self, system_prompt: Union[str, Sequence[str]], user_prompt: str, temperature: float = 0.5,
+                    priority: str = PRIORITY_INTERACTIVE, model: Optional[str] = None,
+                    raise_errors: bool = False) -> Iterator[str]:
+        """
+        Streaming variant of generate_text: yields text deltas as the provider produces them.
+        Opening the stream is retried like any other call; on API errors the stream simply
+        ends (mirrors generate_text returning None) unless `raise_errors` is set.
+        Usage attribution is captured when this is called, not when iteration starts.
+        """
+        return self._stream(system_prompt, user_prompt, temperature, priority, current_attribution(), model, raise_errors)
+
+    def _stream(self, system_prompt, user_prompt: str, temperature: float, priority: str,
+                attribution: Dict[str, str], model: Optional[str] = None, raise_errors: bool = False) -> Iterator[str]:
+        params = self._chat_params(system_prompt, user_prompt, temperature, model=model)
+        usage = {}
+        started, first_token_at = time.monotonic(), None
+        # Stays "cancelled" if the consumer stops iterating before the stream ends
+        outcome = "cancelled"
+        try:
+            raw = self.scheduler.run(
+                lambda: self._chat_api().with_raw_response.create(**self._stream_params(params)),
+                self.provider, params["model"], self._chat_tokens(system_prompt, user_prompt), priority
+            )
+            for chunk in raw.parse():
+                self._stream_usage(chunk, usage)
+                text = self._stream_delta(chunk)
+                if text:
+                    first_token_at = first_token_at or time.monotonic()
+                    yield text
+            outcome = "ok"
+            self._log_usage(params["model"], usage)
+
+        except Exception as e:
+            outcome = "error"
+            print(f"❌ API Streaming Error: {e}")
+            if raise_errors:
+                raise
+
+        finally:
+            self._record_usage("stream", params["model"], started, usage, outcome, first_token_at, attribution=attribution)
+
+
+class AsyncUnifiedLLMClient(_BaseLLMClient):
+    """
+    Async twin of UnifiedLLMClient built on the AsyncOpenAI / AsyncAnthropic SDKs.
+    Same configuration, cache and return values; every network call is awaitable.
+    """
+
+    def __init__(self, provider: Optional[str] = None):
+        super().__init__(provider)
+        self.flights = AsyncSingleFlight()
+
+    def _create_client(self):
         if self.provider == "claude":
-             # Claude does not currently have a public embedding API in the SDK.
-             # You might need to use a separate provider for embeddings if using Claude for Chat.
-             raise NotImplementedError("Claude SDK does not support embeddings directly. Use OpenAI or Mistral for this part.")
-        
-        text = text.replace("\n", " ")
-        return self.client.embeddings.create(input=[text], model=self.embedding_model).data[0].embedding
+            return AsyncAnthropic(api_key=self.api_key, base_url=self.base_url, max_retries=0, http_client=anthropic.DefaultAsyncHttpxClient(**_http_options()))
+        return AsyncOpenAI(api_key=self.api_key, base_url=self.base_url, max_retries=0, http_client=openai.DefaultAsyncHttpxClient(**_http_options()))
+
+    async def get_embedding(self, text: str, priority: str = PRIORITY_INTERACTIVE):
+        return (await self.get_embeddings([text], priority=priority))[0]
+
+    async def get_embeddings(self, texts: List[str], priority: str = PRIORITY_BULK) -> List[List[float]]:
+        if not texts:
+            return []
+        self._check_embedding_support()
+
+        # The SQLite embedding cache is blocking I/O; keep it off the event loop
+        keys, cached, missing = await asyncio.to_thread(self._lookup_embeddings, texts)
+        if missing:
+            flight_key = make_flight_key("embed", self.embedding_model_id, list(missing.keys()))
+            fresh = await self.flights.do(flight_key, lambda: self._embed_and_store(missing, priority))
+            cached.update(fresh)
+
+        return [cached[key] for key in keys]
+
+    async def _embed_and_store(self, missing: Dict[str, str], priority: str) -> Dict[str, List[float]]:
+        fresh = dict(zip(missing.keys(), await self._embed_texts(list(missing.values()), priority)))
+        await asyncio.to_thread(self._store_embeddings, fresh)
+        return fresh
+
+    async def _embed_texts(self, texts: List[str], priority: str) -> List[List[float]]:
+        batches = self._make_embedding_batches(texts)
+        semaphore = asyncio.Semaphore(max(1, self.embedding_concurrency))
+
+        async def embed(batch):
+            start, items = batch
+            async with semaphore:
+                started = time.monotonic()
+                if self.embedding_backend:
+                    # Local inference is CPU-bound; keep it off the event loop
+                    vectors = await asyncio.to_thread(self.embedding_backend.embed, items)
+                    self._record_usage("embedding", self.embedding_model_id, started, provider="local")
+                    return start, vectors
+                try:
+                    raw = await self.scheduler.arun(
+                        lambda: self.client.embeddings.with_raw_response.create(input=items, model=self.embedding_model),
+                        self.provider, self.embedding_model, sum(_estimate_tokens(t) for t in items), priority
+                    )
+                except Exception:
+                    self._record_usage("embedding", self.embedding_model, started, outcome="error")
+                    raise
+            response = raw.parse()
+            self._record_usage("embedding", self.embedding_model, started, self._embedding_usage(response))
+            return start, self._batch_vectors(response)
 
-    def generate_text(self, system_prompt: str, user_prompt: str, temperature: float = 0.5, json_mode: bool = False):
+        results = [None] * len(texts)
+        for start, vectors in await asyncio.gather(*(embed(batch) for batch in batches)):
+            results[start:start + len(vectors)] = vectors
+        return results
+
+    async def generate_text(self, system_prompt: Union[str, Sequence[str]], user_prompt: str, temperature: float = 0.5,
+                            json_mode: bool = False, priority: str = PRIORITY_INTERACTIVE, model: Optional[str] = None):
+        params = self._chat_params(system_prompt, user_prompt, temperature, json_mode, model)
+        flight_key = make_flight_key("chat", self.provider, params)
+        return await self.flights.do(flight_key, lambda: self._generate(params, system_prompt, user_prompt, priority))
+
+    async def complete(self, system_prompt: Union[str, Sequence[str]], user_prompt: str, temperature: float = 0.5,
+                       json_mode: bool = False, priority: str = PRIORITY_INTERACTIVE, model: Optional[str] = None) -> str:
+        params = self._chat_params(system_prompt, user_prompt, temperature, json_mode, model)
+        return await self._generate(params, system_prompt, user_prompt, priority, raise_errors=True)
+
+    async def _generate(self, params: dict, system_prompt, user_prompt: str, priority: str, raise_errors: bool = False):
+        started = time.monotonic()
         try:
-            if self.provider == "claude":
-                response = self.client.messages.create(
-                    model=self.chat_model,
-                    max_tokens=1024,
-                    temperature=temperature,
-                    system=system_prompt,
-                    messages=[{"role": "user", "content": user_prompt}]
-                )
-                return response.content[0].text
-            else:
-                params = {
-                    "model": self.chat_model,
-                    "messages": [
-                        {"role": "system", "content": system_prompt},
-                        {"role": "user", "content": user_prompt}
-                    ],
-                    "temperature": temperature,
-                }
-                if json_mode and self.provider == "openai":
-                    params["response_format"] = {"type": "json_object"}
-
-                response = self.client.chat.completions.create(**params)
-                return response.choices[0].message.content
+            raw = await self.scheduler.arun(
+                lambda: self._chat_api().with_raw_response.create(**params),
+                self.provider, params["model"], self._chat_tokens(system_prompt, user_prompt), priority
+            )
+            response = raw.parse()
+            usage = self._usage(getattr(response, "usage", None))
+            self._log_usage(params["model"], usage)
+            self._record_usage("chat", params["model"], started, usage)
+            return self._response_text(response)
 
         except Exception as e:
             print(f"❌ API Error: {e}")
-            return None
\ No newline at end of file
+            self._record_usage("chat", params["model"], started, outcome="error")
+            if raise_errors:
+                raise
+            return None
+
+    def stream_text(self, system_prompt: Union[str, Sequence[str]], user_prompt: str, temperature: float = 0.5,
+                    priority: str = PRIORITY_INTERACTIVE, model: Optional[str] = None,
+                    raise_errors: bool = False) -> AsyncIterator[str]:
+        return self._stream(system_prompt, user_prompt, temperature, priority, current_attribution(), model, raise_errors)
+
+    async def _stream(self, system_prompt, user_prompt: str, temperature: float, priority: str,
+                      attribution: Dict[str, str], model: Optional[str] = None,
+                      raise_errors: bool = False) -> AsyncIterator[str]:
+        params = self._chat_params(system_prompt, user_prompt, temperature, model=model)
+        usage = {}
+        started, first_token_at = time.monotonic(), None
+        # Stays "cancelled" if the consumer stops iterating before the stream ends
+        outcome = "cancelled"
+        try:
+            raw = await self.scheduler.arun(
+                lambda: self._chat_api().with_raw_response.create(**self._stream_params(params)),
+                self.provider, params["model"], self._chat_tokens(system_prompt, user_prompt), priority
+            )
+            async for chunk in raw.parse():
+                self._stream_usage(chunk, usage)
+                text = self._stream_delta(chunk)
+                if text:
+                    first_token_at = first_token_at or time.monotonic()
+                    yield text
+            outcome = "ok"
+            self._log_usage(params["model"], usage)
+
+        except Exception as e:
+            outcome = "error"
+            print(f"❌ API Streaming Error: {e}")
+            if raise_errors:
+                raise
+
+        finally:
+            self._record_usage("stream", params["model"], started, usage, outcome, first_token_at, attribution=attribution)
+
+
+# --- PROCESS-WIDE CLIENT REGISTRY ---
+# Provider SDK clients are thread-safe, so one instance per process is shared by
+# every module; this keeps a single keep-alive connection pool (and TLS sessions)
+# instead of one per caller.
+_registry_lock = threading.Lock()
+_registry = {}
+
+
+def _get_shared(key: str, factory):
+    client = _registry.get(key)
+    if client is None:
+        with _registry_lock:
+            client = _registry.get(key)
+            if client is None:
+                client = _registry[key] = factory()
+    return client
+
+
+def get_llm_client(provider: Optional[str] = None) -> UnifiedLLMClient:
+    """Returns the shared UnifiedLLMClient for this process (for `provider`, default API_PROVIDER)."""
+    if not provider or provider == settings.API_PROVIDER:
+        return _get_shared("sync", UnifiedLLMClient)
+    return _get_shared(f"sync:{provider}", lambda: UnifiedLLMClient(provider))
+
+
+def get_async_llm_client(provider: Optional[str] = None) -> AsyncUnifiedLLMClient:
+    """
+    Returns the shared AsyncUnifiedLLMClient for this process (for `provider`, default API_PROVIDER).
+    Its connection pool belongs to the event loop that first uses it (one loop per ASGI worker).
+    """
+    if not provider or provider == settings.API_PROVIDER:
+        return _get_shared("async", AsyncUnifiedLLMClient)
+    return _get_shared(f"async:{provider}", lambda: AsyncUnifiedLLMClient(provider))
@@ -1,13 +1,15 @@
+import asyncio
 import json
 import os
 import pickle
 import numpy as np
-from src.llm_gateway import UnifiedLLMClient
-from config import settings
+from src.llm_gateway import get_async_llm_client, get_llm_client
+from django.conf import settings
 
 class MatcherAPI:
     def __init__(self):
-        self.client = UnifiedLLMClient()
+        self.client = get_llm_client()
+        self.async_client = get_async_llm_client()
         # Dictionary to hold data for multiple clients
         # Structure: { 'client_id': { 'data': [...], 'embeddings': [...] } }
         self.client_cache = {} 
@@ -60,11 +62,8 @@ class MatcherAPI:
 
         if not cache_valid:
             print(f"⚙️ Computing embeddings for client: {client_id}")
-            embeddings = []
-            for item in faq_data:
-                anchor = item['questions'][0]
-                vector = self.client.get_embedding(anchor)
-                embeddings.append(vector)
+            anchors = [item['questions'][0] for item in faq_data]
+            embeddings = self.client.get_embeddings(anchors)
             
             # Save cache
             try:
@@ -99,6 +98,28 @@ class MatcherAPI:
             return None, 0.0
 
         query_vector = self.client.get_embedding(user_query)
+        return self._best_match(query_vector, faq_data, embeddings)
+
+    async def afind_best_match(self, user_query: str, client_id: str):
+        """
+        Async version of find_best_match. FAQ loading (file I/O, first-time
+        embedding) runs in a worker thread; the query embedding is awaited.
+        """
+        if client_id not in self.client_cache:
+            if not await asyncio.to_thread(self._load_client_data, client_id):
+                return None, 0.0
+
+        client_ctx = self.client_cache[client_id]
+        faq_data = client_ctx["data"]
+        embeddings = client_ctx["embeddings"]
+
+        if not faq_data:
+            return None, 0.0
+
+        query_vector = await self.async_client.get_embedding(user_query)
+        return self._best_match(query_vector, faq_data, embeddings)
+
+    def _best_match(self, query_vector, faq_data, embeddings):
         best_score = -1
         best_idx = -1
 
@@ -111,4 +132,4 @@ class MatcherAPI:
         if best_score >= settings.FAQ_SIMILARITY_THRESHOLD:
             return faq_data[best_idx], best_score
         
-        return None, best_score
\ No newline at end of file
+        return None, best_score
@@ -0,0 +1,310 @@
+import threading
+from collections import defaultdict
+from typing import Dict, Iterator, List, Optional, Sequence
+
+from django.conf import settings
+
+try:
+    from .usage_ledger import current_attribution, usage_context
+except ImportError:
+    from usage_ledger import current_attribution, usage_context
+
+# The fast model answers with exactly this when the context is not enough
+ESCALATE_MARKER = "[[ESCALATE]]"
+
+ESCALATE_INSTRUCTION = (
+    "If the Context Information does not contain enough information to answer the question "
+    f"confidently and correctly, reply with exactly {ESCALATE_MARKER} and nothing else."
+)
+
+
+class CascadeRoute:
+    """
+    Per-agent cascade settings: try `fast_model` first and use `strong_model`
+    when a confidence check fails.
+
+    Checks, cheapest first:
+        - retrieval: best chunk similarity below `min_top_score`, or the top
+          scores are flatter than `min_score_spread` (no clearly relevant chunk)
+          -> skip the fast model entirely;
+        - marker: the fast model replied with ESCALATE_MARKER;
+        - length: the fast answer is shorter than `min_answer_chars`.
+    """
+
+    __slots__ = ("fast_model", "strong_model", "min_top_score", "min_score_spread", "min_answer_chars")
+
+    def __init__(self, fast_model: str, strong_model: str, min_top_score: float = 0.3,
+                 min_score_spread: float = 0.0, min_answer_chars: int = 15):
+        self.fast_model = fast_model
+        self.strong_model = strong_model
+        self.min_top_score = min_top_score
+        self.min_score_spread = min_score_spread
+        self.min_answer_chars = min_answer_chars
+
+
+# ==========================================
+# AGENT ROUTING VALIDATION
+# ==========================================
+
+_MAX_FALLBACKS = 3
+
+
+def allowed_models() -> Dict[str, List[str]]:
+    """Provider -> models agents may route to (LLM_ROUTING_ALLOWED_MODELS); keys and billing stay platform-side."""
+    return getattr(settings, 'LLM_ROUTING_ALLOWED_MODELS', {settings.API_PROVIDER: [settings.CHAT_MODEL]})
+
+
+def _is_number(value) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _check_number(errors: List[str], section: str, key: str, value, low: float, high: float,
+                  integer: bool = False, nullable: bool = False):
+    if value is None and nullable:
+        return
+    if not _is_number(value) or (integer and not isinstance(value, int)) or not low <= value <= high:
+        kind = "an integer" if integer else "a number"
+        errors.append(f"{section}.{key} must be {kind} between {low} and {high}")
+
+
+def validate_llm_routing(llm_routing) -> dict:
+    """
+    Checks a tenant-supplied Agent.llm_routing: only known sections and keys, models
+    and providers from the allowlist, numbers of the right type and range.
+    Returns the value unchanged; raises ValueError listing every problem.
+    """
+    if llm_routing in (None, {}):
+        return {}
+    if not isinstance(llm_routing, dict):
+        raise ValueError("llm_routing must be an object")
+
+    allowed = allowed_models()
+    primary_models = allowed.get(settings.API_PROVIDER, [])
+    errors = [f"unknown section '{key}'" for key in llm_routing if key not in ("cascade", "hedge")]
+
+    cascade = llm_routing.get("cascade") or {}
+    if not isinstance(cascade, dict):
+        errors.append("cascade must be an object")
+        cascade = {}
+    for key, value in cascade.items():
+        if key == "enabled":
+            if not isinstance(value, bool):
+                errors.append("cascade.enabled must be true or false")
+        elif key in ("fast_model", "strong_model"):
+            # Cascade calls go through the primary provider's client
+            if value not in primary_models:
+                errors.append(f"cascade.{key} must be one of {primary_models}")
+        elif key == "min_top_score":
+            _check_number(errors, "cascade", key, value, 0.0, 1.0)
+        elif key == "min_score_spread":
+            _check_number(errors, "cascade", key, value, 0.0, 1.0)
+        elif key == "min_answer_chars":
+            _check_number(errors, "cascade", key, value, 0, 2000, integer=True)
+        else:
+            errors.append(f"unknown key 'cascade.{key}'")
+
+    hedge = llm_routing.get("hedge") or {}
+    if not isinstance(hedge, dict):
+        errors.append("hedge must be an object")
+        hedge = {}
+    for key, value in hedge.items():
+        if key == "enabled":
+            if not isinstance(value, bool):
+                errors.append("hedge.enabled must be true or false")
+        elif key in ("after_ms", "first_token_ms"):
+            _check_number(errors, "hedge", key, value, 0, 60000, integer=True, nullable=True)
+        elif key == "fallbacks":
+            if not isinstance(value, list) or len(value) > _MAX_FALLBACKS:
+                errors.append(f"hedge.fallbacks must be a list of at most {_MAX_FALLBACKS} targets")
+                continue
+            for target in value:
+                if (not isinstance(target, dict) or set(target) != {"provider", "model"}
+                        or not isinstance(target["provider"], str)
+                        or target["model"] not in allowed.get(target["provider"], [])):
+                    errors.append(f"hedge.fallbacks entries must be provider/model pairs from {allowed}")
+                    break
+        else:
+            errors.append(f"unknown key 'hedge.{key}'")
+
+    if errors:
+        raise ValueError("; ".join(errors))
+    return llm_routing
+
+
+def agent_overrides(llm_routing: Optional[dict], section: str) -> dict:
+    """
+    The agent's `section` overrides, or none when the stored value does not validate
+    (rows written before validation existed), so a bad value can't break every chat.
+    """
+    try:
+        return validate_llm_routing(llm_routing).get(section) or {}
+    except ValueError as e:
+        print(f"⚠️ Ignoring invalid llm_routing: {e}")
+        return {}
+
+
+def route_for_agent(llm_routing: Optional[dict]) -> Optional[CascadeRoute]:
+    """
+    Builds the cascade route from Agent.llm_routing["cascade"] over the LLM_CASCADE_*
+    settings. Returns None when the cascade is off or no fast model is configured.
+    """
+    config = {
+        "enabled": getattr(settings, 'LLM_CASCADE_ENABLED', False),
+        "fast_model": getattr(settings, 'CHAT_FAST_MODEL', ""),
+        "strong_model": settings.CHAT_MODEL,
+        "min_top_score": getattr(settings, 'LLM_CASCADE_MIN_TOP_SCORE', 0.3),
+        "min_score_spread": getattr(settings, 'LLM_CASCADE_MIN_SCORE_SPREAD', 0.0),
+        "min_answer_chars": getattr(settings, 'LLM_CASCADE_MIN_ANSWER_CHARS', 15),
+        **agent_overrides(llm_routing, "cascade"),
+    }
+    if not config["enabled"] or not config["fast_model"] or config["fast_model"] == config["strong_model"]:
+        return None
+    return CascadeRoute(
+        fast_model=config["fast_model"],
+        strong_model=config["strong_model"],
+        min_top_score=float(config["min_top_score"]),
+        min_score_spread=float(config["min_score_spread"]),
+        min_answer_chars=int(config["min_answer_chars"]),
+    )
+
+
+class ModelCascade:
+    """
+    Fast-model-first answering on top of UnifiedLLMClient.
+
+    Escalations are counted per scope (agent) and reason; the fast and strong
+    calls are also labelled "<operation>.fast" / "<operation>.strong" in the
+    usage ledger (operation taken from the current usage_context), so escalation
+    rates can be read from the usage API too.
+    """
+
+    def __init__(self, client):
+        self.client = client
+        self._lock = threading.Lock()
+        self._stats = defaultdict(lambda: defaultdict(int))
+
+    def _count(self, scope: str, outcome: str):
+        with self._lock:
+            self._stats[scope]["answers"] += 1
+            self._stats[scope][outcome] += 1
+
+    @staticmethod
+    def retrieval_escalates(route: CascadeRoute, scores: Sequence[float]) -> bool:
+        if not scores:
+            return True
+        ranked = sorted(scores, reverse=True)
+        if ranked[0] < route.min_top_score:
+            return True
+        # Spread between the best chunk and the rest: flat scores mean no clear match
+        rest = ranked[1:] or ranked
+        return ranked[0] - sum(rest) / len(rest) < route.min_score_spread
+
+    def _answer_escalates(self, route: CascadeRoute, answer: Optional[str]) -> Optional[str]:
+        if not answer:
+            return "error"
+        if ESCALATE_MARKER in answer:
+            return "marker"
+        if len(answer.strip()) < route.min_answer_chars:
+            return "length"
+        return None
+
+    @staticmethod
+    def _tier(attribution: Dict[str, str], tier: str) -> dict:
+        return {**attribution, "operation": f"{attribution.get('operation') or 'chat'}.{tier}"}
+
+    def generate(self, route: CascadeRoute, scope: str, system_sections: List[str], user_prompt: str,
+                 scores: Sequence[float], temperature: float = 0.3, client=None) -> Optional[str]:
+        client = client or self.client
+        attribution = current_attribution()
+        if self.retrieval_escalates(route, scores):
+            self._count(scope, "escalated_retrieval")
+        else:
+            with usage_context(**self._tier(attribution, "fast")):
+                answer = client.generate_text(
+                    system_sections + [ESCALATE_INSTRUCTION], user_prompt,
+                    temperature=temperature, model=route.fast_model
+                )
+            reason = self._answer_escalates(route, answer)
+            if reason is None:
+                self._count(scope, "fast")
+                return answer
+            self._count(scope, f"escalated_{reason}")
+
+        with usage_context(**self._tier(attribution, "strong")):
+            return client.generate_text(system_sections, user_prompt, temperature=temperature,
+                                        model=route.strong_model)
+
+    def stream(self, route: CascadeRoute, scope: str, system_sections: List[str], user_prompt: str,
+               scores: Sequence[float], temperature: float = 0.3, client=None,
+               raise_errors: bool = False) -> Iterator[str]:
+        """
+        Streaming cascade. Only the retrieval and marker checks apply: the first
+        tokens are held back until they can no longer be the start of the marker,
+        then the fast answer streams through unchanged. A fast model that fails
+        before answering escalates; a failure once the answer is streaming ends
+        the stream, or is raised when `raise_errors` is set.
+        Usage attribution is captured when this is called.
+        `client` (e.g. a ResilientChat) replaces the default client for this call.
+        """
+        return self._stream(route, scope, system_sections, user_prompt, scores, temperature,
+                            current_attribution(), client or self.client, raise_errors)
+
+    def _stream(self, route: CascadeRoute, scope: str, system_sections: List[str], user_prompt: str,
+                scores: Sequence[float], temperature: float, attribution: Dict[str, str], client,
+                raise_errors: bool = False) -> Iterator[str]:
+        if self.retrieval_escalates(route, scores):
+            self._count(scope, "escalated_retrieval")
+        else:
+            with usage_context(**self._tier(attribution, "fast")):
+                tokens = client.stream_text(
+                    system_sections + [ESCALATE_INSTRUCTION], user_prompt,
+                    temperature=temperature, model=route.fast_model, raise_errors=True
+                )
+            held = ""
+            streaming = False
+            try:
+                for token in tokens:
+                    if streaming:
+                        yield token
+                        continue
+                    held += token
+                    probe = held.lstrip()
+                    if ESCALATE_MARKER in probe:
+                        break
+                    if probe and not ESCALATE_MARKER.startswith(probe):
+                        streaming = True
+                        self._count(scope, "fast")
+                        yield held
+                else:
+                    if streaming:
+                        return
+                    if held.strip():
+                        # Short reply that was still a possible marker prefix
+                        self._count(scope, "fast")
+                        yield held
+                        return
+            except Exception:
+                if streaming:
+                    if raise_errors:
+                        raise
+                    return
+                held = ""  # no answer yet: the strong model takes over
+            tokens.close()
+            self._count(scope, "escalated_marker" if held.strip() else "escalated_error")
+
+        with usage_context(**self._tier(attribution, "strong")):
+            tokens = client.stream_text(system_sections, user_prompt, temperature=temperature,
+                                        model=route.strong_model, raise_errors=raise_errors)
+        yield from tokens
+
+    def stats(self) -> Dict[str, dict]:
+        """Per-scope answer counts by outcome plus the overall escalation rate."""
+        with self._lock:
+            report = {}
+            for scope, counts in self._stats.items():
+                escalated = sum(v for k, v in counts.items() if k.startswith("escalated_"))
+                report[scope] = {
+                    **counts,
+                    "escalation_rate": round(escalated / counts["answers"], 4) if counts["answers"] else 0.0,
+                }
+            return report
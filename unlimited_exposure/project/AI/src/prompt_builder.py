@@ -0,0 +1,62 @@
+from typing import Dict, List, Optional
+
+
+class Prompt:
+    """
+    A chat prompt split into a stable prefix and per-turn content.
+
+    `system_sections` holds content that is identical across turns (agent
+    system prompt, persona rules, static knowledge-base summaries), in that
+    order. `user` holds everything that changes per turn. Keeping the stable
+    part first and byte-identical lets OpenAI prefix caching and Anthropic
+    prompt caching reuse it.
+    """
+
+    __slots__ = ("system_sections", "user")
+
+    def __init__(self, system_sections: List[str], user: str):
+        self.system_sections = system_sections
+        self.user = user
+
+    @property
+    def system(self) -> str:
+        return "\n\n".join(self.system_sections)
+
+
+def format_history(chat_history: Optional[List[Dict[str, str]]], max_turns: int = 4) -> str:
+    """Renders the last `max_turns` messages as 'Role: content' lines."""
+    if not chat_history:
+        return ""
+    recent_msgs = chat_history[-max_turns:]
+    return "\n".join(
+        f"{m.get('role', 'unknown').capitalize()}: {m.get('content', '')}" for m in recent_msgs
+    )
+
+
+def build_prompt(
+    system_prompt: str,
+    question: str,
+    context: str = "",
+    history: str = "",
+    static_sections: Optional[List[str]] = None,
+) -> Prompt:
+    """
+    Assembles a cache-friendly prompt.
+
+    Args:
+        system_prompt: The agent's system prompt.
+        question: The current user question.
+        context: Retrieved context for this turn.
+        history: Rendered conversation history (see format_history).
+        static_sections: Fixed instructions / persona rules / KB summaries that never change per turn.
+    """
+    sections = [system_prompt.strip()]
+    sections.extend(s.strip() for s in (static_sections or []) if s and s.strip())
+
+    # Per-turn content: history first (it grows append-only), then context, then the question
+    user = (
+        f"Conversation History:\n{history}\n\n"
+        f"Context Information:\n{context}\n\n"
+        f"User Question: {question}"
+    )
+    return Prompt(sections, user)
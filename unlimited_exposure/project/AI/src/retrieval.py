@@ -0,0 +1,56 @@
+import re
+from typing import Optional
+
+from django.conf import settings
+
+# "vector" (cosine only) or "hybrid" (cosine + full-text, fused with reciprocal-rank fusion)
+RETRIEVAL_MODE = getattr(settings, 'RETRIEVAL_MODE', 'hybrid')
+# RRF constant: score = sum over result lists of 1 / (RRF_K + rank)
+RRF_K = getattr(settings, 'RETRIEVAL_RRF_K', 60)
+# Each list contributes up to limit x this many candidates to the fusion
+CANDIDATE_FACTOR = getattr(settings, 'RETRIEVAL_CANDIDATE_FACTOR', 4)
+
+# Baked into the documents.content_tsv column and the LangChain expression index,
+# so it is not a setting: changing it needs a schema migration.
+TEXT_SEARCH_CONFIG = "english"
+
+_WORD = re.compile(r"[^\W_]+")
+_MAX_QUERY_WORDS = 32
+
+
+def lexical_query(text: str) -> str:
+    """
+    to_tsquery() input matching any word of `text` ("dealer | toronto | a01l").
+    OR semantics suit short lookups (codes, names) inside longer questions; stop
+    words are removed by the text search parser. Returns "" when there are no words.
+    """
+    words = dict.fromkeys(word.lower() for word in _WORD.findall(text or ""))
+    return " | ".join(list(words)[:_MAX_QUERY_WORDS])
+
+
+def use_hybrid(query_text: str) -> bool:
+    return RETRIEVAL_MODE == "hybrid" and bool(lexical_query(query_text))
+
+
+class RetrievedChunk:
+    """
+    One retrieval hit, as returned by VectorStore and DocumentProcessor search_chunks.
+
+    `score` is cosine similarity (hybrid results keep it too, while their order
+    comes from rank fusion), so lists are already ranked best first. `source` is
+    the document_id / LangChain source, `chunk_id` the stored row id, and
+    `token_count` is None for chunks ingested before token counts were stored.
+    """
+
+    __slots__ = ("text", "score", "source", "chunk_id", "token_count")
+
+    def __init__(self, text: str, score: float, source: Optional[str] = None,
+                 chunk_id: Optional[str] = None, token_count: Optional[int] = None):
+        self.text = text
+        self.score = score
+        self.source = source
+        self.chunk_id = chunk_id
+        self.token_count = token_count
+
+    def __repr__(self) -> str:
+        return f"RetrievedChunk(source={self.source!r}, chunk_id={self.chunk_id!r}, score={self.score:.3f})"
@@ -21,7 +21,8 @@ if not settings.configured:
 
 from pypdf import PdfReader
 from docx import Document
-from llm_gateway import UnifiedLLMClient
+from llm_gateway import PRIORITY_BULK, get_llm_client
+from usage_ledger import usage_context
 from vector_store import VectorStore
 
 # Handle typo in filename from previous iterations
@@ -71,7 +72,7 @@ def run_pipeline(): #pass name as an argument
 
     try:
         db = VectorStore()
-        llm = UnifiedLLMClient()
+        llm = get_llm_client()
         scraper = WebScraper()
     except Exception as e:
         print(f"❌ Initialization Failed: {e}")
@@ -123,7 +124,8 @@ def run_pipeline(): #pass name as an argument
     if all_chunks_with_meta:
         print(f"\n💾 Saving {len(all_chunks_with_meta)} chunks for client '{client_id}'...")
         # Note: Now passing list of tuples
-        db.add_documents(client_id, all_chunks_with_meta)
+        with usage_context(operation="ingest"):
+            db.add_documents(client_id, all_chunks_with_meta)
         print("✅ Data stored in Vector DB.")
     else:
         print("⚠️ No content found. Skipping DB save.")
@@ -146,12 +148,14 @@ def run_pipeline(): #pass name as an argument
     Format: {"faqs": [{"questions": ["..."], "answer": "..."}]}
     """
     
-    response = llm.generate_text(
-        system_prompt, 
-        f"Content Source:\n{context_slice}",
-        temperature=0.1,
-        json_mode=True
-    )
+    with usage_context(operation="faq_generation"):
+        response = llm.generate_text(
+            system_prompt, 
+            f"Content Source:\n{context_slice}",
+            temperature=0.1,
+            json_mode=True,
+            priority=PRIORITY_BULK
+        )
     
     if not response:
         print("❌ Failed to generate text from LLM.")
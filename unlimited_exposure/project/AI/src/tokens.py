@@ -0,0 +1,85 @@
+import threading
+from typing import TYPE_CHECKING, Iterable, Optional
+
+from django.conf import settings
+
+if TYPE_CHECKING:
+    from .retrieval import RetrievedChunk
+
+try:
+    import tiktoken
+except ImportError:  # tiktoken ships with langchain_openai; fall back to an estimate without it
+    tiktoken = None
+
+_encodings = {}
+_encodings_lock = threading.Lock()
+
+
+def _encoding(model: Optional[str]):
+    key = model or ""
+    encoding = _encodings.get(key)
+    if encoding is None:
+        with _encodings_lock:
+            encoding = _encodings.get(key)
+            if encoding is None:
+                try:
+                    encoding = tiktoken.encoding_for_model(model) if model else tiktoken.get_encoding("cl100k_base")
+                except KeyError:
+                    # Non-OpenAI models (Claude, Mistral, DeepSeek): cl100k is a close enough proxy
+                    encoding = tiktoken.get_encoding("cl100k_base")
+                _encodings[key] = encoding
+    return encoding
+
+
+def count_tokens(text: str, model: Optional[str] = None) -> int:
+    """Token count of `text` for `model` (tiktoken when installed, else ~4 characters per token)."""
+    if not text:
+        return 0
+    if tiktoken is None:
+        return max(1, len(text) // 4)
+    return len(_encoding(model).encode(text, disallowed_special=()))
+
+
+def context_token_budget(model: Optional[str]) -> int:
+    """Token budget for retrieved context: CONTEXT_TOKEN_BUDGETS[model], else CONTEXT_TOKEN_BUDGET."""
+    budgets = getattr(settings, 'CONTEXT_TOKEN_BUDGETS', {})
+    return budgets.get(model, getattr(settings, 'CONTEXT_TOKEN_BUDGET', 6000))
+
+
+def pack_context(
+    chunks: Iterable["RetrievedChunk"],
+    budget: int,
+    separator: str = "\n\n",
+    min_score: Optional[float] = None,
+) -> str:
+    """
+    Greedily packs whole chunks, in retrieval order, until the token budget is used.
+
+    Args:
+        chunks: RetrievedChunk hits, best first; a missing token_count is computed here.
+        budget: Maximum number of context tokens.
+        separator: Text placed between chunks.
+        min_score: Chunks scoring below this are left out (default CONTEXT_MIN_SCORE).
+
+    The backends already rank their results (hybrid order comes from rank fusion,
+    not from the cosine score), so the order is kept rather than re-sorted. Each
+    chunk is labelled "[n] source" for citations, repeated texts are packed once,
+    and a chunk that does not fit is skipped (never cut), so smaller lower-ranked
+    chunks can still fill the remaining budget.
+    """
+    if min_score is None:
+        min_score = getattr(settings, 'CONTEXT_MIN_SCORE', 0.0)
+    separator_tokens = count_tokens(separator)
+    picked, seen, used = [], set(), 0
+    for chunk in chunks:
+        if chunk.score < min_score or chunk.text in seen:
+            continue
+        label = f"[{len(picked) + 1}] {chunk.source}" if chunk.source else f"[{len(picked) + 1}]"
+        token_count = chunk.token_count if chunk.token_count is not None else count_tokens(chunk.text)
+        cost = count_tokens(label) + 1 + token_count + (separator_tokens if picked else 0)
+        if used + cost > budget:
+            continue
+        picked.append(f"{label}\n{chunk.text}")
+        seen.add(chunk.text)
+        used += cost
+    return separator.join(picked)
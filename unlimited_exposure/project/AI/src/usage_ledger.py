@@ -0,0 +1,174 @@
+import atexit
+import contextvars
+import queue
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from decimal import Decimal
+from typing import Dict, List, Optional
+
+from django.conf import settings
+
+# Who a provider call is made for. Set by views / services with usage_context();
+# read by the gateway when it records a call.
+_attribution = contextvars.ContextVar("llm_usage_attribution", default={})
+
+
+@contextmanager
+def usage_context(agent_id=None, organization_id=None, operation: Optional[str] = None):
+    """
+    Attributes every LLM call made inside the block to an agent, organization and
+    operation label (e.g. "rag_response", "system_prompt", "faq_generation").
+    Nested blocks only override the fields they pass.
+    """
+    fields = {"agent_id": agent_id, "organization_id": organization_id, "operation": operation}
+    merged = {**_attribution.get(), **{k: str(v) for k, v in fields.items() if v is not None}}
+    token = _attribution.set(merged)
+    try:
+        yield
+    finally:
+        _attribution.reset(token)
+
+
+def current_attribution() -> Dict[str, str]:
+    return dict(_attribution.get())
+
+
+def _price_for(model: str) -> Optional[dict]:
+    prices = getattr(settings, 'LLM_PRICES', {})
+    if model in prices:
+        return prices[model]
+    # Dated snapshots ("gpt-4o-2024-08-06") use the price of their longest known prefix
+    matches = [key for key in prices if model.startswith(key)]
+    return prices[max(matches, key=len)] if matches else None
+
+
+def estimate_cost(model: str, prompt_tokens: int, cached_tokens: int = 0, cache_write_tokens: int = 0,
+                  completion_tokens: int = 0) -> Optional[Decimal]:
+    """USD cost of one call from LLM_PRICES (USD per 1M tokens), or None for unpriced models."""
+    price = _price_for(model)
+    if not price:
+        return None
+    uncached = max(0, prompt_tokens - cached_tokens - cache_write_tokens)
+    cost = (
+        uncached * price.get("input", 0)
+        + cached_tokens * price.get("cached_input", price.get("input", 0))
+        + cache_write_tokens * price.get("cache_write", price.get("input", 0))
+        + completion_tokens * price.get("output", 0)
+    ) / 1_000_000
+    return Decimal(str(round(cost, 6)))
+
+
+def _clean_row(row: dict) -> dict:
+    """
+    Coerces attribution to what LLMUsage stores: ids that are not UUIDs (e.g. legacy
+    client ids) become None and the operation label is cut to the column length, so
+    one odd caller cannot fail the batch INSERT its row lands in.
+    """
+    for field in ("agent_id", "organization_id"):
+        value = row.get(field)
+        if value is not None and not isinstance(value, uuid.UUID):
+            try:
+                row[field] = uuid.UUID(str(value))
+            except ValueError:
+                row[field] = None
+    if row.get("operation"):
+        row["operation"] = str(row["operation"])[:50]
+    return row
+
+
+class UsageLedger:
+    """
+    Buffers usage rows in memory and writes them in batches from a background thread.
+
+    `record` never touches the database, so provider calls only pay for a queue put.
+    Rows are flushed every `flush_interval` seconds or once `batch_size` rows are
+    waiting. When the queue is full (database down) new rows are dropped and counted.
+    A batch the database rejects is retried row by row, so only the bad rows are lost.
+    """
+
+    def __init__(self, batch_size: int = 200, flush_interval: float = 2.0, max_queue: int = 10000):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = None
+        self._thread_lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+
+    def record(self, **row):
+        row.setdefault("created_at", datetime.now(timezone.utc))
+        _clean_row(row)
+        try:
+            self._queue.put_nowait(row)
+        except queue.Full:
+            self.dropped += 1
+            return
+        self._ensure_worker()
+
+    def _ensure_worker(self):
+        if self._thread is None:
+            with self._thread_lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="llm-usage-ledger", daemon=True)
+                    self._thread.start()
+                    atexit.register(self.flush)
+
+    def _drain(self, first=None) -> List[dict]:
+        rows = [first] if first is not None else []
+        while len(rows) < self.batch_size:
+            try:
+                rows.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return rows
+
+    def _run(self):
+        while True:
+            try:
+                first = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+            # Give a burst a moment to accumulate so it lands in one INSERT
+            deadline = time.monotonic() + self.flush_interval
+            while self._queue.qsize() < self.batch_size - 1 and time.monotonic() < deadline:
+                time.sleep(0.05)
+            self._write(self._drain(first))
+
+    def flush(self):
+        """Writes everything queued so far (used at exit and by management commands)."""
+        while True:
+            rows = self._drain()
+            if not rows:
+                return
+            self._write(rows)
+
+    def _write(self, rows: List[dict]):
+        from django.db import InterfaceError, OperationalError, connection
+        from project.models import LLMUsage
+
+        with self._flush_lock:
+            try:
+                LLMUsage.objects.bulk_create([LLMUsage(**row) for row in rows])
+            except (OperationalError, InterfaceError) as e:
+                # Database unreachable: retrying row by row would fail the same way
+                print(f"❌ Usage ledger write failed ({len(rows)} rows dropped): {e}")
+                self.dropped += len(rows)
+                # Drop a possibly broken connection so the next batch reconnects
+                connection.close()
+            except Exception as e:
+                print(f"⚠️ Usage ledger batch write failed, retrying {len(rows)} rows one by one: {e}")
+                for row in rows:
+                    try:
+                        LLMUsage.objects.create(**row)
+                    except Exception as row_error:
+                        print(f"❌ Usage ledger row dropped: {row_error} ({row})")
+                        self.dropped += 1
+
+
+usage_ledger = UsageLedger(
+    batch_size=getattr(settings, 'LLM_USAGE_BATCH_SIZE', 200),
+    flush_interval=getattr(settings, 'LLM_USAGE_FLUSH_INTERVAL', 2.0),
+) if getattr(settings, 'LLM_USAGE_LEDGER_ENABLED', True) else None
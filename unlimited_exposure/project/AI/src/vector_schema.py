@@ -0,0 +1,425 @@
+"""
+Versioned schema for the raw `documents` table in the vector database.
+
+Applied once per deploy by `python manage.py migrate_vector_db` (not by VectorStore,
+which does no DDL). Each migration runs in its own transaction and is recorded in
+`vector_schema_migrations`; a Postgres advisory lock keeps concurrent deploys from
+applying the same step twice. Append new steps at the end, never edit applied ones.
+"""
+import hashlib
+from typing import Callable, List, Optional, Tuple, Union
+
+from django.conf import settings
+from psycopg2 import sql
+
+try:
+    from .db_pool import ConnectionPool, get_vector_db_pool
+except ImportError:
+    from db_pool import ConnectionPool, get_vector_db_pool
+
+# Arbitrary constant identifying the vector schema advisory lock
+_LOCK_ID = 7_351_002_118
+
+# (version, name, SQL or callable(cursor))
+MIGRATIONS: List[Tuple[int, str, Union[str, Callable]]] = [
+    (1, "baseline documents table", """
+        CREATE EXTENSION IF NOT EXISTS vector;
+        CREATE TABLE IF NOT EXISTS documents (
+            id SERIAL PRIMARY KEY,
+            client_id TEXT,
+            document_id TEXT,
+            content TEXT,
+            embedding vector(1536)
+        );
+        -- Deployments created before these columns existed
+        ALTER TABLE documents ADD COLUMN IF NOT EXISTS client_id TEXT;
+        ALTER TABLE documents ADD COLUMN IF NOT EXISTS document_id TEXT;
+        ALTER TABLE documents ADD COLUMN IF NOT EXISTS token_count INTEGER;
+        CREATE INDEX IF NOT EXISTS idx_client_id ON documents(client_id);
+        CREATE INDEX IF NOT EXISTS idx_document_id ON documents(document_id);
+    """),
+    (2, "full-text search column for hybrid retrieval", """
+        ALTER TABLE documents ADD COLUMN IF NOT EXISTS content_tsv tsvector
+            GENERATED ALWAYS AS (to_tsvector('english', coalesce(content, ''))) STORED;
+        CREATE INDEX IF NOT EXISTS idx_documents_content_tsv ON documents USING gin (content_tsv);
+    """),
+    (3, "per-document chunk content hash", """
+        ALTER TABLE documents ADD COLUMN IF NOT EXISTS content_hash TEXT;
+        -- Same digest as content_hash() below
+        UPDATE documents SET content_hash = encode(sha256(convert_to(coalesce(content, ''), 'UTF8')), 'hex')
+        WHERE content_hash IS NULL;
+        -- Keep the oldest copy of each chunk per document; repeats across documents are kept
+        DELETE FROM documents d USING documents o
+        WHERE d.client_id = o.client_id AND d.document_id = o.document_id
+          AND d.content_hash = o.content_hash AND d.id > o.id;
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_documents_client_document_content_hash
+            ON documents (client_id, document_id, content_hash);
+    """),
+]
+
+
+def content_hash(text: str) -> str:
+    """Chunk identity for deduplication: hex SHA-256 of the UTF-8 text (matches migration 3)."""
+    return hashlib.sha256((text or "").encode("utf-8")).hexdigest()
+
+
+def applied_versions(pool: Optional[ConnectionPool] = None) -> List[int]:
+    pool = pool or get_vector_db_pool()
+    with pool.connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT to_regclass('vector_schema_migrations') IS NOT NULL;")
+            if not cur.fetchone()[0]:
+                return []
+            cur.execute("SELECT version FROM vector_schema_migrations ORDER BY version;")
+            return [row[0] for row in cur.fetchall()]
+
+
+def migrate(pool: Optional[ConnectionPool] = None, log: Callable[[str], None] = print) -> List[int]:
+    """Applies pending migrations in order. Returns the versions applied."""
+    pool = pool or get_vector_db_pool()
+    applied = []
+    with pool.connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT pg_advisory_lock(%s);", (_LOCK_ID,))
+            try:
+                cur.execute("""
+                    CREATE TABLE IF NOT EXISTS vector_schema_migrations (
+                        version INTEGER PRIMARY KEY,
+                        name TEXT NOT NULL,
+                        applied_at TIMESTAMPTZ NOT NULL DEFAULT now()
+                    );
+                """)
+                conn.commit()
+                cur.execute("SELECT version FROM vector_schema_migrations;")
+                done = {row[0] for row in cur.fetchall()}
+                conn.commit()
+
+                for version, name, step in MIGRATIONS:
+                    if version in done:
+                        continue
+                    log(f"🛠️ Applying vector schema {version:04d}: {name}")
+                    try:
+                        if callable(step):
+                            step(cur)
+                        else:
+                            cur.execute(step)
+                        cur.execute(
+                            "INSERT INTO vector_schema_migrations (version, name) VALUES (%s, %s);",
+                            (version, name)
+                        )
+                        conn.commit()
+                    except Exception:
+                        conn.rollback()
+                        raise
+                    applied.append(version)
+            finally:
+                cur.execute("SELECT pg_advisory_unlock(%s);", (_LOCK_ID,))
+                conn.commit()
+    return applied
+
+
+# ==========================================
+# PARTITIONING
+# ==========================================
+#
+# Partitioned layout (opt-in, `migrate_vector_db --partition`):
+#
+#   documents                 PARTITION BY LIST (client_id)
+#   ├── documents_t_<hash>    dedicated partition per large tenant (VECTOR_DEDICATED_TENANTS)
+#   └── documents_shared      DEFAULT partition, PARTITION BY HASH (client_id)
+#       └── documents_shared_p00 .. pNN
+#
+# Every VectorStore query filters on client_id, so the planner prunes to a single
+# partition. Offboarding a dedicated tenant is a partition drop.
+
+SHARED_PARTITION = "documents_shared"
+
+
+def dedicated_partition_name(client_id: str) -> str:
+    return "documents_t_" + hashlib.md5(str(client_id).encode("utf-8")).hexdigest()[:16]
+
+
+def is_partitioned(cur) -> bool:
+    cur.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass('documents');")
+    row = cur.fetchone()
+    return bool(row) and row[0] == "p"
+
+
+def _data_columns(cur, table: str) -> List[str]:
+    """Insertable columns of `table` (generated columns are recomputed on insert)."""
+    cur.execute("""
+        SELECT attname FROM pg_attribute
+        WHERE attrelid = to_regclass(%s) AND attnum > 0 AND NOT attisdropped AND attgenerated = ''
+        ORDER BY attnum;
+    """, (table,))
+    return [row[0] for row in cur.fetchall()]
+
+
+def partition_documents(pool: Optional[ConnectionPool] = None, hash_partitions: Optional[int] = None,
+                        log: Callable[[str], None] = print) -> bool:
+    """
+    Converts the plain documents table into the partitioned layout in one transaction
+    (the table is locked while rows are copied, so run it in a maintenance window).
+    Secondary indexes are recreated from their definitions; ANN indexes are left to
+    ensure_vector_index, which builds them per partition. Returns False if already done.
+    """
+    pool = pool or get_vector_db_pool()
+    hash_partitions = hash_partitions or getattr(settings, 'VECTOR_HASH_PARTITIONS', 16)
+    with pool.connection() as conn:
+        with conn.cursor() as cur:
+            if is_partitioned(cur):
+                return False
+            log(f"🛠️ Partitioning documents into {hash_partitions} hash partitions")
+            cur.execute("LOCK TABLE documents IN ACCESS EXCLUSIVE MODE;")
+            cur.execute("""
+                SELECT indexdef FROM pg_indexes
+                WHERE tablename = 'documents' AND indexname NOT LIKE 'documents_embedding_%'
+                  AND indexname <> 'documents_pkey';
+            """)
+            index_defs = [row[0] for row in cur.fetchall()]
+            columns = _data_columns(cur, "documents")
+
+            cur.execute("ALTER TABLE documents RENAME TO documents_unpartitioned;")
+            cur.execute("ALTER TABLE documents_unpartitioned RENAME CONSTRAINT documents_pkey TO documents_unpartitioned_pkey;")
+            # Keep the id sequence alive when the old table is dropped
+            cur.execute("ALTER SEQUENCE documents_id_seq OWNED BY NONE;")
+            cur.execute("""
+                CREATE TABLE documents (LIKE documents_unpartitioned INCLUDING DEFAULTS INCLUDING GENERATED)
+                PARTITION BY LIST (client_id);
+            """)
+            # Unique keys of a partitioned table must contain the partition key
+            cur.execute("ALTER TABLE documents ADD PRIMARY KEY (client_id, id);")
+            cur.execute(sql.SQL(
+                "CREATE TABLE {} PARTITION OF documents DEFAULT PARTITION BY HASH (client_id);"
+            ).format(sql.Identifier(SHARED_PARTITION)))
+            for i in range(hash_partitions):
+                cur.execute(sql.SQL(
+                    "CREATE TABLE {} PARTITION OF {} FOR VALUES WITH (MODULUS {}, REMAINDER {});"
+                ).format(sql.Identifier(f"{SHARED_PARTITION}_p{i:02d}"), sql.Identifier(SHARED_PARTITION),
+                         sql.Literal(hash_partitions), sql.Literal(i)))
+
+            column_list = sql.SQL(", ").join(map(sql.Identifier, columns))
+            cur.execute(sql.SQL("INSERT INTO documents ({cols}) SELECT {cols} FROM documents_unpartitioned;")
+                        .format(cols=column_list))
+            log(f"✅ Copied {cur.rowcount} rows")
+            cur.execute("DROP TABLE documents_unpartitioned;")
+            cur.execute("ALTER SEQUENCE documents_id_seq OWNED BY documents.id;")
+            for index_def in index_defs:
+                cur.execute(index_def.replace("ON public.documents_unpartitioned ", "ON public.documents "))
+        conn.commit()
+    return True
+
+
+def dedicate_tenant(client_id: str, pool: Optional[ConnectionPool] = None,
+                    log: Callable[[str], None] = print) -> bool:
+    """
+    Moves one tenant out of the shared hash partitions into its own LIST partition.
+    Its indexes (including the ANN index) are created with the partition.
+    Returns False if the table is not partitioned or the tenant already has one.
+    """
+    pool = pool or get_vector_db_pool()
+    partition = dedicated_partition_name(client_id)
+    with pool.connection() as conn:
+        with conn.cursor() as cur:
+            if not is_partitioned(cur):
+                return False
+            cur.execute("SELECT to_regclass(%s) IS NOT NULL;", (partition,))
+            if cur.fetchone()[0]:
+                return False
+            columns = sql.SQL(", ").join(map(sql.Identifier, _data_columns(cur, "documents")))
+            # The default partition may not hold rows for the new partition's value
+            # (Postgres re-checks that with a scan of the shared partitions)
+            cur.execute(sql.SQL(
+                "CREATE TEMP TABLE moving_rows ON COMMIT DROP AS SELECT {cols} FROM documents WHERE client_id = %s;"
+            ).format(cols=columns), (client_id,))
+            cur.execute("DELETE FROM documents WHERE client_id = %s;", (client_id,))
+            cur.execute(sql.SQL("CREATE TABLE {} PARTITION OF documents FOR VALUES IN ({});")
+                        .format(sql.Identifier(partition), sql.Literal(str(client_id))))
+            cur.execute(sql.SQL("INSERT INTO documents ({cols}) SELECT {cols} FROM moving_rows;")
+                        .format(cols=columns))
+            log(f"✅ Tenant {client_id} moved to {partition} ({cur.rowcount} rows)")
+        conn.commit()
+    return True
+
+
+_ANN_OPTIONS = {
+    "hnsw": ("hnsw", "WITH (m = {m}, ef_construction = {ef})"),
+    "ivfflat": ("ivfflat", "WITH (lists = {lists})"),
+}
+
+# What the ANN index is built on, per VECTOR_STORAGE. The full-precision column is
+# always kept, so quantized first-stage results are re-ranked with exact distances.
+#   full:    float32 vector, 4 bytes/dim
+#   halfvec: float16 copy, 2 bytes/dim (2x smaller index)
+#   binary:  1 bit/dim sign quantization with Hamming distance (32x smaller index)
+_STORAGE = {
+    "full": ("embedding", "vector_cosine_ops", "embedding <=> %(query)s::vector"),
+    "halfvec": (
+        "(embedding::halfvec({dims}))", "halfvec_cosine_ops",
+        "embedding::halfvec({dims}) <=> %(query)s::vector::halfvec({dims})",
+    ),
+    "binary": (
+        "(binary_quantize(embedding)::bit({dims}))", "bit_hamming_ops",
+        "binary_quantize(embedding)::bit({dims}) <~> binary_quantize(%(query)s::vector)",
+    ),
+}
+_STORAGE_SUFFIX = {"full": "", "halfvec": "_half", "binary": "_bit"}
+
+
+def vector_storage() -> str:
+    return getattr(settings, 'VECTOR_STORAGE', 'full')
+
+
+def first_stage_distance() -> str:
+    """SQL distance expression the ANN index serves for VECTOR_STORAGE (uses the %(query)s param)."""
+    return _STORAGE[vector_storage()][2].format(dims=int(getattr(settings, 'EMBEDDING_DIMENSIONS', 1536)))
+
+
+def ann_index_name(table: str, index_type: str) -> str:
+    return f"{table}_embedding_{index_type}{_STORAGE_SUFFIX[vector_storage()]}_idx"
+
+
+def _ann_index_sql(index_type: str, index: str, table: str, only: bool = False, concurrently: bool = False):
+    method, options = _ANN_OPTIONS[index_type]
+    options = options.format(
+        m=int(getattr(settings, 'VECTOR_HNSW_M', 16)),
+        ef=int(getattr(settings, 'VECTOR_HNSW_EF_CONSTRUCTION', 64)),
+        lists=int(getattr(settings, 'VECTOR_IVFFLAT_LISTS', 100)),
+    )
+    expression, opclass, _ = _STORAGE[vector_storage()]
+    expression = expression.format(dims=int(getattr(settings, 'EMBEDDING_DIMENSIONS', 1536)))
+    return sql.SQL("CREATE INDEX {concurrently} IF NOT EXISTS {index} ON {only} {table} "
+                   "USING {method} ({expression} {opclass}) {options};").format(
+        concurrently=sql.SQL("CONCURRENTLY" if concurrently else ""),
+        index=sql.Identifier(index),
+        only=sql.SQL("ONLY" if only else ""),
+        table=sql.Identifier(table),
+        method=sql.SQL(method),
+        expression=sql.SQL(expression),
+        opclass=sql.SQL(opclass),
+        options=sql.SQL(options),
+    )
+
+
+def _attached_index(cur, parent_index: str, table: str) -> Optional[str]:
+    """Name of `table`'s index already attached to the partitioned `parent_index`, if any."""
+    cur.execute("""
+        SELECT c.relname FROM pg_inherits i
+        JOIN pg_index x ON x.indexrelid = i.inhrelid
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = to_regclass(%s) AND x.indrelid = to_regclass(%s);
+    """, (parent_index, table))
+    row = cur.fetchone()
+    return row[0] if row else None
+
+
+def _ensure_ann_index(cur, index_type: str, table: str, log: Callable[[str], None],
+                      existing: Optional[str] = None) -> str:
+    """
+    Builds `table`'s ANN index. Leaf tables are indexed CONCURRENTLY; partitioned
+    tables get an ON ONLY index that each partition's index is attached to, which
+    is how Postgres allows a partitioned index to be built without blocking writes.
+
+    `existing` is the index already attached for `table` (Postgres creates one,
+    under a generated name, for partitions added after the parent index exists);
+    it is kept rather than built and attached a second time.
+    """
+    index = existing or ann_index_name(table, index_type)
+    cur.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass(%s);", (table,))
+    if cur.fetchone()[0] != "p":
+        if not existing:
+            log(f"🛠️ Ensuring {index_type} index on {table}")
+            cur.execute(_ann_index_sql(index_type, index, table, concurrently=True))
+        return index
+
+    if not existing:
+        cur.execute(_ann_index_sql(index_type, index, table, only=True))
+    cur.execute("""
+        SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = to_regclass(%s) ORDER BY c.relname;
+    """, (table,))
+    for child in [row[0] for row in cur.fetchall()]:
+        attached = _attached_index(cur, index, child)
+        # A partitioned child's attached index may still be missing some of its own partitions
+        child_index = _ensure_ann_index(cur, index_type, child, log, existing=attached)
+        if attached is None:
+            cur.execute(sql.SQL("ALTER INDEX {} ATTACH PARTITION {};").format(
+                sql.Identifier(index), sql.Identifier(child_index)))
+    return index
+
+
+def ensure_vector_index(pool: Optional[ConnectionPool] = None, rebuild: bool = False,
+                        log: Callable[[str], None] = print):
+    """
+    Reconciles the ANN index on documents.embedding with VECTOR_INDEX_TYPE and
+    VECTOR_STORAGE: creates the configured index and drops any other one. `rebuild=True` recreates it,
+    which is needed after changing build parameters (m, ef_construction, lists).
+
+    Indexes are built CONCURRENTLY (per partition when the table is partitioned) so
+    ingestion and search keep running. IVFFlat lists are trained on existing rows,
+    so build it once data is loaded.
+    """
+    pool = pool or get_vector_db_pool()
+    index_type = getattr(settings, 'VECTOR_INDEX_TYPE', 'hnsw')
+    with pool.connection() as conn:
+        conn.autocommit = True  # CREATE/DROP INDEX CONCURRENTLY can't run in a transaction
+        try:
+            with conn.cursor() as cur:
+                partitioned = is_partitioned(cur)
+                # An interrupted concurrent build leaves an invalid index behind
+                cur.execute("""
+                    SELECT c.relname FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid
+                    WHERE NOT i.indisvalid AND c.relkind = 'i' AND c.relname LIKE 'documents%_embedding_%_idx';
+                """)
+                for name in [row[0] for row in cur.fetchall()]:
+                    cur.execute(sql.SQL("DROP INDEX CONCURRENTLY IF EXISTS {};").format(sql.Identifier(name)))
+                # Drop ANN indexes of another type / storage mode (or all of them on rebuild)
+                wanted = ann_index_name("documents", index_type) if index_type in _ANN_OPTIONS else None
+                cur.execute("""
+                    SELECT c.relname FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid
+                    WHERE i.indrelid = 'documents'::regclass AND c.relname LIKE 'documents_embedding_%_idx';
+                """)
+                for name in [row[0] for row in cur.fetchall()]:
+                    if name != wanted or rebuild:
+                        # Dropping a partitioned index drops its partitions' indexes; it can't be concurrent
+                        cur.execute(sql.SQL("DROP INDEX {} IF EXISTS {};").format(
+                            sql.SQL("" if partitioned else "CONCURRENTLY"), sql.Identifier(name)))
+                if index_type in _ANN_OPTIONS:
+                    _ensure_ann_index(cur, index_type, "documents", log)
+        finally:
+            conn.autocommit = False
+
+
+def ensure_langchain_indexes(pool: Optional[ConnectionPool] = None, log: Callable[[str], None] = print) -> bool:
+    """
+    Indexes on LangChain's agent table (langchain_pg_embedding): the full-text GIN index
+    for hybrid retrieval and the per-source unique content hash. LangChain creates
+    that table on first ingest, so this is reconciled on every migrate_vector_db run
+    rather than versioned; the expressions must match DocumentProcessor's queries.
+    Returns False while the table is missing.
+    """
+    pool = pool or get_vector_db_pool()
+    with pool.connection() as conn:
+        conn.autocommit = True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT to_regclass('langchain_pg_embedding') IS NOT NULL;")
+                if not cur.fetchone()[0]:
+                    return False
+                log("🛠️ Ensuring full-text index on langchain_pg_embedding")
+                cur.execute("""
+                    CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_langchain_embedding_tsv ON langchain_pg_embedding
+                    USING gin (to_tsvector('english', coalesce(document, '')));
+                """)
+                # Chunks ingested before hashing have no content_hash and are not constrained
+                log("🛠️ Ensuring unique content hash on langchain_pg_embedding")
+                cur.execute("""
+                    CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS idx_langchain_embedding_source_content_hash
+                    ON langchain_pg_embedding (collection_id, (cmetadata->>'source'), (cmetadata->>'content_hash'))
+                    WHERE cmetadata->>'content_hash' IS NOT NULL;
+                """)
+                # Superseded per-collection constraint: it kept a chunk in only one source
+                cur.execute("DROP INDEX CONCURRENTLY IF EXISTS idx_langchain_embedding_content_hash;")
+                return True
+        finally:
+            conn.autocommit = False
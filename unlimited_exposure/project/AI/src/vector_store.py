@@ -2,6 +2,7 @@ import sys
 import os
 import django
 import psycopg2
+from psycopg2 import sql
 from psycopg2.extras import execute_values
 
 # --- DJANGO SETUP BLOCK ---
@@ -21,137 +22,515 @@ if not settings.configured:
 # --- IMPORTS ---
 # Use relative import if inside package, or absolute fallback
 try:
-    from .llm_gateway import UnifiedLLMClient
+    from .db_pool import get_vector_db_pool
+    from .vector_schema import content_hash, dedicated_partition_name, first_stage_distance, vector_storage
+    from .retrieval import CANDIDATE_FACTOR, RRF_K, TEXT_SEARCH_CONFIG, RetrievedChunk, lexical_query, use_hybrid
+    from .llm_gateway import get_async_llm_client, get_llm_client
+    from .tokens import count_tokens
 except ImportError:
-    from llm_gateway import UnifiedLLMClient
+    from db_pool import get_vector_db_pool
+    from vector_schema import content_hash, dedicated_partition_name, first_stage_distance, vector_storage
+    from retrieval import CANDIDATE_FACTOR, RRF_K, TEXT_SEARCH_CONFIG, RetrievedChunk, lexical_query, use_hybrid
+    from llm_gateway import get_async_llm_client, get_llm_client
+    from tokens import count_tokens
+
+import asyncio
+import io
+import struct
+from typing import List, Optional
+
+import numpy as np
+
+# ANN index type and search-time tuning (the index itself is built by vector_schema)
+VECTOR_INDEX_TYPE = getattr(settings, 'VECTOR_INDEX_TYPE', 'hnsw')
+HNSW_EF_SEARCH = getattr(settings, 'VECTOR_HNSW_EF_SEARCH', 100)
+IVFFLAT_PROBES = getattr(settings, 'VECTOR_IVFFLAT_PROBES', 10)
+ITERATIVE_SCAN = getattr(settings, 'VECTOR_ITERATIVE_SCAN', 'relaxed_order')
+MAX_SCAN_TUPLES = getattr(settings, 'VECTOR_MAX_SCAN_TUPLES', 20000)
+# Candidates fetched per result from a quantized index before the exact re-rank
+RERANK_FACTOR = getattr(settings, 'VECTOR_RERANK_FACTOR', 4)
+
+_installed_pgvector = None
+
+# Column order shared by the INSERT and COPY load paths
+DOCUMENT_COLUMNS = ("client_id", "document_id", "content", "embedding", "token_count", "content_hash")
+INSERT_SQL = (
+    f"INSERT INTO documents ({', '.join(DOCUMENT_COLUMNS)}) VALUES %s "
+    "ON CONFLICT (client_id, document_id, content_hash) DO NOTHING RETURNING 1"
+)
+COPY_SQL = f"COPY documents ({', '.join(DOCUMENT_COLUMNS)}) FROM STDIN WITH (FORMAT binary)"
+BULK_LOAD_THRESHOLD = getattr(settings, 'VECTOR_BULK_LOAD_THRESHOLD', 1000)
+COPY_BATCH_SIZE = getattr(settings, 'VECTOR_COPY_BATCH_SIZE', 2000)
+
+# PGCOPY binary format: signature, flags, header extension length; trailer is a -1 field count
+_PGCOPY_HEADER = b"PGCOPY\n\xff\r\n\x00" + struct.pack(">ii", 0, 0)
+_PGCOPY_TRAILER = struct.pack(">h", -1)
+_NULL_FIELD = struct.pack(">i", -1)
+
+
+def _copy_text(value) -> bytes:
+    if value is None:
+        return _NULL_FIELD
+    data = str(value).encode("utf-8")
+    return struct.pack(">i", len(data)) + data
+
+
+def _copy_int4(value) -> bytes:
+    return _NULL_FIELD if value is None else struct.pack(">ii", 4, value)
+
+
+def _copy_vector(vector) -> bytes:
+    """pgvector binary input: int16 dimensions, int16 unused, big-endian float32 values."""
+    values = np.asarray(vector, dtype=">f4")
+    return struct.pack(">ihh", 4 + values.nbytes, len(values), 0) + values.tobytes()
+
+
+def _binary_copy_buffer(rows) -> io.BytesIO:
+    """Encodes (client_id, document_id, content, embedding, token_count, content_hash) rows for COPY ... (FORMAT binary)."""
+    buffer = io.BytesIO()
+    buffer.write(_PGCOPY_HEADER)
+    field_count = struct.pack(">h", len(DOCUMENT_COLUMNS))
+    for client_id, document_id, content, embedding, token_count, chunk_hash in rows:
+        buffer.write(field_count)
+        buffer.write(_copy_text(client_id))
+        buffer.write(_copy_text(document_id))
+        buffer.write(_copy_text(content))
+        buffer.write(_copy_vector(embedding))
+        buffer.write(_copy_int4(token_count))
+        buffer.write(_copy_text(chunk_hash))
+    buffer.write(_PGCOPY_TRAILER)
+    buffer.seek(0)
+    return buffer
+
+
+def _retrieved_chunks(rows) -> List[RetrievedChunk]:
+    """(content, similarity, document_id, id, token_count) rows -> RetrievedChunk list, order kept."""
+    return [
+        RetrievedChunk(content, similarity, document_id, str(row_id), token_count)
+        for content, similarity, document_id, row_id, token_count in rows
+    ]
+
+
+def _parse_version(version: str) -> tuple:
+    """'0.8.0' -> (0, 8, 0); suffixes like '0.7.4-dev' are ignored."""
+    parts = []
+    for part in version.split("."):
+        digits = "".join(ch for ch in part if ch.isdigit())
+        parts.append(int(digits) if digits else 0)
+    return tuple(parts)
 
-import os
-import psycopg2
 
 class VectorStore:
+    """
+    Raw pgvector store for client-scoped chunks (`documents` table).
+
+    Every query filters on client_id, so with the partitioned layout (see
+    vector_schema) Postgres prunes each query to the client's partition.
+    """
+
     def __init__(self):
-        self.conn = psycopg2.connect(
-            dbname=os.getenv("POSTGRES_DB"),
-            user=os.getenv("POSTGRES_USER"),
-            password=os.getenv("POSTGRES_PASSWORD"),
-            host=os.getenv("POSTGRES_HOST", "postgres"),
-            port=int(os.getenv("POSTGRES_PORT")),
+        # Connections are borrowed per operation from the process-wide pool, so
+        # instances are cheap and concurrent requests don't share one connection
+        self.pool = get_vector_db_pool()
+        self.client = get_llm_client()
+        self.async_client = get_async_llm_client()
+        # No DDL here: the schema is managed by `python manage.py migrate_vector_db`
+
+    @staticmethod
+    def _pgvector_version(cur) -> tuple:
+        """Installed pgvector version, read once per process (decides iterative scan support)."""
+        global _installed_pgvector
+        if _installed_pgvector is None:
+            cur.execute("SELECT extversion FROM pg_extension WHERE extname = 'vector';")
+            row = cur.fetchone()
+            _installed_pgvector = _parse_version(row[0]) if row else (0,)
+        return _installed_pgvector
+
+    def _apply_search_settings(self, cur, limit: int):
+        """
+        Per-transaction ANN search parameters (SET LOCAL semantics via set_config).
+        Iterative index scans (pgvector >= 0.8) keep scanning the index until `limit`
+        rows pass the client_id filter, instead of returning too few for small tenants.
+        """
+        if VECTOR_INDEX_TYPE == "hnsw":
+            # ef_search below LIMIT would cap the number of rows returned
+            params = {"hnsw.ef_search": max(HNSW_EF_SEARCH, limit)}
+            scan_prefix = "hnsw"
+        elif VECTOR_INDEX_TYPE == "ivfflat":
+            params = {"ivfflat.probes": IVFFLAT_PROBES}
+            scan_prefix = "ivfflat"
+        else:
+            return
+        if ITERATIVE_SCAN != "off" and self._pgvector_version(cur) >= (0, 8, 0):
+            # IVFFlat only supports relaxed ordering
+            params[f"{scan_prefix}.iterative_scan"] = ITERATIVE_SCAN if scan_prefix == "hnsw" else "relaxed_order"
+            if scan_prefix == "hnsw":
+                params["hnsw.max_scan_tuples"] = MAX_SCAN_TUPLES
+        cur.execute(
+            "SELECT " + ", ".join("set_config(%s, %s, true)" for _ in params) + ";",
+            [value for item in params.items() for value in (item[0], str(item[1]))]
         )
-        self.client = UnifiedLLMClient()
-        self._init_db()
-
-    def _init_db(self):
-        """Enable pgvector extension and create table with client and document isolation."""
-        with self.conn.cursor() as cur:
-            cur.execute("CREATE EXTENSION IF NOT EXISTS vector;")
-            cur.execute("""
-                CREATE TABLE IF NOT EXISTS documents (
-                    id SERIAL PRIMARY KEY,
-                    client_id TEXT,
-                    document_id TEXT,
-                    content TEXT,
-                    embedding vector(1536) 
-                );
-            """)
-            # Migration: Ensure client_id and document_id columns exist
-            cur.execute("""
-                DO $$ 
-                BEGIN 
-                    IF NOT EXISTS (SELECT 1 FROM information_schema.columns WHERE table_name='documents' AND column_name='client_id') THEN 
-                        ALTER TABLE documents ADD COLUMN client_id TEXT; 
-                        CREATE INDEX idx_client_id ON documents(client_id);
-                    END IF;
-                    
-                    IF NOT EXISTS (SELECT 1 FROM information_schema.columns WHERE table_name='documents' AND column_name='document_id') THEN 
-                        ALTER TABLE documents ADD COLUMN document_id TEXT; 
-                        CREATE INDEX idx_document_id ON documents(document_id);
-                    END IF;
-                END $$;
-            """)
-        self.conn.commit()
-
-    def add_documents(self, client_id: str, docs_with_metadata: list):
+
+    def add_documents(self, client_id: str, docs_with_metadata: list, bulk: Optional[bool] = None) -> dict:
         """
         Generate embeddings and save to DB for a specific client.
+        Chunks a document already has (same content_hash) and repeats within a document
+        are skipped; chunks the client stores under another document reuse that
+        embedding instead of calling the API.
         
         Args:
             client_id: The client identifier.
             docs_with_metadata: A list of tuples: [(text_chunk, source_document_id), ...]
+            bulk: Load through binary COPY in committed batches. Defaults to True
+                  from VECTOR_BULK_LOAD_THRESHOLD new chunks on.
+
+        Returns:
+            {"added": inserted chunk count, "skipped": duplicate chunk count}
         """
-        if not docs_with_metadata: return
-        
-        data = []
-        # Separate texts for batch embedding (optional optimization, here we do loop for simplicity/safety)
-        print(f"⚙️ Generating embeddings for {len(docs_with_metadata)} chunks...")
+        if not docs_with_metadata: return {"added": 0, "skipped": 0}
+
+        new_docs = self._new_chunks(client_id, docs_with_metadata)
+        skipped = len(docs_with_metadata) - len(new_docs)
+        if skipped:
+            print(f"♻️ Skipping {skipped} duplicate chunks for Client: {client_id}")
+        if not new_docs:
+            return {"added": 0, "skipped": skipped}
+
+        if bulk is None:
+            bulk = len(new_docs) >= BULK_LOAD_THRESHOLD
+        if bulk:
+            added = self._bulk_add_documents(client_id, new_docs)
+            return {"added": added, "skipped": len(docs_with_metadata) - added}
         
+        print(f"⚙️ Generating embeddings for {len(new_docs)} chunks...")
+
+        # One batched call for the chunks not stored elsewhere; vectors come back in input order.
+        # We explicitly strip header lines if needed, but keeping them in 'content' is usually good for context.
+        vectors = self._embed(client_id, [(text, chunk_hash) for text, _, chunk_hash in new_docs])
+        # Token counts are computed once here so query-time context packing needs no tokenizer
+        data = [
+            (client_id, doc_id, text, vector, count_tokens(text, self.client.chat_model), chunk_hash)
+            for (text, doc_id, chunk_hash), vector in zip(new_docs, vectors)
+        ]
+
+        with self.pool.connection() as conn:
+            with conn.cursor() as cur:
+                added = self._insert_rows(cur, data)
+            conn.commit()
+        print(f"✅ Added {added} documents for Client: {client_id}")
+        return {"added": added, "skipped": len(docs_with_metadata) - added}
+
+    def _new_chunks(self, client_id: str, docs_with_metadata: list) -> list:
+        """(text, document_id, content_hash) for chunks not yet stored in their document, first occurrence kept."""
+        unique = {}
         for text, doc_id in docs_with_metadata:
-            # We explicitly strip header lines if needed, but keeping them in 'content' is usually good for context.
-            vector = self.client.get_embedding(text)
-            data.append((client_id, doc_id, text, vector))
-
-        with self.conn.cursor() as cur:
-            execute_values(cur, 
-                "INSERT INTO documents (client_id, document_id, content, embedding) VALUES %s", 
-                data
-            )
-        self.conn.commit()
-        print(f"✅ Added {len(docs_with_metadata)} documents for Client: {client_id}")
+            unique.setdefault((doc_id, content_hash(text)), text)
+        with self.pool.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    "SELECT document_id, content_hash FROM documents "
+                    "WHERE client_id = %s AND content_hash = ANY(%s);",
+                    (client_id, list({chunk_hash for _, chunk_hash in unique}))
+                )
+                stored = set(cur.fetchall())
+            conn.commit()
+        return [(text, doc_id, chunk_hash) for (doc_id, chunk_hash), text in unique.items()
+                if (doc_id, chunk_hash) not in stored]
+
+    @staticmethod
+    def _stored_embeddings(cur, client_id: str, hashes: list) -> dict:
+        """content_hash -> embedding for the chunks among `hashes` the client already stores (any document)."""
+        cur.execute(
+            "SELECT DISTINCT ON (content_hash) content_hash, embedding::real[] FROM documents "
+            "WHERE client_id = %s AND content_hash = ANY(%s);",
+            (client_id, hashes)
+        )
+        return dict(cur.fetchall())
+
+    def _embed(self, client_id: str, chunks: list, stored: Optional[dict] = None) -> list:
+        """
+        Vectors for (text, content_hash) pairs, in order. Embeddings the client already
+        stores are copied; the rest (each distinct text once) go out in one batched call.
+        """
+        if stored is None:
+            with self.pool.connection() as conn:
+                with conn.cursor() as cur:
+                    stored = self._stored_embeddings(cur, client_id, list({chunk_hash for _, chunk_hash in chunks}))
+                conn.commit()
+        missing = {}
+        for text, chunk_hash in chunks:
+            if chunk_hash not in stored:
+                missing.setdefault(chunk_hash, text)
+        if len(missing) < len(chunks):
+            print(f"♻️ Reusing {len(chunks) - len(missing)} stored embeddings for Client: {client_id}")
+        vectors = dict(stored)
+        if missing:
+            vectors.update(zip(missing, self.client.get_embeddings(list(missing.values()))))
+        return [vectors[chunk_hash] for _, chunk_hash in chunks]
+
+    @staticmethod
+    def _insert_rows(cur, rows: list) -> int:
+        """INSERT that leaves chunks stored concurrently by another ingest alone; returns rows inserted."""
+        return len(execute_values(cur, INSERT_SQL, rows, fetch=True))
+
+    def _bulk_add_documents(self, client_id: str, docs_with_metadata: list) -> int:
+        """
+        Bulk load: embed and COPY one batch of VECTOR_COPY_BATCH_SIZE chunks at a time,
+        committing after each, so memory stays bounded by the batch size and a failure
+        only loses the batch in flight. COPY has no ON CONFLICT, so a batch that races
+        another ingest of the same chunks is retried as a plain INSERT.
+        A pooled connection is checked out per batch, only once its embeddings are
+        back, so a long load does not hold one through every embedding call.
+        Takes (text, document_id, content_hash) tuples; returns rows inserted.
+        """
+        total = len(docs_with_metadata)
+        print(f"⚙️ Bulk loading {total} chunks in batches of {COPY_BATCH_SIZE}...")
+        loaded = added = 0
+        for start in range(0, total, COPY_BATCH_SIZE):
+            batch = docs_with_metadata[start:start + COPY_BATCH_SIZE]
+            vectors = self._embed(client_id, [(text, chunk_hash) for text, _, chunk_hash in batch])
+            rows = [
+                (client_id, doc_id, text, vector, count_tokens(text, self.client.chat_model), chunk_hash)
+                for (text, doc_id, chunk_hash), vector in zip(batch, vectors)
+            ]
+            with self.pool.connection() as conn:
+                try:
+                    with conn.cursor() as cur:
+                        cur.copy_expert(COPY_SQL, _binary_copy_buffer(rows))
+                    added += len(rows)
+                except psycopg2.errors.UniqueViolation:
+                    conn.rollback()
+                    with conn.cursor() as cur:
+                        added += self._insert_rows(cur, rows)
+                conn.commit()
+            loaded += len(batch)
+            print(f"📦 Loaded {loaded}/{total} chunks")
+        print(f"✅ Added {added} documents for Client: {client_id}")
+        return added
+
+    def sync_document(self, client_id: str, document_id: str, chunks: list) -> dict:
+        """
+        Re-ingests a document incrementally: `chunks` (its new text chunks, in order)
+        are diffed against the content hashes stored for document_id. New chunks reuse
+        the embedding of a copy in another document when the client has one, the rest
+        are embedded; stored chunks missing from the new version are deleted.
+
+        Embedding happens before the write transaction, so no connection or lock is held
+        during API calls. The write then takes a per-document advisory lock, re-reads
+        the stored hashes and applies the diff as it stands at that point.
+
+        Returns:
+            {"added": n, "removed": n, "unchanged": n, "skipped": repeats within the document}
+        """
+        wanted = {}
+        for text in chunks:
+            wanted.setdefault(content_hash(text), text)
+
+        stored_hashes = self._document_hashes(client_id, document_id)
+        if not stored_hashes:
+            # First version: nothing to diff or delete, take the regular (bulk-capable) path
+            result = self.add_documents(client_id, [(text, document_id) for text in chunks])
+            return {"added": result["added"], "removed": 0, "unchanged": 0, "skipped": result["skipped"]}
+
+        new_hashes = [chunk_hash for chunk_hash in wanted if chunk_hash not in stored_hashes]
+        vectors = {}
+        if new_hashes:
+            print(f"⚙️ Re-embedding {len(new_hashes)} changed chunks of {document_id}...")
+            vectors = dict(zip(new_hashes, self._embed(
+                client_id, [(wanted[chunk_hash], chunk_hash) for chunk_hash in new_hashes]
+            )))
+
+        with self.pool.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("SELECT pg_advisory_xact_lock(hashtext(%s), hashtext(%s));", (client_id, document_id))
+                cur.execute(
+                    "SELECT id, content_hash FROM documents WHERE client_id = %s AND document_id = %s;",
+                    (client_id, document_id)
+                )
+                stored = cur.fetchall()
+                stored_hashes = {chunk_hash for _, chunk_hash in stored}
+                removed_ids = [row_id for row_id, chunk_hash in stored if chunk_hash not in wanted]
+                new_hashes = [chunk_hash for chunk_hash in wanted if chunk_hash not in stored_hashes]
+                # Only when a concurrent sync removed chunks since the first read
+                late = [chunk_hash for chunk_hash in new_hashes if chunk_hash not in vectors]
+                if late:
+                    vectors.update(zip(late, self._embed(
+                        client_id, [(wanted[chunk_hash], chunk_hash) for chunk_hash in late],
+                        self._stored_embeddings(cur, client_id, late)
+                    )))
+
+                if removed_ids:
+                    cur.execute(
+                        "DELETE FROM documents WHERE client_id = %s AND id = ANY(%s);", (client_id, removed_ids)
+                    )
+                added = 0
+                if new_hashes:
+                    added = self._insert_rows(cur, [
+                        (client_id, document_id, wanted[chunk_hash], vectors[chunk_hash],
+                         count_tokens(wanted[chunk_hash], self.client.chat_model), chunk_hash)
+                        for chunk_hash in new_hashes
+                    ])
+            conn.commit()
+
+        result = {
+            "added": added,
+            "removed": len(removed_ids),
+            "unchanged": len(wanted) - len(new_hashes),
+            "skipped": len(chunks) - len(wanted),
+        }
+        print(f"🔁 Synced {document_id} for Client: {client_id}: {result}")
+        return result
+
+    def _document_hashes(self, client_id: str, document_id: str) -> set:
+        """Content hashes currently stored for one document."""
+        with self.pool.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    "SELECT content_hash FROM documents WHERE client_id = %s AND document_id = %s;",
+                    (client_id, document_id)
+                )
+                hashes = {row[0] for row in cur.fetchall()}
+            conn.commit()
+        return hashes
 
     def search(self, client_id: str, query: str, limit: int = 3):
         """Semantic search filtered by client_id."""
+        return [chunk.text for chunk in self.search_chunks(client_id, query, limit)]
+
+    def search_chunks(self, client_id: str, query: str, limit: int = 3) -> List[RetrievedChunk]:
+        """Like search, but returns RetrievedChunk hits (score, source, chunk id, token count), best first."""
         query_vector = self.client.get_embedding(query)
-        
-        with self.conn.cursor() as cur:
-            # Return content AND document_id if needed (currently just returning content)
-            cur.execute("""
-                SELECT content, document_id, 1 - (embedding <=> %s::vector) as similarity
-                FROM documents
-                WHERE client_id = %s
-                ORDER BY similarity DESC
-                LIMIT %s;
-            """, (query_vector, client_id, limit))
-            results = cur.fetchall()
-            
-        # Just return text for RAG context, but you could return (text, doc_id) if your engine needs citations
-        return [row[0] for row in results]
+        if use_hybrid(query):
+            return self._hybrid_search_by_vector(client_id, query, query_vector, limit)
+        return self._search_by_vector(client_id, query_vector, limit)
+
+    async def asearch(self, client_id: str, query: str, limit: int = 3):
+        """Async semantic search: the query embedding is awaited, the SQL runs in a worker thread."""
+        return [chunk.text for chunk in await self.asearch_chunks(client_id, query, limit)]
+
+    async def asearch_chunks(self, client_id: str, query: str, limit: int = 3) -> List[RetrievedChunk]:
+        query_vector = await self.async_client.get_embedding(query)
+        if use_hybrid(query):
+            return await asyncio.to_thread(self._hybrid_search_by_vector, client_id, query, query_vector, limit)
+        return await asyncio.to_thread(self._search_by_vector, client_id, query_vector, limit)
+
+    def _search_by_vector(self, client_id: str, query_vector: list, limit: int) -> List[RetrievedChunk]:
+        # The inner query orders by the bare distance operator the ANN index serves
+        # (float32, halfvec or binary per VECTOR_STORAGE) and over-fetches candidates
+        # when the index is quantized; the outer query re-ranks them by exact
+        # full-precision cosine distance, which also fixes relaxed iterative-scan order.
+        candidates = limit if vector_storage() == "full" else limit * RERANK_FACTOR
+        with self.pool.connection() as conn:
+            with conn.cursor() as cur:
+                self._apply_search_settings(cur, candidates)
+                cur.execute(f"""
+                    SELECT content, 1 - (embedding <=> %(query)s::vector) AS similarity, document_id, id, token_count
+                    FROM (
+                        SELECT id, document_id, content, token_count, embedding
+                        FROM documents
+                        WHERE client_id = %(client_id)s
+                        ORDER BY {first_stage_distance()}
+                        LIMIT %(candidates)s
+                    ) candidates
+                    ORDER BY embedding <=> %(query)s::vector
+                    LIMIT %(limit)s;
+                """, {"query": query_vector, "client_id": client_id, "candidates": candidates, "limit": limit})
+                rows = cur.fetchall()
+            # End the read transaction (and its SET LOCALs) instead of idling in it
+            conn.commit()
+        return _retrieved_chunks(rows)
+
+    def _hybrid_search_by_vector(self, client_id: str, query_text: str, query_vector: list,
+                                 limit: int) -> List[RetrievedChunk]:
+        """
+        Vector and full-text candidates fused with reciprocal-rank fusion, in one round trip.
+        Each side contributes limit x CANDIDATE_FACTOR ranked ids (the vector side re-ranked
+        by exact cosine, as in _search_by_vector); rows are ordered by fused score but still
+        carry cosine similarity, so similarity thresholds downstream keep their meaning.
+        """
+        candidates = limit * CANDIDATE_FACTOR
+        first_stage = candidates if vector_storage() == "full" else candidates * RERANK_FACTOR
+        with self.pool.connection() as conn:
+            with conn.cursor() as cur:
+                self._apply_search_settings(cur, first_stage)
+                cur.execute(f"""
+                    WITH vector_hits AS (
+                        SELECT id, row_number() OVER (ORDER BY embedding <=> %(query)s::vector) AS rank
+                        FROM (
+                            SELECT id, embedding
+                            FROM documents
+                            WHERE client_id = %(client_id)s
+                            ORDER BY {first_stage_distance()}
+                            LIMIT %(first_stage)s
+                        ) ann
+                        ORDER BY rank
+                        LIMIT %(candidates)s
+                    ),
+                    text_hits AS (
+                        SELECT id, row_number() OVER (ORDER BY ts_rank_cd(content_tsv, tsq) DESC) AS rank
+                        FROM documents, to_tsquery('{TEXT_SEARCH_CONFIG}', %(tsquery)s) tsq
+                        WHERE client_id = %(client_id)s AND content_tsv @@ tsq
+                        ORDER BY rank
+                        LIMIT %(candidates)s
+                    ),
+                    fused AS (
+                        SELECT id, sum(1.0 / (%(rrf_k)s + rank)) AS score
+                        FROM (SELECT * FROM vector_hits UNION ALL SELECT * FROM text_hits) hits
+                        GROUP BY id
+                        ORDER BY score DESC
+                        LIMIT %(limit)s
+                    )
+                    SELECT d.content, 1 - (d.embedding <=> %(query)s::vector) AS similarity,
+                           d.document_id, d.id, d.token_count
+                    FROM fused
+                    JOIN documents d ON d.id = fused.id AND d.client_id = %(client_id)s
+                    ORDER BY fused.score DESC;
+                """, {"query": query_vector, "client_id": client_id, "tsquery": lexical_query(query_text),
+                      "first_stage": first_stage, "candidates": candidates, "rrf_k": RRF_K, "limit": limit})
+                rows = cur.fetchall()
+            conn.commit()
+        return _retrieved_chunks(rows)
 
     def get_all_text(self, client_id: str):
         """Fetch all text for a specific client (for FAQ generation)."""
-        with self.conn.cursor() as cur:
-            cur.execute("SELECT content FROM documents WHERE client_id = %s;", (client_id,))
-            return " ".join([row[0] for row in cur.fetchall()])
+        with self.pool.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("SELECT content FROM documents WHERE client_id = %s;", (client_id,))
+                return " ".join([row[0] for row in cur.fetchall()])
         
     def get_document_text(self, client_id: str, document_id: str) -> str:
         """Fetch all text chunks associated with a specific document_id."""
-        with self.conn.cursor() as cur:
-            cur.execute(
-                "SELECT content FROM documents WHERE client_id = %s AND document_id = %s ORDER BY id ASC;", 
-                (client_id, document_id)
-            )
-            rows = cur.fetchall()
-            return "\n".join([row[0] for row in rows]) if rows else ""
+        with self.pool.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    "SELECT content FROM documents WHERE client_id = %s AND document_id = %s ORDER BY id ASC;", 
+                    (client_id, document_id)
+                )
+                rows = cur.fetchall()
+                return "\n".join([row[0] for row in rows]) if rows else ""
 
     def get_url_content_for_client(self, client_id: str, max_chars: int = 2000) -> str:
         """
         Auto-discovers content from documents that act as URLs (start with http/https).
         Used for fallback system prompt generation.
         """
-        with self.conn.cursor() as cur:
-            # Postgres regex (~*) looks for document_id starting with http or https (case insensitive)
-            cur.execute("""
-                SELECT content 
-                FROM documents 
-                WHERE client_id = %s AND document_id ~* '^https?://'
-                ORDER BY id ASC
-                LIMIT 50;
-            """, (client_id,))
-            rows = cur.fetchall()
+        with self.pool.connection() as conn:
+            with conn.cursor() as cur:
+                # Postgres regex (~*) looks for document_id starting with http or https (case insensitive)
+                cur.execute("""
+                    SELECT content 
+                    FROM documents 
+                    WHERE client_id = %s AND document_id ~* '^https?://'
+                    ORDER BY id ASC
+                    LIMIT 50;
+                """, (client_id,))
+                rows = cur.fetchall()
             
-            if not rows:
-                return ""
+                if not rows:
+                    return ""
             
-            combined = "\n".join([row[0] for row in rows])
-            return combined[:max_chars]
+                combined = "\n".join([row[0] for row in rows])
+                return combined[:max_chars]
     
     def delete_documents(self, client_id: str, document_id: str) -> int:
         """
@@ -164,12 +543,35 @@ class VectorStore:
         Returns:
             Number of rows deleted.
         """
-        with self.conn.cursor() as cur:
-            cur.execute(
-                "DELETE FROM documents WHERE client_id = %s AND document_id = %s;",
-                (client_id, document_id)
-            )
-            deleted_count = cur.rowcount
-        self.conn.commit()
+        with self.pool.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    "DELETE FROM documents WHERE client_id = %s AND document_id = %s;",
+                    (client_id, document_id)
+                )
+                deleted_count = cur.rowcount
+            conn.commit()
         print(f"🗑️ Deleted {deleted_count} document chunks for Client: {client_id}, Document: {document_id}")
-        return deleted_count
\ No newline at end of file
+        return deleted_count
+
+    def delete_client(self, client_id: str) -> int:
+        """
+        Removes every chunk of a client (tenant offboarding). A tenant with a dedicated
+        partition is detached and dropped instead of deleted row by row.
+        Returns the number of chunks removed.
+        """
+        partition = dedicated_partition_name(client_id)
+        with self.pool.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("SELECT to_regclass(%s) IS NOT NULL;", (partition,))
+                if cur.fetchone()[0]:
+                    cur.execute(sql.SQL("SELECT count(*) FROM {};").format(sql.Identifier(partition)))
+                    deleted_count = cur.fetchone()[0]
+                    cur.execute(sql.SQL("ALTER TABLE documents DETACH PARTITION {};").format(sql.Identifier(partition)))
+                    cur.execute(sql.SQL("DROP TABLE {};").format(sql.Identifier(partition)))
+                else:
+                    cur.execute("DELETE FROM documents WHERE client_id = %s;", (client_id,))
+                    deleted_count = cur.rowcount
+            conn.commit()
+        print(f"🗑️ Deleted {deleted_count} document chunks for Client: {client_id}")
+        return deleted_count
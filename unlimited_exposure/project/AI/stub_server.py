@@ -0,0 +1,314 @@
+"""
+Local stand-in for the OpenAI and Anthropic APIs, for load tests without network or cost.
+
+Serves the three endpoints the gateway uses:
+    POST /v1/embeddings          (OpenAI SDK, BASE_URL=http://localhost:9000/v1)
+    POST /v1/chat/completions    (OpenAI SDK, streaming and non-streaming)
+    POST /v1/messages            (Anthropic SDK, BASE_URL=http://localhost:9000)
+
+Run:
+    python stub_server.py --port 9000
+    # or: uvicorn stub_server:app --port 9000 --workers 4
+
+Behaviour is configured with environment variables:
+    STUB_LATENCY             time to first byte of a chat call, e.g. "fixed:200",
+                             "uniform:100,400", "normal:300,80", "lognormal:300,0.6"
+                             (median ms, sigma) or "exp:250" (mean ms). Default "lognormal:300,0.5".
+    STUB_EMBEDDING_LATENCY   same format, per embeddings request. Default "fixed:20".
+    STUB_TOKENS_PER_SECOND   generation speed for streamed and non-streamed answers (default 60).
+    STUB_ANSWER_TOKENS       answer length in tokens (default 80).
+    STUB_ERROR_RATE          fraction of requests that fail (default 0).
+    STUB_ERROR_STATUSES      statuses picked for failures, e.g. "429,500,503" (default).
+    STUB_EMBEDDING_DIMENSIONS  vector size unless the request passes `dimensions` (default 1536).
+    STUB_SEED                seed for latency / error sampling (answers and embeddings are
+                             always deterministic: they depend only on the input).
+
+Embeddings come from the hashing backend, so identical text always gets the same
+vector and lexically similar text gets similar vectors. Repeated system prompts are
+reported as prompt-cache hits, like the real providers.
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import math
+import os
+import random
+import sys
+import time
+import uuid
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from src.embedding_backends import HashingEmbeddingBackend
+
+app = FastAPI(title="LLM Provider Stub")
+
+_rng = random.Random(os.getenv("STUB_SEED"))
+
+ANSWER_WORDS = (
+    "the restaurant opens at nine and closes at ten on weekdays you can book a table online "
+    "our menu includes vegetarian and gluten free options please contact the front desk for "
+    "details parking is available behind the building and delivery is offered within the city"
+).split()
+
+
+# ==========================================
+# CONFIGURATION
+# ==========================================
+
+def parse_latency(spec: str):
+    """Returns a function sampling a delay in seconds from a "kind:params" spec (values in ms)."""
+    kind, _, raw = spec.partition(":")
+    params = [float(p) for p in raw.split(",") if p.strip()]
+    kind = kind.strip().lower()
+    if kind == "fixed":
+        return lambda: params[0] / 1000
+    if kind == "uniform":
+        return lambda: _rng.uniform(params[0], params[1]) / 1000
+    if kind == "normal":
+        return lambda: max(0.0, _rng.gauss(params[0], params[1])) / 1000
+    if kind == "lognormal":
+        # params: median (ms), sigma of the underlying normal
+        return lambda: _rng.lognormvariate(math.log(params[0]), params[1]) / 1000
+    if kind == "exp":
+        return lambda: _rng.expovariate(1 / params[0]) / 1000
+    raise ValueError(f"Unknown latency distribution: {spec}")
+
+
+CHAT_LATENCY = parse_latency(os.getenv("STUB_LATENCY", "lognormal:300,0.5"))
+EMBEDDING_LATENCY = parse_latency(os.getenv("STUB_EMBEDDING_LATENCY", "fixed:20"))
+TOKENS_PER_SECOND = float(os.getenv("STUB_TOKENS_PER_SECOND", 60))
+ANSWER_TOKENS = int(os.getenv("STUB_ANSWER_TOKENS", 80))
+ERROR_RATE = float(os.getenv("STUB_ERROR_RATE", 0))
+ERROR_STATUSES = [int(s) for s in os.getenv("STUB_ERROR_STATUSES", "429,500,503").split(",") if s.strip()]
+EMBEDDING_DIMENSIONS = int(os.getenv("STUB_EMBEDDING_DIMENSIONS", 1536))
+
+_encoders = {}
+_prompt_cache = OrderedDict()  # system-prompt hash -> True (LRU), to report prompt-cache hits
+PROMPT_CACHE_SIZE = 1024
+
+
+# ==========================================
+# HELPERS
+# ==========================================
+
+def estimate_tokens(text: str) -> int:
+    return max(1, len(text) // 4) if text else 0
+
+
+def encoder(dimensions: int) -> HashingEmbeddingBackend:
+    if dimensions not in _encoders:
+        _encoders[dimensions] = HashingEmbeddingBackend(dimensions)
+    return _encoders[dimensions]
+
+
+def answer_tokens(prompt: str) -> List[str]:
+    """Deterministic answer for a prompt: the same prompt always gets the same words."""
+    seed = int.from_bytes(hashlib.blake2b(prompt.encode("utf-8"), digest_size=8).digest(), "little")
+    picker = random.Random(seed)
+    words = [picker.choice(ANSWER_WORDS) for _ in range(ANSWER_TOKENS)]
+    words[0] = words[0].capitalize()
+    return [w if i == 0 else f" {w}" for i, w in enumerate(words)] + ["."]
+
+
+def cache_split(system_text: str, prompt_tokens: int) -> Tuple[int, int]:
+    """(cached_tokens, cache_write_tokens): a system prompt seen before counts as cached."""
+    if not system_text:
+        return 0, 0
+    key = hashlib.blake2b(system_text.encode("utf-8"), digest_size=16).hexdigest()
+    system_tokens = min(estimate_tokens(system_text), prompt_tokens)
+    if key in _prompt_cache:
+        _prompt_cache.move_to_end(key)
+        return system_tokens, 0
+    _prompt_cache[key] = True
+    if len(_prompt_cache) > PROMPT_CACHE_SIZE:
+        _prompt_cache.popitem(last=False)
+    return 0, system_tokens
+
+
+def injected_error(anthropic_format: bool) -> Optional[JSONResponse]:
+    if not ERROR_RATE or _rng.random() >= ERROR_RATE:
+        return None
+    status = _rng.choice(ERROR_STATUSES)
+    headers = {"retry-after": "1"} if status == 429 else {}
+    message = f"Injected stub error ({status})"
+    if anthropic_format:
+        kind = "rate_limit_error" if status == 429 else "api_error"
+        body = {"type": "error", "error": {"type": kind, "message": message}}
+    else:
+        kind = "rate_limit_exceeded" if status == 429 else "server_error"
+        body = {"error": {"message": message, "type": kind, "code": kind}}
+    return JSONResponse(body, status_code=status, headers=headers)
+
+
+def text_of(content) -> str:
+    """Message content as plain text (string or list of content blocks)."""
+    if isinstance(content, str):
+        return content
+    return "\n\n".join(block.get("text", "") for block in content or [] if isinstance(block, dict))
+
+
+def sse(data: dict, event: Optional[str] = None) -> str:
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data)}\n\n"
+
+
+# ==========================================
+# OPENAI-COMPATIBLE ENDPOINTS
+# ==========================================
+
+@app.post("/v1/embeddings")
+async def embeddings(request: Request):
+    body = await request.json()
+    error = injected_error(anthropic_format=False)
+    await asyncio.sleep(EMBEDDING_LATENCY())
+    if error:
+        return error
+
+    inputs = body.get("input", [])
+    if isinstance(inputs, str):
+        inputs = [inputs]
+    vectors = encoder(int(body.get("dimensions") or EMBEDDING_DIMENSIONS)).embed(inputs)
+    tokens = sum(estimate_tokens(text) for text in inputs)
+    return {
+        "object": "list",
+        "data": [{"object": "embedding", "index": i, "embedding": v} for i, v in enumerate(vectors)],
+        "model": body.get("model", "stub-embedding"),
+        "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+    }
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    error = injected_error(anthropic_format=False)
+    await asyncio.sleep(CHAT_LATENCY())
+    if error:
+        return error
+
+    messages = body.get("messages", [])
+    system_text = "\n\n".join(text_of(m.get("content")) for m in messages if m.get("role") == "system")
+    prompt_text = "\n\n".join(text_of(m.get("content")) for m in messages)
+    prompt_tokens = estimate_tokens(prompt_text)
+    # OpenAI reports cache reads only; there is no separate write charge
+    cached_tokens, _ = cache_split(system_text, prompt_tokens)
+    tokens = answer_tokens(prompt_text)
+    usage = {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": len(tokens),
+        "total_tokens": prompt_tokens + len(tokens),
+        "prompt_tokens_details": {"cached_tokens": cached_tokens},
+    }
+    completion_id = f"chatcmpl-{uuid.uuid4().hex[:24]}"
+    model = body.get("model", "stub-chat")
+    created = int(time.time())
+
+    if not body.get("stream"):
+        await asyncio.sleep(len(tokens) / TOKENS_PER_SECOND)
+        return {
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": created,
+            "model": model,
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": "".join(tokens)},
+                "finish_reason": "stop",
+            }],
+            "usage": usage,
+        }
+
+    include_usage = (body.get("stream_options") or {}).get("include_usage", False)
+
+    async def events():
+        chunk = {"id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model}
+        yield sse({**chunk, "choices": [{"index": 0, "delta": {"role": "assistant", "content": ""}, "finish_reason": None}]})
+        for token in tokens:
+            await asyncio.sleep(1 / TOKENS_PER_SECOND)
+            yield sse({**chunk, "choices": [{"index": 0, "delta": {"content": token}, "finish_reason": None}]})
+        yield sse({**chunk, "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]})
+        if include_usage:
+            yield sse({**chunk, "choices": [], "usage": usage})
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+# ==========================================
+# ANTHROPIC-COMPATIBLE ENDPOINT
+# ==========================================
+
+@app.post("/v1/messages")
+async def messages(request: Request):
+    body = await request.json()
+    error = injected_error(anthropic_format=True)
+    await asyncio.sleep(CHAT_LATENCY())
+    if error:
+        return error
+
+    system_text = text_of(body.get("system"))
+    prompt_text = "\n\n".join([system_text] + [text_of(m.get("content")) for m in body.get("messages", [])])
+    prompt_tokens = estimate_tokens(prompt_text)
+    # Anthropic caches only up to an explicit cache_control breakpoint
+    system_blocks = body.get("system") if isinstance(body.get("system"), list) else []
+    if any(isinstance(b, dict) and b.get("cache_control") for b in system_blocks):
+        cached_tokens, cache_write_tokens = cache_split(system_text, prompt_tokens)
+    else:
+        cached_tokens, cache_write_tokens = 0, 0
+    tokens = answer_tokens(prompt_text)
+    usage = {
+        # input_tokens excludes cached reads and writes, as in the real API
+        "input_tokens": prompt_tokens - cached_tokens - cache_write_tokens,
+        "cache_read_input_tokens": cached_tokens,
+        "cache_creation_input_tokens": cache_write_tokens,
+        "output_tokens": len(tokens),
+    }
+    message = {
+        "id": f"msg_{uuid.uuid4().hex[:24]}",
+        "type": "message",
+        "role": "assistant",
+        "model": body.get("model", "stub-claude"),
+        "stop_reason": None,
+        "stop_sequence": None,
+    }
+
+    if not body.get("stream"):
+        await asyncio.sleep(len(tokens) / TOKENS_PER_SECOND)
+        return {
+            **message,
+            "content": [{"type": "text", "text": "".join(tokens)}],
+            "stop_reason": "end_turn",
+            "usage": usage,
+        }
+
+    async def events():
+        yield sse({"type": "message_start", "message": {**message, "content": [], "usage": {**usage, "output_tokens": 1}}},
+                  event="message_start")
+        yield sse({"type": "content_block_start", "index": 0, "content_block": {"type": "text", "text": ""}},
+                  event="content_block_start")
+        for token in tokens:
+            await asyncio.sleep(1 / TOKENS_PER_SECOND)
+            yield sse({"type": "content_block_delta", "index": 0, "delta": {"type": "text_delta", "text": token}},
+                      event="content_block_delta")
+        yield sse({"type": "content_block_stop", "index": 0}, event="content_block_stop")
+        yield sse({"type": "message_delta", "delta": {"stop_reason": "end_turn", "stop_sequence": None},
+                   "usage": {"output_tokens": len(tokens)}}, event="message_delta")
+        yield sse({"type": "message_stop"}, event="message_stop")
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Local OpenAI/Anthropic-compatible stub server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    args = parser.parse_args()
+    uvicorn.run(app, host=args.host, port=args.port)
@@ -0,0 +1,46 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from project.AI.src import vector_schema
+
+
+class Command(BaseCommand):
+    help = "Applies pending vector database schema migrations and reconciles the ANN index."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--list", action="store_true", help="Show applied and pending migrations only.")
+        parser.add_argument("--rebuild-index", action="store_true",
+                            help="Drop and rebuild the ANN index (after changing its build parameters).")
+        parser.add_argument("--skip-index", action="store_true", help="Do not create or change the ANN index.")
+        parser.add_argument("--partition", action="store_true",
+                            help="Convert documents to the partitioned layout (locks the table while rows are copied).")
+        parser.add_argument("--dedicate", action="append", default=[], metavar="CLIENT_ID",
+                            help="Move a tenant into its own partition (repeatable).")
+
+    def handle(self, *args, **options):
+        if options["list"]:
+            applied = set(vector_schema.applied_versions())
+            for version, name, _ in vector_schema.MIGRATIONS:
+                mark = "X" if version in applied else " "
+                self.stdout.write(f"[{mark}] {version:04d} {name}")
+            return
+
+        applied = vector_schema.migrate(log=self.stdout.write)
+        if applied:
+            self.stdout.write(self.style.SUCCESS(f"Applied vector schema migrations: {applied}"))
+        else:
+            self.stdout.write("Vector schema is up to date.")
+
+        if options["partition"] and vector_schema.partition_documents(log=self.stdout.write):
+            self.stdout.write(self.style.SUCCESS("documents is now partitioned."))
+        # Tenants listed in settings are (idempotently) dedicated on every run
+        for client_id in getattr(settings, 'VECTOR_DEDICATED_TENANTS', []):
+            vector_schema.dedicate_tenant(client_id, log=self.stdout.write)
+        for client_id in options["dedicate"]:
+            if not vector_schema.dedicate_tenant(client_id, log=self.stdout.write):
+                self.stdout.write(f"Skipped {client_id}: table not partitioned or tenant already dedicated.")
+
+        if not options["skip_index"]:
+            vector_schema.ensure_vector_index(rebuild=options["rebuild_index"], log=self.stdout.write)
+            self.stdout.write(self.style.SUCCESS("ANN index is in place."))
+        vector_schema.ensure_langchain_indexes(log=self.stdout.write)
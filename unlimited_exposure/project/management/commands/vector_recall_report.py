@@ -0,0 +1,88 @@
+import json
+import statistics
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from project.AI.src.db_pool import get_vector_db_pool
+from project.AI.src.vector_store import VectorStore
+
+
+class Command(BaseCommand):
+    help = (
+        "Compares ANN search (current VECTOR_INDEX_TYPE / VECTOR_STORAGE) with exact search: "
+        "recall@k, latency percentiles and ANN index size."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--samples", type=int, default=50, help="Number of sampled query chunks.")
+        parser.add_argument("-k", type=int, default=10, help="Results per query.")
+        parser.add_argument("--client", help="Only sample (and search) this client_id.")
+
+    def handle(self, *args, **options):
+        pool = get_vector_db_pool()
+        store = VectorStore()
+        k = options["k"]
+
+        with pool.connection() as conn:
+            with conn.cursor() as cur:
+                # Stored chunk embeddings serve as realistic in-distribution queries
+                cur.execute(
+                    "SELECT client_id, embedding::text FROM documents "
+                    + ("WHERE client_id = %s " if options["client"] else "")
+                    + "ORDER BY random() LIMIT %s;",
+                    ([options["client"]] if options["client"] else []) + [options["samples"]]
+                )
+                queries = [(client_id, json.loads(vector)) for client_id, vector in cur.fetchall()]
+                cur.execute("""
+                    SELECT coalesce(sum(pg_relation_size(c.oid)), 0) FROM pg_class c
+                    WHERE c.relkind = 'i' AND c.relname LIKE 'documents%_embedding_%_idx';
+                """)
+                index_bytes = cur.fetchone()[0]
+                # pg_partition_tree covers partitions too (and a plain table is its own tree)
+                cur.execute("SELECT sum(pg_total_relation_size(relid)) FROM pg_partition_tree('documents');")
+                total_bytes = cur.fetchone()[0]
+            conn.commit()
+
+        if not queries:
+            self.stdout.write("No documents to sample.")
+            return
+
+        recalls, ann_ms, exact_ms = [], [], []
+        for client_id, vector in queries:
+            started = time.perf_counter()
+            ann = store._search_by_vector(client_id, vector, k)
+            ann_ms.append((time.perf_counter() - started) * 1000)
+
+            started = time.perf_counter()
+            with pool.connection() as conn:
+                with conn.cursor() as cur:
+                    # Force the exact plan (sequential scan + sort) for the ground truth
+                    cur.execute("SELECT set_config('enable_indexscan', 'off', true), "
+                                "set_config('enable_bitmapscan', 'off', true);")
+                    cur.execute("""
+                        SELECT content FROM documents WHERE client_id = %s
+                        ORDER BY embedding <=> %s::vector LIMIT %s;
+                    """, (client_id, vector, k))
+                    exact = [row[0] for row in cur.fetchall()]
+                conn.commit()
+            exact_ms.append((time.perf_counter() - started) * 1000)
+
+            if exact:
+                found = {chunk.text for chunk in ann}
+                recalls.append(sum(1 for content in exact if content in found) / len(exact))
+
+        def pct(values, q):
+            ordered = sorted(values)
+            return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+        self.stdout.write(
+            f"Index: {getattr(settings, 'VECTOR_INDEX_TYPE', 'hnsw')} / storage: "
+            f"{getattr(settings, 'VECTOR_STORAGE', 'full')}  ({len(queries)} queries, k={k})"
+        )
+        self.stdout.write(f"recall@{k}: mean {statistics.mean(recalls):.4f}, min {min(recalls):.4f}")
+        self.stdout.write(f"ANN latency   p50 {pct(ann_ms, 0.5):.1f} ms  p95 {pct(ann_ms, 0.95):.1f} ms")
+        self.stdout.write(f"exact latency p50 {pct(exact_ms, 0.5):.1f} ms  p95 {pct(exact_ms, 0.95):.1f} ms")
+        self.stdout.write(f"ANN index size {index_bytes / 1024 ** 2:.1f} MiB "
+                          f"(documents total {total_bytes / 1024 ** 2:.1f} MiB)")
@@ -0,0 +1,18 @@
+# Generated by Django 6.0.2 on 2026-10-17 09:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('project', '0011_alter_agent_role'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='agent',
+            name='kb_version',
+            field=models.PositiveIntegerField(default=0, help_text="Incremented whenever the agent's knowledge base changes (invalidates cached answers)"),
+        ),
+    ]
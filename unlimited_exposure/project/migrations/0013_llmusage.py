@@ -0,0 +1,37 @@
+# Generated by Django 6.0.2 on 2026-10-17 10:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('project', '0012_agent_kb_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LLMUsage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(db_index=True)),
+                ('provider', models.CharField(max_length=32)),
+                ('model', models.CharField(max_length=100)),
+                ('call_type', models.CharField(choices=[('chat', 'Chat'), ('stream', 'Stream'), ('embedding', 'Embedding')], max_length=20)),
+                ('operation', models.CharField(blank=True, default='', help_text='Code path that made the call (e.g. rag_response, system_prompt, faq_generation)', max_length=50)),
+                ('agent_id', models.UUIDField(blank=True, db_index=True, null=True)),
+                ('organization_id', models.UUIDField(blank=True, db_index=True, null=True)),
+                ('prompt_tokens', models.PositiveIntegerField(default=0)),
+                ('cached_tokens', models.PositiveIntegerField(default=0)),
+                ('cache_write_tokens', models.PositiveIntegerField(default=0)),
+                ('completion_tokens', models.PositiveIntegerField(default=0)),
+                ('cost_usd', models.DecimalField(blank=True, decimal_places=6, max_digits=12, null=True)),
+                ('latency_ms', models.PositiveIntegerField(default=0)),
+                ('first_token_ms', models.PositiveIntegerField(blank=True, null=True)),
+                ('outcome', models.CharField(choices=[('ok', 'OK'), ('error', 'Error'), ('cancelled', 'Cancelled')], default='ok', max_length=20)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['organization_id', 'created_at'], name='project_llm_organiz_a4dd35_idx')],
+            },
+        ),
+    ]
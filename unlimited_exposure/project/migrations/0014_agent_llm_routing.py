@@ -0,0 +1,18 @@
+# Generated by Django 6.0.2 on 2026-10-17 10:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('project', '0013_llmusage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='agent',
+            name='llm_routing',
+            field=models.JSONField(blank=True, default=dict, help_text='Per-agent model routing, e.g. {"cascade": {"enabled": true, "fast_model": "gpt-4o-mini"}}'),
+        ),
+    ]
@@ -39,6 +39,17 @@ class Agent(models.Model):
         help_text="Custom system prompt for this agent"
     )
 
+    kb_version = models.PositiveIntegerField(
+        default=0,
+        help_text="Incremented whenever the agent's knowledge base changes (invalidates cached answers)"
+    )
+
+    llm_routing = models.JSONField(
+        default=dict,
+        blank=True,
+        help_text='Per-agent model routing, e.g. {"cascade": {"enabled": true, "fast_model": "gpt-4o-mini"}}'
+    )
+
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -248,3 +259,62 @@ class SystemSettings(models.Model):
 
     def __str__(self):
         return f"SystemSettings ({self.organization.name})"
+
+
+class LLMUsage(models.Model):
+    """One row per provider call (chat, stream or embedding batch), written in batches by the usage ledger."""
+
+    CHAT = "chat"
+    STREAM = "stream"
+    EMBEDDING = "embedding"
+
+    CALL_TYPES = [
+        (CHAT, "Chat"),
+        (STREAM, "Stream"),
+        (EMBEDDING, "Embedding"),
+    ]
+
+    OK = "ok"
+    ERROR = "error"
+    CANCELLED = "cancelled"
+
+    OUTCOMES = [
+        (OK, "OK"),
+        (ERROR, "Error"),
+        (CANCELLED, "Cancelled"),
+    ]
+
+    created_at = models.DateTimeField(db_index=True)
+
+    provider = models.CharField(max_length=32)
+    model = models.CharField(max_length=100)
+    call_type = models.CharField(max_length=20, choices=CALL_TYPES)
+    operation = models.CharField(
+        max_length=50,
+        blank=True,
+        default="",
+        help_text="Code path that made the call (e.g. rag_response, system_prompt, faq_generation)"
+    )
+
+    # Plain ids rather than foreign keys: rows are written asynchronously and must
+    # survive the agent / organization being deleted in the meantime
+    agent_id = models.UUIDField(null=True, blank=True, db_index=True)
+    organization_id = models.UUIDField(null=True, blank=True, db_index=True)
+
+    prompt_tokens = models.PositiveIntegerField(default=0)
+    cached_tokens = models.PositiveIntegerField(default=0)
+    cache_write_tokens = models.PositiveIntegerField(default=0)
+    completion_tokens = models.PositiveIntegerField(default=0)
+    cost_usd = models.DecimalField(max_digits=12, decimal_places=6, null=True, blank=True)
+
+    latency_ms = models.PositiveIntegerField(default=0)
+    first_token_ms = models.PositiveIntegerField(null=True, blank=True)
+    outcome = models.CharField(max_length=20, choices=OUTCOMES, default=OK)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["organization_id", "created_at"]),
+        ]
+
+    def __str__(self):
+        return f"{self.call_type} {self.provider}:{self.model} ({self.latency_ms} ms)"
@@ -3,6 +3,7 @@
 from rest_framework import serializers
 from .models import IngestedContent, Agent
 from .models import ChatSession, ChatMessage, SystemSettings
+from .AI.src.model_router import validate_llm_routing
 
 class AgentSerializer(serializers.ModelSerializer):
     class Meta:
@@ -13,6 +14,7 @@ class AgentSerializer(serializers.ModelSerializer):
             "role",
             "role",
             "system_prompt",
+            "llm_routing",
             "status",
             "created_at",
             "updated_at"
@@ -24,6 +26,12 @@ class AgentSerializer(serializers.ModelSerializer):
     def get_status(self, obj):
         return "active" if obj.is_active else "paused"
 
+    def validate_llm_routing(self, value):
+        try:
+            return validate_llm_routing(value)
+        except ValueError as e:
+            raise serializers.ValidationError(str(e))
+
 class IngestedContentSerializer(serializers.ModelSerializer):
     uploaded_by = serializers.StringRelatedField(read_only=True)
     organization = serializers.StringRelatedField(read_only=True)
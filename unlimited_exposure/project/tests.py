@@ -1,3 +1,522 @@
-from django.test import TestCase
+import asyncio
+import struct
+import threading
+import time
+import uuid
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from django.db import DataError, OperationalError
+from django.test import SimpleTestCase
+
+from .AI.src import failover
+from .AI.src.embedding_backends import HashingEmbeddingBackend
+from .AI.src.llm_gateway import PRIORITY_BULK, PRIORITY_INTERACTIVE, _Budget
+from .AI.src.model_router import ESCALATE_MARKER, CascadeRoute, ModelCascade
+from .AI.src.singleflight import AsyncSingleFlight, SingleFlight
+from .AI.src.usage_ledger import UsageLedger, _clean_row
+from .models import LLMUsage
+from .AI.src.vector_store import DOCUMENT_COLUMNS, _binary_copy_buffer, _copy_vector
+
+
+def _read_copy_rows(data: bytes) -> list:
+    """Minimal PGCOPY binary reader: rows of raw field bytes (None for NULL)."""
+    assert data[:11] == b"PGCOPY\n\xff\r\n\x00", "bad signature"
+    flags, extension_length = struct.unpack_from(">ii", data, 11)
+    assert (flags, extension_length) == (0, 0), "unexpected header flags / extension"
+    offset = 19
+    rows = []
+    while True:
+        (field_count,) = struct.unpack_from(">h", data, offset)
+        offset += 2
+        if field_count == -1:
+            assert offset == len(data), "data after the trailer"
+            return rows
+        fields = []
+        for _ in range(field_count):
+            (length,) = struct.unpack_from(">i", data, offset)
+            offset += 4
+            if length == -1:
+                fields.append(None)
+                continue
+            fields.append(data[offset:offset + length])
+            offset += length
+        rows.append(fields)
+
+
+class BinaryCopyBufferTests(SimpleTestCase):
+    def test_round_trip(self):
+        embedding = [0.5, -1.25, 3.0]
+        rows = [
+            ("client-1", "doc.pdf", "Pho – café", embedding, 42, "abc123"),
+            ("client-1", None, "no document", [0.0, 1.0, 2.0], None, None),
+        ]
+        decoded = _read_copy_rows(_binary_copy_buffer(rows).getvalue())
+
+        self.assertEqual(len(decoded), 2)
+        self.assertTrue(all(len(fields) == len(DOCUMENT_COLUMNS) for fields in decoded))
+
+        client_id, document_id, content, vector, token_count, chunk_hash = decoded[0]
+        self.assertEqual(client_id.decode(), "client-1")
+        self.assertEqual(document_id.decode(), "doc.pdf")
+        self.assertEqual(content.decode("utf-8"), "Pho – café")
+        self.assertEqual(struct.unpack(">i", token_count), (42,))
+        self.assertEqual(chunk_hash.decode(), "abc123")
+        self.assertEqual(vector, _copy_vector(embedding)[4:])
+
+        self.assertIsNone(decoded[1][1])
+        self.assertIsNone(decoded[1][4])
+        self.assertIsNone(decoded[1][5])
+
+    def test_vector_layout(self):
+        embedding = [0.5, -1.25, 3.0, 1e-3]
+        field = _copy_vector(embedding)
+
+        (length,) = struct.unpack_from(">i", field)
+        self.assertEqual(length, len(field) - 4)
+        dimensions, unused = struct.unpack_from(">hh", field, 4)
+        self.assertEqual((dimensions, unused), (len(embedding), 0))
+        values = np.frombuffer(field[8:], dtype=">f4")
+        np.testing.assert_array_equal(values, np.asarray(embedding, dtype=np.float32))
+
+
+def _budget(rpm: int, tpm: int) -> _Budget:
+    budget = _Budget(rpm=rpm, tpm=tpm)
+    budget.updated = 0.0  # tests pass their own clock
+    return budget
+
+
+class BudgetTests(SimpleTestCase):
+    def test_oversized_interactive_request_waits_for_a_full_bucket(self):
+        budget = _budget(rpm=100, tpm=1000)
+        self.assertEqual(budget.reserve(5000, PRIORITY_INTERACTIVE, 0.1, now=0.0), 0.0)
+        self.assertEqual(budget.tokens, 0)
+
+    def test_oversized_bulk_request_is_admitted_above_the_reserve(self):
+        # A bulk batch larger than (1 - reserve) * tpm used to wait forever
+        budget = _budget(rpm=100, tpm=100000)
+        self.assertEqual(budget.reserve(100000, PRIORITY_BULK, 0.1, now=0.0), 0.0)
+        self.assertAlmostEqual(budget.tokens, 10000)
+
+    def test_bulk_request_on_a_drained_bucket_waits_a_finite_time(self):
+        budget = _budget(rpm=100, tpm=100000)
+        budget.reserve(100000, PRIORITY_INTERACTIVE, 0.1, now=0.0)
+        wait = budget.reserve(100000, PRIORITY_BULK, 0.1, now=0.0)
+        self.assertGreater(wait, 0)
+        self.assertLessEqual(wait, 60.0)
+        self.assertEqual(budget.reserve(100000, PRIORITY_BULK, 0.1, now=wait), 0.0)
+
+    def test_bulk_request_on_a_one_rpm_budget(self):
+        budget = _budget(rpm=1, tpm=1000)
+        self.assertEqual(budget.reserve(10, PRIORITY_BULK, 0.1, now=0.0), 0.0)
+
+    def test_bulk_yields_to_waiting_interactive_requests(self):
+        budget = _budget(rpm=100, tpm=1000)
+        budget.waiting_interactive = 1
+        self.assertGreater(budget.reserve(10, PRIORITY_BULK, 0.1, now=0.0), 0)
+
+
+class HashingEmbeddingBackendTests(SimpleTestCase):
+    def setUp(self):
+        self.backend = HashingEmbeddingBackend(dimensions=256)
+
+    def test_deterministic(self):
+        text = "Beef pho with rare steak and brisket"
+        self.assertEqual(self.backend.embed([text]), self.backend.embed([text]))
+        self.assertEqual(HashingEmbeddingBackend(dimensions=256).embed([text]), self.backend.embed([text]))
+
+    def test_dimensions_and_normalization(self):
+        vectors = self.backend.embed(["Open daily from 11am to 10pm", "Spring rolls"])
+        self.assertEqual(len(vectors), 2)
+        for vector in vectors:
+            self.assertEqual(len(vector), 256)
+            self.assertAlmostEqual(float(np.linalg.norm(vector)), 1.0, places=5)
+
+    def test_empty_text_is_a_zero_vector(self):
+        (vector,) = self.backend.embed([""])
+        self.assertEqual(vector, [0.0] * 256)
+
+    def test_similar_texts_score_higher(self):
+        query, similar, unrelated = (np.asarray(v) for v in self.backend.embed([
+            "What are the opening hours of the Dufferin location?",
+            "Dufferin location opening hours: Monday to Sunday 11am-10pm",
+            "Vermicelli bowl with grilled lemongrass chicken",
+        ]))
+        self.assertGreater(float(query @ similar), float(query @ unrelated))
+
+
+class _StatusError(Exception):
+    def __init__(self, status_code: int):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+
+
+class _FakeChat:
+    """Stands in for UnifiedLLMClient: waits `delay`, then yields `tokens`, raising `error` after `fail_after` of them."""
+
+    def __init__(self, tokens=("ok",), error=None, fail_after=0, delay=0.0):
+        self.tokens = tokens
+        self.error = error
+        self.fail_after = fail_after
+        self.delay = delay
+        self.calls = 0
+
+    def complete(self, *args, **kwargs):
+        self.calls += 1
+        time.sleep(self.delay)
+        if self.error is not None:
+            raise self.error
+        return "".join(self.tokens)
+
+    def stream_text(self, *args, **kwargs):
+        self.calls += 1
+        return self._stream()
+
+    def _stream(self):
+        time.sleep(self.delay)
+        for i, token in enumerate(self.tokens):
+            if self.error is not None and i == self.fail_after:
+                raise self.error
+            yield token
+        if self.error is not None and self.fail_after >= len(self.tokens):
+            raise self.error
+
+
+class _AsyncFakeChat(_FakeChat):
+    async def complete(self, *args, **kwargs):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        if self.error is not None:
+            raise self.error
+        return "".join(self.tokens)
+
+    async def _stream(self):
+        await asyncio.sleep(self.delay)
+        for i, token in enumerate(self.tokens):
+            if self.error is not None and i == self.fail_after:
+                raise self.error
+            yield token
+        if self.error is not None and self.fail_after >= len(self.tokens):
+            raise self.error
+
+
+class CircuitBreakerTests(SimpleTestCase):
+    def test_opens_half_opens_and_closes(self):
+        breaker = failover.CircuitBreaker(failure_threshold=2, reset_timeout=0.05)
+        breaker.record_failure()
+        self.assertEqual(breaker.state, breaker.CLOSED)
+        breaker.record_failure()
+        self.assertEqual(breaker.state, breaker.OPEN)
+        self.assertFalse(breaker.allow())
+
+        time.sleep(0.06)
+        self.assertTrue(breaker.allow())
+        self.assertEqual(breaker.state, breaker.HALF_OPEN)
+        self.assertFalse(breaker.allow(), "only one probe while half-open")
+
+        breaker.record_success()
+        self.assertEqual(breaker.state, breaker.CLOSED)
+        self.assertEqual(breaker.failures, 0)
+        self.assertTrue(breaker.allow())
+
+    def test_failed_probe_reopens(self):
+        breaker = failover.CircuitBreaker(failure_threshold=1, reset_timeout=0.05)
+        breaker.record_failure()
+        time.sleep(0.06)
+        self.assertTrue(breaker.allow())
+        breaker.record_failure()
+        self.assertEqual(breaker.state, breaker.OPEN)
+        self.assertFalse(breaker.allow())
+
+
+class ResilientChatTests(SimpleTestCase):
+    def setUp(self):
+        failover._breakers.clear()
+        failover.failover_stats.clear()
+        self.addCleanup(failover._breakers.clear)
+        self.addCleanup(failover.failover_stats.clear)
+
+    def _chat(self, primary, fallback, client_factory="get_llm_client", **deadlines):
+        clients = {"primary": primary, "fallback": fallback}
+        patcher = mock.patch.object(failover, client_factory, side_effect=lambda provider=None: clients[provider])
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        policy = failover.FailoverPolicy(
+            [failover.ChatTarget("primary", "m"), failover.ChatTarget("fallback", "m")], **deadlines
+        )
+        chat_class = failover.AsyncResilientChat if client_factory == "get_async_llm_client" else failover.ResilientChat
+        return chat_class(policy)
+
+    def test_transient_error_fails_over_and_trips_the_breaker(self):
+        primary, fallback = _FakeChat(error=_StatusError(503)), _FakeChat(tokens=("backup",))
+        chat = self._chat(primary, fallback)
+
+        self.assertEqual(chat.generate_text("system", "question"), "backup")
+        self.assertEqual(failover.breaker_states()["primary:m"]["failures"], 1)
+        self.assertEqual(failover.failover_stats["failovers"], 1)
+        self.assertEqual(failover.failover_stats["fallback_wins"], 1)
+
+    def test_non_transient_error_does_not_trip_the_breaker_or_fail_over(self):
+        primary, fallback = _FakeChat(error=_StatusError(400)), _FakeChat(tokens=("backup",))
+        chat = self._chat(primary, fallback)
+
+        self.assertIsNone(chat.generate_text("system", "question"))
+        self.assertEqual(fallback.calls, 0)
+        self.assertEqual(failover.breaker_states()["primary:m"], {"state": "closed", "failures": 0})
+
+    def test_open_breaker_skips_the_target(self):
+        primary, fallback = _FakeChat(tokens=("primary",)), _FakeChat(tokens=("backup",))
+        chat = self._chat(primary, fallback)
+        breaker = failover.breaker_for("primary:m")
+        for _ in range(breaker.failure_threshold):
+            breaker.record_failure()
+
+        self.assertEqual(chat.generate_text("system", "question"), "backup")
+        self.assertEqual(primary.calls, 0)
+
+    def test_first_token_timeout_starts_a_hedge(self):
+        primary, fallback = _FakeChat(tokens=("slow",), delay=1.0), _FakeChat(tokens=("fast", "er"))
+        chat = self._chat(primary, fallback, first_token_timeout=0.05)
+
+        self.assertEqual(list(chat.stream_text("system", "question")), ["fast", "er"])
+        self.assertEqual(failover.failover_stats["hedges"], 1)
+        self.assertEqual(failover.failover_stats["fallback_wins"], 1)
+
+    def test_no_failover_once_the_stream_started(self):
+        primary = _FakeChat(tokens=("Hel", "lo"), error=_StatusError(503), fail_after=1)
+        fallback = _FakeChat(tokens=("backup",))
+        chat = self._chat(primary, fallback)
+
+        self.assertEqual(list(chat.stream_text("system", "question")), ["Hel"])
+        self.assertEqual(fallback.calls, 0)
+
+        received = []
+        with self.assertRaises(_StatusError):
+            for token in chat.stream_text("system", "question", raise_errors=True):
+                received.append(token)
+        self.assertEqual(received, ["Hel"])
+        self.assertEqual(fallback.calls, 0)
+
+    def test_stream_fails_over_before_the_first_token(self):
+        primary, fallback = _FakeChat(error=_StatusError(503)), _FakeChat(tokens=("backup",))
+        chat = self._chat(primary, fallback)
+
+        self.assertEqual(list(chat.stream_text("system", "question")), ["backup"])
+        self.assertEqual(failover.failover_stats["failovers"], 1)
+
+    def test_async_first_token_timeout_starts_a_hedge(self):
+        primary = _AsyncFakeChat(tokens=("slow",), delay=1.0)
+        fallback = _AsyncFakeChat(tokens=("fast", "er"))
+        chat = self._chat(primary, fallback, client_factory="get_async_llm_client", first_token_timeout=0.05)
+
+        async def collect():
+            return [token async for token in chat.stream_text("system", "question")]
+
+        self.assertEqual(asyncio.run(collect()), ["fast", "er"])
+        self.assertEqual(failover.failover_stats["hedges"], 1)
+
+    def test_async_non_transient_error_does_not_fail_over(self):
+        primary, fallback = _AsyncFakeChat(error=_StatusError(401)), _AsyncFakeChat(tokens=("backup",))
+        chat = self._chat(primary, fallback, client_factory="get_async_llm_client")
+
+        self.assertIsNone(asyncio.run(chat.generate_text("system", "question")))
+        self.assertEqual(fallback.calls, 0)
+        self.assertEqual(failover.breaker_states()["primary:m"]["failures"], 0)
+
+
+class _StubStreamClient:
+    """Streams canned tokens per model; records which models were called."""
+
+    def __init__(self, replies: dict):
+        self.replies = replies
+        self.models = []
+
+    def stream_text(self, system_prompt, user_prompt, temperature=0.5, model=None, raise_errors=False, **kwargs):
+        self.models.append(model)
+        return self._stream(self.replies[model])
+
+    @staticmethod
+    def _stream(reply):
+        for token in reply:
+            if isinstance(token, Exception):
+                raise token
+            yield token
+
+
+class ModelCascadeStreamTests(SimpleTestCase):
+    route = CascadeRoute(fast_model="fast", strong_model="strong")
+    scores = [0.9, 0.4]
+
+    def _stream(self, fast_tokens):
+        client = _StubStreamClient({"fast": fast_tokens, "strong": ["Strong ", "answer."]})
+        cascade = ModelCascade(client)
+        tokens = list(cascade.stream(self.route, "agent", ["system"], "question", self.scores))
+        return tokens, client.models, cascade.stats()["agent"]
+
+    def test_marker_in_one_chunk_escalates(self):
+        tokens, models, stats = self._stream([ESCALATE_MARKER])
+        self.assertEqual(tokens, ["Strong ", "answer."])
+        self.assertEqual(models, ["fast", "strong"])
+        self.assertEqual(stats["escalated_marker"], 1)
+
+    def test_marker_split_across_chunks_escalates(self):
+        tokens, models, stats = self._stream([" [[ESC", "ALA", "TE]]"])
+        self.assertEqual(tokens, ["Strong ", "answer."])
+        self.assertEqual(models, ["fast", "strong"])
+        self.assertEqual(stats["escalated_marker"], 1)
+
+    def test_answer_without_marker_streams_through(self):
+        tokens, models, stats = self._stream(["[", "Note] we open ", "at 11am."])
+        self.assertEqual("".join(tokens), "[Note] we open at 11am.")
+        self.assertEqual(models, ["fast"])
+        self.assertEqual(stats["fast"], 1)
+        self.assertEqual(stats["escalation_rate"], 0.0)
+
+    def test_fast_error_before_any_answer_escalates(self):
+        tokens, models, stats = self._stream(["[[ESC", _StatusError(503)])
+        self.assertEqual(tokens, ["Strong ", "answer."])
+        self.assertEqual(stats["escalated_error"], 1)
+
+    def test_low_retrieval_scores_skip_the_fast_model(self):
+        client = _StubStreamClient({"strong": ["Strong"]})
+        cascade = ModelCascade(client)
+        tokens = list(cascade.stream(self.route, "agent", ["system"], "question", [0.1]))
+        self.assertEqual(tokens, ["Strong"])
+        self.assertEqual(client.models, ["strong"])
+        self.assertEqual(cascade.stats()["agent"]["escalated_retrieval"], 1)
+
+
+class SingleFlightTests(SimpleTestCase):
+    def _run_concurrently(self, flight: SingleFlight, fn, callers: int = 5) -> list:
+        """Starts `callers` threads on one key while the first call is held in flight; returns their outcomes."""
+        started, release = threading.Event(), threading.Event()
+        outcomes = []
+
+        def held():
+            started.set()
+            release.wait(5)
+            return fn()
+
+        def call():
+            try:
+                outcomes.append(flight.do("key", held))
+            except Exception as e:
+                outcomes.append(e)
+
+        threads = [threading.Thread(target=call)]
+        threads[0].start()
+        started.wait(5)
+        threads += [threading.Thread(target=call) for _ in range(callers - 1)]
+        for thread in threads[1:]:
+            thread.start()
+        deadline = time.monotonic() + 5
+        while flight.coalesced < callers - 1 and time.monotonic() < deadline:
+            time.sleep(0.005)
+        release.set()
+        for thread in threads:
+            thread.join(5)
+        return outcomes
+
+    def test_concurrent_callers_share_one_call(self):
+        flight, calls = SingleFlight(), []
+
+        def fn():
+            calls.append(1)
+            return "vector"
+
+        self.assertEqual(self._run_concurrently(flight, fn), ["vector"] * 5)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(flight.coalesced, 4)
+
+    def test_exception_reaches_every_waiter_and_is_not_cached(self):
+        flight, calls = SingleFlight(), []
+        error = ValueError("provider down")
+
+        def fn():
+            calls.append(1)
+            raise error
+
+        outcomes = self._run_concurrently(flight, fn)
+        self.assertEqual(outcomes, [error] * 5)
+        self.assertEqual(len(calls), 1)
+
+        self.assertEqual(flight.do("key", lambda: "recovered"), "recovered")
+
+    def test_different_keys_do_not_share(self):
+        flight = SingleFlight()
+        self.assertEqual(flight.do("a", lambda: 1), 1)
+        self.assertEqual(flight.do("b", lambda: 2), 2)
+        self.assertEqual(flight.coalesced, 0)
+
+
+class AsyncSingleFlightTests(SimpleTestCase):
+    def test_concurrent_awaiters_share_one_call(self):
+        flight, calls = AsyncSingleFlight(), []
+
+        async def fn():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return "vector"
+
+        async def run():
+            return await asyncio.gather(*(flight.do("key", fn) for _ in range(5)))
+
+        self.assertEqual(asyncio.run(run()), ["vector"] * 5)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(flight.coalesced, 4)
+
+    def test_exception_reaches_every_awaiter_and_is_not_cached(self):
+        flight, calls = AsyncSingleFlight(), []
+
+        async def failing():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            raise ValueError("provider down")
+
+        async def recovered():
+            return "recovered"
+
+        async def run():
+            outcomes = await asyncio.gather(*(flight.do("key", failing) for _ in range(5)), return_exceptions=True)
+            return outcomes, await flight.do("key", recovered)
+
+        outcomes, after = asyncio.run(run())
+        self.assertEqual(len(calls), 1)
+        self.assertTrue(all(isinstance(outcome, ValueError) for outcome in outcomes))
+        self.assertEqual(after, "recovered")
+
+
+class UsageLedgerTests(SimpleTestCase):
+    def _row(self, **fields):
+        return _clean_row({"provider": "openai", "model": "gpt-4o", "call_type": "chat", **fields})
+
+    def test_attribution_is_coerced_to_the_column_types(self):
+        agent_id = uuid.uuid4()
+        row = self._row(agent_id=str(agent_id), organization_id="client_001", operation="x" * 80)
+        self.assertEqual(row["agent_id"], agent_id)
+        self.assertIsNone(row["organization_id"])
+        self.assertEqual(len(row["operation"]), 50)
+
+    def test_rejected_batch_is_retried_row_by_row(self):
+        ledger = UsageLedger()
+        rows = [self._row(latency_ms=1), self._row(latency_ms=-1), self._row(latency_ms=2)]
+
+        def create(**row):
+            if row["latency_ms"] < 0:
+                raise DataError("value out of range")
+
+        with mock.patch.object(LLMUsage.objects, "bulk_create", side_effect=DataError("value out of range")), \
+                mock.patch.object(LLMUsage.objects, "create", side_effect=create) as create_mock:
+            ledger._write(rows)
+
+        self.assertEqual(create_mock.call_count, 3)
+        self.assertEqual(ledger.dropped, 1)
+
+    def test_unreachable_database_drops_the_batch_without_retrying(self):
+        ledger = UsageLedger()
+        with mock.patch.object(LLMUsage.objects, "bulk_create", side_effect=OperationalError("down")), \
+                mock.patch.object(LLMUsage.objects, "create") as create_mock:
+            ledger._write([self._row(), self._row()])
+
+        create_mock.assert_not_called()
+        self.assertEqual(ledger.dropped, 2)
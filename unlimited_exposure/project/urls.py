@@ -1,7 +1,7 @@
 # apps/content/urls.py
 
 from django.urls import path
-from .views import ActiveSystemPromptAPIView, ChatMessagesAPIView, CreateSystemSettingsAPIView, GenerateSystemPromptAPIView, IngestContentAPIView, ChatListAPIView, PreviewSystemPromptAPIView, RAGChatAPIView, KnowledgeBaseAPIView, KnowledgeBaseDeleteAPIView
+from .views import ActiveSystemPromptAPIView, ChatMessagesAPIView, CreateSystemSettingsAPIView, GenerateSystemPromptAPIView, IngestContentAPIView, ChatListAPIView, PreviewSystemPromptAPIView, RAGChatAPIView, KnowledgeBaseAPIView, KnowledgeBaseDeleteAPIView, LLMUsageSummaryAPIView
 from .AI.agent_apis import AgentAPI, AgentDetailAPI
 
 urlpatterns = [
@@ -21,5 +21,6 @@ urlpatterns = [
     path("system-prompt/preview/", PreviewSystemPromptAPIView.as_view()),
     path("system-prompt/", GenerateSystemPromptAPIView.as_view()),
     path("system-prompt/active/", ActiveSystemPromptAPIView.as_view()),
+    path("usage/", LLMUsageSummaryAPIView.as_view(), name="llm-usage"),
 ]
 
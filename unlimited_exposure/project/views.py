@@ -6,10 +6,16 @@ from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.exceptions import NotFound, PermissionDenied
-from django.db.models import Q
+from datetime import timedelta
+from django.db.models import Avg, Count, Max, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
 import hashlib
+import json
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
 from .AI.src.document_processor import DocumentProcessor
-from .models import ChatSession, ChatMessage, SystemSettings, Organization, Agent
+from .models import ChatSession, ChatMessage, SystemSettings, Organization, Agent, LLMUsage
 from .serializers import ChatSessionDetailSerializer, ChatSessionSerializer, GenerateSystemPromptSerializer, PreviewSystemPromptSerializer, SystemSettingsCreateSerializer, SystemSettingsSerializer, ChatMessageSerializer
 from accounts.models import OrganizationMember
 from .models import IngestedContent
@@ -17,8 +23,10 @@ from .serializers import (
     IngestRequestSerializer,
     IngestedContentSerializer,
 )
-from .AI.src.api_services import generate_dynamic_system_prompt, ingest_data_to_vector_db, generate_rag_response, new_generate_response, extract_text_from_file, scrape_website_content, generate_dynamic_system_prompt
+from .AI.src.api_services import cascade, generate_dynamic_system_prompt, ingest_data_to_vector_db, generate_rag_response, new_generate_response, stream_generate_response, extract_text_from_file, scrape_website_content, generate_dynamic_system_prompt, mark_agent_knowledge_changed, mark_client_knowledge_changed
 from .AI.src.vector_store import VectorStore
+from .AI.src.usage_ledger import usage_context
+from .AI.src.answer_cache import answer_cache
 
 
 from rest_framework.views import APIView
@@ -30,6 +38,51 @@ from accounts.models import Profile
 from .models import IngestedContent
 
 
+def _ingested_content_record(agent, profile, organization, file_name, data_url, content_type):
+    """
+    Re-uploading a file name or URL to the same agent updates its existing record (the
+    new version is synced incrementally into the vectors) instead of adding another one.
+    The record keeps pointing at the previous upload until _record_ingest_result.
+    """
+    content = None
+    if agent:
+        content = IngestedContent.objects.filter(
+            agent=agent, file_name=file_name, content_type=content_type
+        ).order_by("-created_at").first()
+    if content is None:
+        return IngestedContent.objects.create(
+            agent=agent,
+            uploaded_by=profile,
+            organization=organization,
+            file_name=file_name,
+            data_url=data_url,
+            content_type=content_type,
+            ingestion_status="processing"
+        )
+
+    content.ingestion_status = "processing"
+    content.save()
+    return content
+
+
+def _record_ingest_result(content, data_url, result):
+    """
+    Saves an ingest outcome on its record. A new file version replaces the previous
+    upload only once it synced; after a failure the vectors still match the previous
+    upload, so that one is kept and the new one is discarded.
+    """
+    succeeded = result.get("status", "error") == "success"
+    if content.content_type == IngestedContent.FILE and content.data_url != data_url:
+        superseded = content.data_url if succeeded else data_url
+        if superseded:
+            default_storage.delete(superseded)
+    if succeeded:
+        content.data_url = data_url
+    content.chunk_count = result.get("chunks", 0)
+    content.ingestion_status = "completed" if succeeded else result.get("status", "error")
+    content.save()
+
+
 class IngestContentAPIView(APIView):
     permission_classes = [IsAuthenticated]
 
@@ -82,15 +135,7 @@ class IngestContentAPIView(APIView):
         for file in files:
             path = default_storage.save(f"uploaded_files/{organization.name}/{file.name}", file)
 
-            content = IngestedContent.objects.create(
-                agent=agent,
-                uploaded_by=profile,
-                organization=organization,
-                file_name=file.name,
-                data_url=path,
-                content_type=IngestedContent.FILE,
-                ingestion_status="processing"
-            )
+            content = _ingested_content_record(agent, profile, organization, file.name, path, IngestedContent.FILE)
 
             # Use agent-based ingestion if agent is provided
             if agent:
@@ -100,7 +145,7 @@ class IngestContentAPIView(APIView):
                 
                 # Use process_pdf for PDFs, extract_text_from_file + process_text for others
                 if ext == '.pdf':
-                    result = processor.process_pdf(full_path)
+                    result = processor.process_pdf(full_path, source=file.name)
                 else:
                     extracted_text = extract_text_from_file(full_path)
                     if extracted_text.strip():
@@ -115,23 +160,13 @@ class IngestContentAPIView(APIView):
             #         is_url=False
             #     )
 
-                content.chunk_count = result.get("chunks", 0)
-                content.ingestion_status = "completed" if result.get("status", "error") == "success" else result.get("status", "error")
-                content.save()
+                _record_ingest_result(content, path, result)
 
                 created.append(content)
 
         # ---------- URL INGESTION ----------
         for url in urls:
-            content = IngestedContent.objects.create(
-                agent=agent,
-                uploaded_by=profile,
-                organization=organization,
-                file_name=url,
-                data_url=url,
-                content_type=IngestedContent.URL,
-                ingestion_status="processing"
-            )
+            content = _ingested_content_record(agent, profile, organization, url, url, IngestedContent.URL)
 
             # Use agent-based ingestion if agent is provided
             if agent:
@@ -150,12 +185,13 @@ class IngestContentAPIView(APIView):
             #         is_url=True
             #     )
 
-                content.chunk_count = result.get("chunks", 0)
-                content.ingestion_status = "completed" if result.get("status", "error") == "success" else result.get("status", "error")
-                content.save()
+                _record_ingest_result(content, url, result)
 
                 created.append(content)
 
+        if agent and created:
+            mark_agent_knowledge_changed(agent.id)
+
         return Response(
             IngestedContentSerializer(created, many=True).data,
             status=status.HTTP_201_CREATED
@@ -256,6 +292,17 @@ class RAGChatAPIView(APIView):
         #     chat_history=history
         # )
 
+        if _wants_stream(request):
+            # Server-sent events: tokens are pushed as they arrive, the assistant
+            # message is stored once the stream is complete.
+            response = StreamingHttpResponse(
+                self._stream_answer(chat, agent_id, query, system_prompt, history),
+                content_type="text/event-stream"
+            )
+            response["Cache-Control"] = "no-cache"
+            response["X-Accel-Buffering"] = "no"
+            return response
+
         answer = new_generate_response(
             agent_id=agent_id,
             user_query=query,
@@ -277,6 +324,42 @@ class RAGChatAPIView(APIView):
             status=status.HTTP_200_OK
         )
 
+    def _stream_answer(self, chat, agent_id, query, system_prompt, history):
+        parts = []
+        try:
+            for token in stream_generate_response(
+                agent_id=agent_id,
+                user_query=query,
+                system_prompt=system_prompt,
+                chat_history=history
+            ):
+                parts.append(token)
+                yield _sse("token", {"token": token})
+        finally:
+            # Persist whatever was generated, even if the client disconnected mid-stream
+            answer = "".join(parts)
+            if answer:
+                ChatMessage.objects.create(
+                    chat=chat,
+                    role=ChatMessage.ASSISTANT,
+                    content=answer
+                )
+            chat.save(update_fields=["updated_at"])
+
+        yield _sse("done", ChatSessionDetailSerializer(chat).data)
+
+
+def _wants_stream(request) -> bool:
+    """Streaming is requested with `stream=true` (body or query) or an `Accept: text/event-stream` header."""
+    flag = request.data.get("stream", request.query_params.get("stream"))
+    if isinstance(flag, str):
+        flag = flag.lower() in ("1", "true", "yes")
+    return bool(flag) or "text/event-stream" in request.headers.get("Accept", "")
+
+
+def _sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, cls=DjangoJSONEncoder)}\n\n"
+
 
 
 
@@ -382,9 +465,14 @@ class KnowledgeBaseDeleteAPIView(APIView):
                 # Use DocumentProcessor to delete from agent's vector database
                 processor = DocumentProcessor(agent_id=str(ingested_content.agent.id))
                 result = processor.delete_document(document_source)
+                # Chunks are stored under the uploaded file name; older PDFs used the storage name
+                if (ingested_content.content_type == IngestedContent.FILE
+                        and ingested_content.file_name != document_source and result.get("status") == "success"):
+                    result = processor.delete_document(ingested_content.file_name)
                 
                 if result.get("status") == "success":
                     print(f"✅ Deleted vectors for document '{document_source}' from agent {ingested_content.agent.id}")
+                    mark_agent_knowledge_changed(ingested_content.agent.id)
                 else:
                     print(f"⚠️ Warning: Failed to delete vectors: {result.get('error')}")
                     
@@ -429,6 +517,7 @@ class KnowledgeBaseDeleteAPIView(APIView):
                         print(f"⚠️ Warning: No chunks found to delete. client_id={client_id}, document_id={document_id}")
                 else:
                     print(f"✅ Successfully deleted {deleted_chunks} embedding chunks")
+                mark_client_knowledge_changed(client_id)
                     
             except Exception as e:
                 print(f"❌ Error deleting from vector database: {e}")
@@ -612,10 +701,11 @@ class PreviewSystemPromptAPIView(APIView):
                 if p.strip()
             ]
 
-        prompt = generate_dynamic_system_prompt(
-            client_id=str(profile.id),
-            personas=personas if personas else None
-        )
+        with usage_context(organization_id=profile.organization_id):
+            prompt = generate_dynamic_system_prompt(
+                client_id=str(profile.id),
+                personas=personas if personas else None
+            )
 
         return Response(
             {
@@ -790,3 +880,96 @@ class ActiveSystemPromptAPIView(APIView):
             })
             
         return Response(response, status=status.HTTP_200_OK)
+
+
+class LLMUsageSummaryAPIView(APIView):
+    """
+    Aggregated LLM usage (calls, tokens, cost, latency) for an organization.
+
+    Query params:
+        org_id: Organization to report on (owner/admin only).
+        days: Look-back window in days (default 30).
+        group_by: Comma-separated subset of day, agent, call_type, operation, model, provider
+                  (default "day,agent,call_type").
+    """
+    permission_classes = [IsAuthenticated]
+
+    GROUP_FIELDS = {
+        "day": "day",
+        "agent": "agent_id",
+        "call_type": "call_type",
+        "operation": "operation",
+        "model": "model",
+        "provider": "provider",
+    }
+
+    def get(self, request):
+        try:
+            profile = request.user.profile
+        except Profile.DoesNotExist:
+            return Response(
+                {"error": "Profile not found. Please complete account setup."},
+                status=status.HTTP_403_FORBIDDEN
+            )
+
+        org_id = request.query_params.get("org_id")
+        if not org_id:
+            return Response({"error": "org_id is required"}, status=status.HTTP_400_BAD_REQUEST)
+
+        member = OrganizationMember.objects.filter(organization=org_id, user=profile, role__in=[OrganizationMember.OWNER, OrganizationMember.ADMIN]).first()
+        if not member:
+            return Response({"error": "You do not have permission to perform this action"}, status=status.HTTP_403_FORBIDDEN)
+
+        try:
+            days = max(1, int(request.query_params.get("days", 30)))
+        except ValueError:
+            return Response({"error": "days must be an integer"}, status=status.HTTP_400_BAD_REQUEST)
+
+        group_by = [g.strip() for g in request.query_params.get("group_by", "day,agent,call_type").split(",") if g.strip()]
+        unknown = [g for g in group_by if g not in self.GROUP_FIELDS]
+        if unknown:
+            return Response(
+                {"error": f"Unsupported group_by: {', '.join(unknown)}", "allowed": list(self.GROUP_FIELDS)},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        since = timezone.now() - timedelta(days=days)
+        # Ingestion rows may only carry the agent id, so include the org's agents too
+        usage = LLMUsage.objects.filter(
+            Q(organization_id=org_id) | Q(agent_id__in=Agent.objects.filter(organization_id=org_id).values("id")),
+            created_at__gte=since,
+        )
+        if "day" in group_by:
+            usage = usage.annotate(day=TruncDate("created_at"))
+
+        aggregates = {
+            "calls": Count("id"),
+            "errors": Count("id", filter=Q(outcome=LLMUsage.ERROR)),
+            "total_prompt_tokens": Sum("prompt_tokens"),
+            "total_cached_tokens": Sum("cached_tokens"),
+            "total_completion_tokens": Sum("completion_tokens"),
+            "total_cost_usd": Sum("cost_usd"),
+            "avg_latency_ms": Avg("latency_ms"),
+            "max_latency_ms": Max("latency_ms"),
+            "avg_first_token_ms": Avg("first_token_ms"),
+        }
+        fields = [self.GROUP_FIELDS[g] for g in group_by]
+        rows = usage.values(*fields).annotate(**aggregates).order_by(*fields)
+
+        # Answer cache counters are per process and keyed by agent id
+        agent_ids = {str(agent_id) for agent_id in Agent.objects.filter(organization_id=org_id).values_list("id", flat=True)}
+        cache_stats = {scope: counts for scope, counts in answer_cache.stats().items() if scope in agent_ids}
+        cascade_stats = {scope: counts for scope, counts in cascade.stats().items() if scope in agent_ids}
+
+        return Response(
+            {
+                "org_id": org_id,
+                "since": since,
+                "group_by": group_by,
+                "totals": usage.aggregate(**aggregates),
+                "rows": list(rows),
+                "answer_cache": cache_stats,
+                "cascade": cascade_stats,
+            },
+            status=status.HTTP_200_OK
+        )
@@ -15,6 +15,7 @@ from pathlib import Path
 
 from datetime import timedelta
 from pathlib import Path
+import json
 import os
 from dotenv import load_dotenv # Make sure to pip install python-dotenv
 
@@ -208,6 +209,69 @@ FIRECRAWL_API_KEY = os.getenv("FIRECRAWL_API_KEY", "")
 CHAT_MODEL = os.getenv("CHAT_MODEL", "gpt-4o")
 EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "text-embedding-3-small")
 
+# Model cascade: answer with CHAT_FAST_MODEL first, escalate to CHAT_MODEL on low confidence.
+# Off by default; agents can opt in (or override thresholds) via Agent.llm_routing["cascade"].
+CHAT_FAST_MODEL = os.getenv("CHAT_FAST_MODEL", "gpt-4o-mini" if API_PROVIDER == "openai" else "")
+LLM_CASCADE_ENABLED = os.getenv("LLM_CASCADE_ENABLED", "false").lower() == "true"
+LLM_CASCADE_MIN_TOP_SCORE = float(os.getenv("LLM_CASCADE_MIN_TOP_SCORE", 0.3))
+LLM_CASCADE_MIN_SCORE_SPREAD = float(os.getenv("LLM_CASCADE_MIN_SCORE_SPREAD", 0.0))
+LLM_CASCADE_MIN_ANSWER_CHARS = int(os.getenv("LLM_CASCADE_MIN_ANSWER_CHARS", 15))
+
+# Provider failover & hedging. Keys / base URLs for non-primary providers, e.g.
+# LLM_PROVIDER_API_KEYS='{"claude": "sk-ant-..."}' and
+# LLM_FALLBACK_PROVIDERS='[{"provider": "claude", "model": "claude-3-5-haiku-latest"}]'.
+# Agents can override the hedge settings via Agent.llm_routing["hedge"].
+LLM_PROVIDER_API_KEYS = json.loads(os.getenv("LLM_PROVIDER_API_KEYS", "{}"))
+LLM_PROVIDER_BASE_URLS = json.loads(os.getenv("LLM_PROVIDER_BASE_URLS", "{}"))
+LLM_FALLBACK_PROVIDERS = json.loads(os.getenv("LLM_FALLBACK_PROVIDERS", "[]"))
+LLM_HEDGE_ENABLED = os.getenv("LLM_HEDGE_ENABLED", "false").lower() == "true"
+LLM_HEDGE_AFTER_MS = int(os.getenv("LLM_HEDGE_AFTER_MS", 4000))
+LLM_HEDGE_FIRST_TOKEN_MS = int(os.getenv("LLM_HEDGE_FIRST_TOKEN_MS", 2500))
+LLM_HEDGE_WORKERS = int(os.getenv("LLM_HEDGE_WORKERS", 32))
+LLM_BREAKER_FAILURE_THRESHOLD = int(os.getenv("LLM_BREAKER_FAILURE_THRESHOLD", 5))
+LLM_BREAKER_RESET_SECONDS = float(os.getenv("LLM_BREAKER_RESET_SECONDS", 30))
+# Provider -> models that tenants may pick in Agent.llm_routing (cascade models, hedge fallbacks).
+# Defaults to the platform's own chat models and configured fallbacks.
+_default_routing_models = {API_PROVIDER: [m for m in (CHAT_MODEL, CHAT_FAST_MODEL) if m]}
+for _fallback in LLM_FALLBACK_PROVIDERS:
+    _default_routing_models.setdefault(_fallback["provider"], []).append(_fallback["model"])
+LLM_ROUTING_ALLOWED_MODELS = json.loads(os.getenv("LLM_ROUTING_ALLOWED_MODELS", "null")) or _default_routing_models
+
+# Embedding backend: "provider" (API_PROVIDER embeddings endpoint), "hashing"
+# (deterministic offline encoder, for tests) or "onnx" (local CPU sentence encoder)
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "provider").lower()
+EMBEDDING_DIMENSIONS = int(os.getenv("EMBEDDING_DIMENSIONS", 1536))  # must match the vector column
+EMBEDDING_ONNX_MODEL_PATH = os.getenv("EMBEDDING_ONNX_MODEL_PATH", "")
+EMBEDDING_ONNX_TOKENIZER_PATH = os.getenv("EMBEDDING_ONNX_TOKENIZER_PATH", "")
+LOCAL_EMBEDDING_BATCH_SIZE = int(os.getenv("LOCAL_EMBEDDING_BATCH_SIZE", 32))
+LOCAL_EMBEDDING_THREADS = int(os.getenv("LOCAL_EMBEDDING_THREADS", 4))
+
+# Embedding batching (inputs / estimated tokens per request, parallel requests)
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", 256))
+EMBEDDING_BATCH_TOKENS = int(os.getenv("EMBEDDING_BATCH_TOKENS", 100000))
+EMBEDDING_CONCURRENCY = int(os.getenv("EMBEDDING_CONCURRENCY", 4))
+
+# Shared provider HTTP pool (keep-alive connections reused by every request)
+LLM_HTTP_MAX_CONNECTIONS = int(os.getenv("LLM_HTTP_MAX_CONNECTIONS", 100))
+LLM_HTTP_MAX_KEEPALIVE = int(os.getenv("LLM_HTTP_MAX_KEEPALIVE", 20))
+LLM_HTTP_KEEPALIVE_EXPIRY = float(os.getenv("LLM_HTTP_KEEPALIVE_EXPIRY", 60))
+LLM_HTTP_TIMEOUT = float(os.getenv("LLM_HTTP_TIMEOUT", 60))
+
+# Provider rate limiting & retries.
+# LLM_RATE_LIMITS: JSON map of "provider:model" (or "provider") -> {"rpm": ..., "tpm": ...}
+LLM_RATE_LIMITS = json.loads(os.getenv("LLM_RATE_LIMITS", "{}"))
+LLM_DEFAULT_RPM = int(os.getenv("LLM_DEFAULT_RPM", 3000))
+LLM_DEFAULT_TPM = int(os.getenv("LLM_DEFAULT_TPM", 1000000))
+LLM_INTERACTIVE_RESERVE = float(os.getenv("LLM_INTERACTIVE_RESERVE", 0.1))  # quota share bulk work leaves for chat
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", 5))
+LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", 0.5))
+LLM_BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", 30))
+
+# Persistent embedding cache (SQLite file keyed by model + normalized text)
+EMBEDDING_CACHE_ENABLED = os.getenv("EMBEDDING_CACHE_ENABLED", "true").lower() == "true"
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", str(BASE_DIR / "data" / "embedding_cache.sqlite3"))
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", 200000))
+
 # Vector Database (Postgres) - Separate from Django's default DB
 POSTGRES_HOST = os.getenv("POSTGRES_HOST", "postgres")
 POSTGRES_PORT = os.getenv("POSTGRES_PORT")
@@ -215,6 +279,71 @@ POSTGRES_DB_NAME = os.getenv("POSTGRES_DB", "vector_db")
 POSTGRES_USER = os.getenv("POSTGRES_USER", "postgres")
 POSTGRES_PASSWORD = os.getenv("POSTGRES_PASSWORD", "postgres")
 
+# Vector DB connection pool (per process): max connections, seconds to wait for one,
+# idle seconds after which a connection is re-validated before reuse
+VECTOR_DB_POOL_SIZE = int(os.getenv("VECTOR_DB_POOL_SIZE", 10))
+VECTOR_DB_POOL_TIMEOUT = float(os.getenv("VECTOR_DB_POOL_TIMEOUT", 5))
+VECTOR_DB_POOL_VALIDATE_AFTER = float(os.getenv("VECTOR_DB_POOL_VALIDATE_AFTER", 30))
+VECTOR_DB_CONNECT_TIMEOUT = int(os.getenv("VECTOR_DB_CONNECT_TIMEOUT", 5))
+
+# ANN index on documents.embedding: "hnsw" (default), "ivfflat" or "none" (exact scans).
+# Build parameters (m, ef_construction, lists) apply when the index is (re)built.
+VECTOR_INDEX_TYPE = os.getenv("VECTOR_INDEX_TYPE", "hnsw").lower()
+VECTOR_HNSW_M = int(os.getenv("VECTOR_HNSW_M", 16))
+VECTOR_HNSW_EF_CONSTRUCTION = int(os.getenv("VECTOR_HNSW_EF_CONSTRUCTION", 64))
+VECTOR_HNSW_EF_SEARCH = int(os.getenv("VECTOR_HNSW_EF_SEARCH", 100))
+VECTOR_IVFFLAT_LISTS = int(os.getenv("VECTOR_IVFFLAT_LISTS", 100))
+VECTOR_IVFFLAT_PROBES = int(os.getenv("VECTOR_IVFFLAT_PROBES", 10))
+# pgvector >= 0.8 iterative index scans for filtered (per-client) search: "relaxed_order", "strict_order" or "off"
+VECTOR_ITERATIVE_SCAN = os.getenv("VECTOR_ITERATIVE_SCAN", "relaxed_order").lower()
+VECTOR_MAX_SCAN_TUPLES = int(os.getenv("VECTOR_MAX_SCAN_TUPLES", 20000))
+# What the ANN index stores: "full" (float32), "halfvec" (float16, 2x smaller) or "binary"
+# (1 bit/dim, 32x smaller). Quantized modes fetch limit x VECTOR_RERANK_FACTOR candidates
+# and re-rank them with the full-precision vectors kept in the table. Needs pgvector >= 0.7.
+VECTOR_STORAGE = os.getenv("VECTOR_STORAGE", "full").lower()
+VECTOR_RERANK_FACTOR = int(os.getenv("VECTOR_RERANK_FACTOR", 10 if VECTOR_STORAGE == "binary" else 4))
+# add_documents switches to binary COPY (committed per batch) from this many chunks on
+VECTOR_BULK_LOAD_THRESHOLD = int(os.getenv("VECTOR_BULK_LOAD_THRESHOLD", 1000))
+VECTOR_COPY_BATCH_SIZE = int(os.getenv("VECTOR_COPY_BATCH_SIZE", 2000))
+# "hybrid" fuses cosine and full-text (tsvector) results with reciprocal-rank fusion; "vector" is cosine only
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "hybrid").lower()
+RETRIEVAL_RRF_K = int(os.getenv("RETRIEVAL_RRF_K", 60))
+RETRIEVAL_CANDIDATE_FACTOR = int(os.getenv("RETRIEVAL_CANDIDATE_FACTOR", 4))
+# Partitioned documents table (applied with `manage.py migrate_vector_db --partition`):
+# hash partitions for the shared tenants, dedicated LIST partitions for the client_ids listed here
+VECTOR_HASH_PARTITIONS = int(os.getenv("VECTOR_HASH_PARTITIONS", 16))
+VECTOR_DEDICATED_TENANTS = json.loads(os.getenv("VECTOR_DEDICATED_TENANTS", "[]"))
+
+# Semantic answer cache (same agent + system prompt + KB version, similar query)
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "true").lower() == "true"
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", 0.95))
+ANSWER_CACHE_TTL = int(os.getenv("ANSWER_CACHE_TTL", 900))
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", 5000))
+
+# Provider prompt caching: mark the stable system prefix with Anthropic cache_control
+PROMPT_CACHE_ENABLED = os.getenv("PROMPT_CACHE_ENABLED", "true").lower() == "true"
+
+# Usage ledger: one LLMUsage row per provider call, written in background batches
+LLM_USAGE_LEDGER_ENABLED = os.getenv("LLM_USAGE_LEDGER_ENABLED", "true").lower() == "true"
+LLM_USAGE_BATCH_SIZE = int(os.getenv("LLM_USAGE_BATCH_SIZE", 200))
+LLM_USAGE_FLUSH_INTERVAL = float(os.getenv("LLM_USAGE_FLUSH_INTERVAL", 2))
+# USD per 1M tokens; dated model snapshots match by prefix. Extend/override with LLM_PRICES (JSON).
+LLM_PRICES = {
+    "gpt-4o": {"input": 2.50, "cached_input": 1.25, "output": 10.00},
+    "gpt-4o-mini": {"input": 0.15, "cached_input": 0.075, "output": 0.60},
+    "text-embedding-3-small": {"input": 0.02},
+    "text-embedding-3-large": {"input": 0.13},
+    "claude-3-5-sonnet": {"input": 3.00, "cached_input": 0.30, "cache_write": 3.75, "output": 15.00},
+    "claude-3-5-haiku": {"input": 0.80, "cached_input": 0.08, "cache_write": 1.00, "output": 4.00},
+    **json.loads(os.getenv("LLM_PRICES", "{}")),
+}
+
+# Retrieved context is packed by tokens, per chat model (JSON map model -> tokens)
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", 6000))
+CONTEXT_TOKEN_BUDGETS = json.loads(os.getenv("CONTEXT_TOKEN_BUDGETS", "{}"))
+# Retrieved chunks below this cosine similarity are left out of the context (0 keeps all)
+CONTEXT_MIN_SCORE = float(os.getenv("CONTEXT_MIN_SCORE", 0.0))
+
 # AI Logic Thresholds
 FAQ_SIMILARITY_THRESHOLD = 0.8
 MAX_HISTORY_TURNS = 4